@@ -0,0 +1,301 @@
+import argparse
+from contextlib import nullcontext
+from dataclasses import replace
+from .constants import DEFAULT_HTTP_POOL_SIZE
+from .datamodel import RuntimeConfig, TestResult
+from .downloads import download
+from .suites import (
+    EXECUTORS,
+    MATRIX_SUITES,
+    TEST_SUITES,
+    case_id,
+    describe_test_runner,
+    iter_selected_cases,
+    run_tests,
+    select_test_cases,
+)
+from .throttling import DEFAULT_THROTTLED_TIMEOUT, UploadThrottle
+
+
+def _parse_shard(value: str) -> tuple[int, int]:
+    """Parse i/N (1-based) into a 0-based shard index and the shard count"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected i/N, got {value!r}") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Shard {value} is not between 1/N and N/N")
+    return index - 1, count
+
+
+def _raise_open_file_limit() -> None:
+    # Thousands of concurrent slow uploads need a socket each, beyond the usual soft limit of 1024
+    try:
+        import resource
+    except ImportError:
+        return
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit != hard_limit:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m proxy_testing",
+        description="Run corner case tests against the proxy",
+    )
+    parser.add_argument("--endpoint", default="https://localhost:8443")
+    parser.add_argument("--access-key", default="testidentity")
+    parser.add_argument("--secret-key", default="testsecret")
+    parser.add_argument(
+        "--case",
+        dest="cases",
+        action="append",
+        metavar="PATTERN",
+        help="Only run cases whose id (suite/index) or suite matches this glob; repeatable",
+    )
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help="Run the generated upload matrix instead of the hand-picked suites",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_parse_shard,
+        default=None,
+        metavar="i/N",
+        help="Only run the i-th of N disjoint, evenly sized slices of the selected cases",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="List the selected case ids and exit without running anything",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of test cases to run concurrently (default: sequential)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=sorted([*EXECUTORS, "asyncio"]),
+        default="thread",
+        help="Run concurrent test cases in threads, processes or a single event loop",
+    )
+    parser.add_argument(
+        "--http-pool-size",
+        type=int,
+        default=None,
+        help=(
+            "Connections kept alive per host for uploads sent with requests "
+            f"(default: --workers, at least {DEFAULT_HTTP_POOL_SIZE})"
+        ),
+    )
+    parser.add_argument(
+        "--http-retries",
+        type=int,
+        default=0,
+        help="Retry failed requests sent with requests; off by default so results stay honest",
+    )
+    parser.add_argument(
+        "--s3-max-pool-connections",
+        type=int,
+        default=None,
+        help=(
+            "Connections kept by the boto3 client used for bucket setup and verification "
+            f"(default: --workers, at least {DEFAULT_HTTP_POOL_SIZE})"
+        ),
+    )
+    parser.add_argument(
+        "--load-duration",
+        type=float,
+        default=None,
+        help="Replay the test cases as load for this many seconds instead of running them once",
+    )
+    parser.add_argument(
+        "--load-rate",
+        type=float,
+        default=None,
+        help="Target request rate for load mode (default: as fast as --workers allows)",
+    )
+    parser.add_argument(
+        "--load-verify",
+        action="store_true",
+        help="Verify uploaded content in load mode (included in the measured latency)",
+    )
+    parser.add_argument(
+        "--local-server",
+        nargs="?",
+        choices=("http", "https"),
+        const="http",
+        default=None,
+        help="Run against an in-process S3 stand-in instead of --endpoint",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Add per-phase timings and bytes on the wire to the results table",
+    )
+    parser.add_argument(
+        "--results",
+        metavar="PATH",
+        default=None,
+        help=(
+            "Also write every result, with its timings, to this file as each case finishes: "
+            "CSV if it ends in .csv, JSONL otherwise. Compare runs with "
+            "python -m proxy_testing.compare"
+        ),
+    )
+    throttling = parser.add_argument_group(
+        "slow clients",
+        "Upload like a slow client to see how the proxy copes with many slow connections. Uploads "
+        "then go through the raw HTTP client; use --executor asyncio with many --workers to hold "
+        "thousands of them open at once",
+    )
+    throttling.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=None,
+        metavar="BYTES_PER_SEC",
+        help="Average upload rate of each request",
+    )
+    throttling.add_argument(
+        "--throttle-pause",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Pause after every write",
+    )
+    throttling.add_argument(
+        "--throttle-write-size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help=(
+            "Write at most this many bytes at a time; small sizes split chunk headers and "
+            "signatures across TCP segments"
+        ),
+    )
+    throttling.add_argument(
+        "--throttle-timeout",
+        type=float,
+        default=DEFAULT_THROTTLED_TIMEOUT,
+        metavar="SECONDS",
+        help="Socket timeout of throttled requests (default: %(default)s)",
+    )
+    return parser.parse_args()
+
+
+def _upload_throttle(cli_args: argparse.Namespace) -> UploadThrottle | None:
+    if (
+        cli_args.throttle_rate is None
+        and not cli_args.throttle_pause
+        and cli_args.throttle_write_size is None
+    ):
+        return None
+    try:
+        return UploadThrottle(
+            cli_args.throttle_rate,
+            cli_args.throttle_pause,
+            cli_args.throttle_write_size,
+            cli_args.throttle_timeout,
+        )
+    except ValueError as e:
+        raise SystemExit(f"Invalid throttling options: {e}")
+
+
+if __name__ == "__main__":
+    cli_args = _parse_args()
+    suites = MATRIX_SUITES if cli_args.matrix else TEST_SUITES
+    if cli_args.list:
+        for suite_name, index, test_runner in iter_selected_cases(
+            suites, cli_args.cases, cli_args.shard
+        ):
+            print(f"{case_id(suite_name, index)}\t{describe_test_runner(test_runner)}")
+        raise SystemExit(0)
+    selected_suites = select_test_cases(suites, cli_args.cases, cli_args.shard)
+    if not selected_suites:
+        raise SystemExit(f"No test cases match {cli_args.cases}")
+    upload_throttle = _upload_throttle(cli_args)
+    if upload_throttle is not None:
+        _raise_open_file_limit()
+
+    # The server, load and results modules are only imported when used, keeping --list fast
+    if cli_args.local_server:
+        from .local_server import LocalS3Server
+    if cli_args.load_duration is not None:
+        from .load import run_load
+    result_writer = nullcontext()
+    on_result = None
+    if cli_args.results:
+        from .results import ResultWriter
+
+        # Results are scheduled in selection order, so a position maps back to its case id
+        case_ids = [
+            case_id(suite_name, index)
+            for suite_name, index, _ in iter_selected_cases(
+                suites, cli_args.cases, cli_args.shard
+            )
+        ]
+        result_writer = ResultWriter(cli_args.results)
+
+        def on_result(position: int, result: TestResult) -> None:
+            result_writer.write(case_ids[position], result)
+
+    # Load runs would otherwise keep every uploaded object in memory, but downloads and
+    # verification read objects back
+    reads_objects_back = cli_args.load_verify or any(
+        test_runner.callable is download
+        for _, test_cases in selected_suites
+        for test_runner in test_cases
+    )
+    local_server = (
+        LocalS3Server(
+            tls=cli_args.local_server == "https",
+            keep_data=cli_args.load_duration is None or reads_objects_back,
+        )
+        if cli_args.local_server
+        else nullcontext()
+    )
+    with local_server, result_writer:
+        config = replace(
+            (
+                local_server.runtime_config()
+                if cli_args.local_server
+                else RuntimeConfig(
+                    cli_args.endpoint, cli_args.access_key, cli_args.secret_key
+                )
+            ),
+            upload_throttle=upload_throttle,
+            http_pool_size=cli_args.http_pool_size
+            or max(cli_args.workers, DEFAULT_HTTP_POOL_SIZE),
+            http_retries=cli_args.http_retries,
+            s3_max_pool_connections=cli_args.s3_max_pool_connections
+            or max(cli_args.workers, DEFAULT_HTTP_POOL_SIZE),
+        )
+        if cli_args.load_duration is not None:
+            print(
+                run_load(
+                    config,
+                    [
+                        (bucket_name, test_runner)
+                        for bucket_name, test_cases in selected_suites
+                        for test_runner in test_cases
+                    ],
+                    cli_args.load_duration,
+                    concurrency=max(1, cli_args.workers),
+                    rate=cli_args.load_rate,
+                    verify=cli_args.load_verify,
+                    on_result=on_result,
+                ).format()
+            )
+        else:
+            run_tests(
+                config,
+                selected_suites,
+                workers=cli_args.workers,
+                executor=cli_args.executor,
+                show_timings=cli_args.timings,
+                on_result=on_result,
+            )
@@ -0,0 +1,362 @@
+import asyncio
+import ssl
+import time
+import weakref
+from typing import AsyncIterable, Callable, Iterable
+from .raw_http import (
+    CONTINUE_FINAL_RESPONSE,
+    CONTINUE_TIMEOUT,
+    DEFAULT_TIMEOUT,
+    RECV_SIZE,
+    STALE_CONNECTION_ERRORS,
+    HttpResponseParser,
+    RawHttpResponse,
+    StaleConnectionError,
+    coalesce_buffers,
+    expects_continue,
+    prepare_raw_request,
+)
+from .streams import FileRegion
+from .throttling import UploadPacer, UploadThrottle
+from .timings import ExchangeTimer, timed_phase
+
+AsyncBody = (
+    bytes
+    | Iterable[bytes | memoryview | FileRegion]
+    | AsyncIterable[bytes | memoryview | FileRegion]
+)
+_Connection = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def _iter_body(data: AsyncBody):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield data
+    elif isinstance(data, AsyncIterable):
+        async for data_piece in data:
+            yield data_piece
+    else:
+        for data_piece in data:
+            yield data_piece
+
+
+def _close(connection: _Connection) -> None:
+    connection[1].close()
+
+
+async def _read(
+    reader: asyncio.StreamReader, timeout: float, first_read_of_stale: bool
+) -> bytes:
+    # See raw_http._recv
+    try:
+        async with asyncio.timeout(timeout):
+            received = await reader.read(RECV_SIZE)
+    except STALE_CONNECTION_ERRORS as e:
+        if first_read_of_stale:
+            raise StaleConnectionError(f"Stale keep-alive connection: {e}") from e
+        raise
+    if not received and first_read_of_stale:
+        raise StaleConnectionError(
+            "Stale keep-alive connection: closed before responding"
+        )
+    return received
+
+
+async def _send_throttled(
+    writer: asyncio.StreamWriter,
+    request_head: bytearray,
+    data: AsyncBody,
+    throttle: UploadThrottle,
+) -> int:
+    # The asyncio counterpart of send_throttled: a slow upload waiting between writes costs a
+    # sleeping task rather than a thread, so thousands of them can be held open at once
+    pacer = UploadPacer(throttle)
+    bytes_sent = 0
+    delay = 0.0
+
+    async def _write(data_piece: bytes | memoryview | FileRegion) -> None:
+        nonlocal bytes_sent, delay
+        for write in throttle.split(data_piece):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            writer.write(write)
+            async with asyncio.timeout(throttle.timeout):
+                await writer.drain()
+            bytes_sent += len(write)
+            delay = pacer.delay_after(len(write))
+
+    await _write(request_head)
+    async for data_piece in _iter_body(data):
+        await _write(data_piece)
+    return bytes_sent
+
+
+class AsyncRawHttpConnectionPool:
+    """
+    asyncio counterpart of RawHttpConnectionPool. Connections are bound to the event loop that
+    opened them, so each loop should use its own pool (see get_default_async_pool)
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = 1024,
+        timeout: float = DEFAULT_TIMEOUT,
+        ssl_context: ssl.SSLContext | None = None,
+        continue_timeout: float = CONTINUE_TIMEOUT,
+    ):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.continue_timeout = continue_timeout
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        self.ssl_context = ssl_context
+        self._idle: dict[tuple[str, str, int], list[_Connection]] = {}
+
+    async def _connect(self, pool_key: tuple[str, str, int]) -> _Connection:
+        scheme, hostname, port = pool_key
+        async with asyncio.timeout(self.timeout):
+            with timed_phase("connect"):
+                reader, writer = await asyncio.open_connection(
+                    hostname, port, limit=RECV_SIZE
+                )
+            if scheme != "https":
+                return reader, writer
+            try:
+                # Upgrading separately keeps the TCP connect and TLS handshake apart
+                with timed_phase("tls"):
+                    await writer.start_tls(self.ssl_context, server_hostname=hostname)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def _acquire(
+        self, pool_key: tuple[str, str, int]
+    ) -> tuple[_Connection, bool]:
+        idle_connections = self._idle.get(pool_key, [])
+        while idle_connections:
+            reader, writer = connection = idle_connections.pop()
+            if not (reader.at_eof() or writer.is_closing()):
+                return connection, True
+            _close(connection)
+        return await self._connect(pool_key), False
+
+    def _release(self, pool_key: tuple[str, str, int], connection: _Connection) -> None:
+        idle_connections = self._idle.setdefault(pool_key, [])
+        if len(idle_connections) < self.max_idle_per_host:
+            idle_connections.append(connection)
+        else:
+            _close(connection)
+
+    def close(self) -> None:
+        for idle_connections in self._idle.values():
+            for connection in idle_connections:
+                _close(connection)
+        self._idle.clear()
+
+    async def request(
+        self,
+        method: str,
+        final_url: str,
+        headers: dict[str, str],
+        data: AsyncBody = b"",
+        body_sink: Callable[[memoryview], None] | None = None,
+        throttle: UploadThrottle | None = None,
+    ) -> RawHttpResponse:
+        pool_key, request_head = prepare_raw_request(method, final_url, headers)
+        replayable = isinstance(data, (bytes, bytearray, memoryview))
+        expect_continue = expects_continue(headers)
+
+        connection, reused = await self._acquire(pool_key)
+        try:
+            response = await self._send_and_receive(
+                connection,
+                method,
+                request_head,
+                data,
+                body_sink,
+                throttle,
+                expect_continue,
+                may_be_stale=reused and replayable,
+            )
+        except StaleConnectionError:
+            _close(connection)
+            # The server closed an idle keep-alive connection under us; retry once. Anything
+            # else, timeouts and resets after a response started included, is the result
+            connection = await self._connect(pool_key)
+            try:
+                response = await self._send_and_receive(
+                    connection,
+                    method,
+                    request_head,
+                    data,
+                    body_sink,
+                    throttle,
+                    expect_continue,
+                )
+            except BaseException:
+                _close(connection)
+                raise
+        except BaseException:
+            _close(connection)
+            raise
+
+        if response.keep_alive:
+            self._release(pool_key, connection)
+        else:
+            _close(connection)
+        return response
+
+    async def _send_and_receive(
+        self,
+        connection: _Connection,
+        method: str,
+        request_head: bytearray,
+        data: AsyncBody,
+        body_sink: Callable[[memoryview], None] | None,
+        throttle: UploadThrottle | None = None,
+        expect_continue: bool = False,
+        may_be_stale: bool = False,
+    ) -> RawHttpResponse:
+        # See RawHttpConnectionPool._send_and_receive
+        reader, writer = connection
+        exchange_timer = ExchangeTimer()
+        timeout = self.timeout if throttle is None else throttle.timeout
+
+        async def _send(
+            head: bytes | bytearray, body: AsyncBody, first: bool = False
+        ) -> int:
+            try:
+                if throttle is None:
+                    return await self._send(writer, head, body)
+                return await _send_throttled(writer, head, body, throttle)
+            except STALE_CONNECTION_ERRORS as e:
+                if (
+                    first
+                    and may_be_stale
+                    and throttle is None
+                    and len(head) + len(body) <= RECV_SIZE
+                ):
+                    raise StaleConnectionError(
+                        f"Stale keep-alive connection: {e}"
+                    ) from e
+                raise
+
+        parser = HttpResponseParser(method, body_sink)
+        bytes_received = 0
+        continue_outcome = None
+        if expect_continue:
+            bytes_sent = await _send(request_head, b"", first=True)
+            waiting_since = time.perf_counter()
+            bytes_received = await self._await_continue(reader, parser, may_be_stale)
+            continue_outcome = parser.continue_outcome
+            exchange_timer.continue_outcome(
+                continue_outcome, time.perf_counter() - waiting_since
+            )
+            if continue_outcome != CONTINUE_FINAL_RESPONSE:
+                bytes_sent += await _send(b"", data)
+                may_be_stale = False
+        else:
+            bytes_sent = await _send(request_head, data, first=True)
+
+        while not parser.complete:
+            received = await _read(reader, timeout, may_be_stale and not bytes_received)
+            exchange_timer.first_byte()
+            if not received:
+                parser.feed_eof()
+                break
+            bytes_received += len(received)
+            parser.feed(received)
+        exchange_timer.finish(bytes_sent, bytes_received)
+        parser.response.continue_outcome = continue_outcome
+        return parser.response
+
+    async def _await_continue(
+        self,
+        reader: asyncio.StreamReader,
+        parser: HttpResponseParser,
+        may_be_stale: bool = False,
+    ) -> int:
+        # See RawHttpConnectionPool._await_continue
+        bytes_received = 0
+        deadline = time.perf_counter() + self.continue_timeout
+        while not (parser.continue_received or parser.headers_complete):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                received = await _read(
+                    reader, remaining, may_be_stale and not bytes_received
+                )
+            except TimeoutError:
+                break
+            if not received:
+                parser.feed_eof()
+                break
+            bytes_received += len(received)
+            parser.feed(received)
+        return bytes_received
+
+    async def _send(
+        self, writer: asyncio.StreamWriter, request_head: bytearray, data: AsyncBody
+    ) -> int:
+        pending: list[bytes | memoryview] = [request_head]
+        pending_size = len(request_head)
+        bytes_sent = 0
+
+        async def _flush() -> None:
+            nonlocal pending, pending_size, bytes_sent
+            writer.writelines(coalesce_buffers(pending))
+            bytes_sent += pending_size
+            pending, pending_size = [], 0
+            async with asyncio.timeout(self.timeout):
+                await writer.drain()
+
+        async for data_piece in _iter_body(data):
+            if isinstance(data_piece, FileRegion):
+                if data_piece.size:
+                    await _flush()
+                    async with asyncio.timeout(self.timeout):
+                        # Falls back to reading and writing the file on TLS transports
+                        await asyncio.get_running_loop().sendfile(
+                            writer.transport,
+                            data_piece.file,
+                            data_piece.offset,
+                            data_piece.size,
+                        )
+                    bytes_sent += data_piece.size
+                continue
+            # Small pieces are gathered so they go out in one write, as in send_body
+            pending.append(data_piece)
+            pending_size += len(data_piece)
+            if pending_size >= RECV_SIZE:
+                await _flush()
+        await _flush()
+        return bytes_sent
+
+
+_DEFAULT_POOLS: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRawHttpConnectionPool]"
+) = weakref.WeakKeyDictionary()
+
+
+def get_default_async_pool() -> AsyncRawHttpConnectionPool:
+    loop = asyncio.get_running_loop()
+    if (pool := _DEFAULT_POOLS.get(loop)) is None:
+        pool = _DEFAULT_POOLS[loop] = AsyncRawHttpConnectionPool()
+    return pool
+
+
+async def send_raw_http_request_async(
+    final_url: str,
+    headers: dict[str, str],
+    data: AsyncBody,
+    method: str = "PUT",
+    pool: AsyncRawHttpConnectionPool | None = None,
+    throttle: UploadThrottle | None = None,
+) -> int:
+    response = await (pool or get_default_async_pool()).request(
+        method, final_url, headers, data, throttle=throttle
+    )
+    return response.status_code
@@ -0,0 +1,483 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from functools import partial, wraps
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    ParamSpec,
+    TypeVar,
+)
+from uuid import uuid4
+from .async_raw_http import AsyncBody, send_raw_http_request_async
+from .checksums import DEFAULT_CHECKSUM_ALGORITHM
+from .datamodel import RuntimeConfig, TestResult
+from .raw_http import RECV_SIZE
+from .s3_helpers import ensure_bucket_exists, ensure_content_matches
+from .streams import PayloadInput, as_payload_source, get_sized_body
+from .timings import record_phases
+from .test_cases import (
+    SIGNED_TRAILER_PAYLOAD,
+    DataGenerator,
+    aws_and_http_chunked_upload_result,
+    aws_chunked_data_generator,
+    aws_chunked_upload,
+    aws_chunked_upload_result,
+    aws_chunked_upload_with_chunked_transfer_encoding,
+    aws_chunked_upload_with_signed_trailer,
+    aws_chunked_upload_with_signed_trailer_result,
+    headers_to_send,
+    http_chunked_upload,
+    http_chunked_upload_result,
+    prepare_aws_chunked_upload,
+    prepare_http_chunked_upload,
+    prepare_standard_upload,
+    standard_upload,
+    standard_upload_result,
+    unauthorized_upload,
+    unauthorized_upload_result,
+    wrong_secret,
+)
+
+ParamT = ParamSpec("ParamT")
+ReturnT = TypeVar("ReturnT")
+PieceT = TypeVar("PieceT")
+
+# Runs the blocking work of the cases in run_test_cases_async: signing, encoding and boto3
+# calls. The loop's default executor has a few dozen threads, which would cap how many cases
+# are in flight well below the concurrency asked for
+_BLOCKING_EXECUTOR: ContextVar[Executor | None] = ContextVar(
+    "blocking_executor", default=None
+)
+
+
+def _get_response_or_exc_info_async(
+    wrapped: Callable[ParamT, Awaitable[ReturnT]],
+) -> Callable[ParamT, Awaitable[ReturnT | str]]:
+    @wraps(wrapped)
+    async def _(*args: ParamT.args, **kwargs: ParamT.kwargs) -> ReturnT | str:
+        try:
+            return await wrapped(*args, **kwargs)
+        except Exception as e:
+            return f"FAILURE: {e}"
+
+    return _
+
+
+async def _run_blocking(
+    func: Callable[..., ReturnT], *args: Any, **kwargs: Any
+) -> ReturnT:
+    # Like asyncio.to_thread, func runs in the caller's context so its timings are recorded
+    return await asyncio.get_running_loop().run_in_executor(
+        _BLOCKING_EXECUTOR.get(), partial(copy_context().run, func, *args, **kwargs)
+    )
+
+
+async def _ensure_bucket_exists_async(
+    runtime_config: RuntimeConfig, bucket: str
+) -> None:
+    if bucket not in runtime_config.known_buckets:
+        await _run_blocking(ensure_bucket_exists, runtime_config, bucket)
+
+
+def _next_pieces(pieces: Iterator[PieceT]) -> list[PieceT]:
+    batch: list[PieceT] = []
+    batch_size = 0
+    for piece in pieces:
+        batch.append(piece)
+        batch_size += len(piece)
+        if batch_size >= RECV_SIZE:
+            break
+    return batch
+
+
+async def _iter_encoded(body: Iterable[PieceT]) -> AsyncIterator[PieceT]:
+    """
+    Produce a lazily encoded body in a worker thread, about a send buffer at a time, so hashing
+    and signing its chunks does not hold up the other uploads on the event loop
+    """
+    pieces = iter(body)
+    while batch := await _run_blocking(_next_pieces, pieces):
+        for piece in batch:
+            yield piece
+
+
+async def _send_and_verify(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    url: str,
+    headers: dict[str, str],
+    body: AsyncBody,
+) -> int:
+    response_code = await send_raw_http_request_async(
+        url, headers, body, throttle=runtime_config.upload_throttle
+    )
+    if 400 > response_code >= 200:
+        # boto3 is blocking, so verification runs off the event loop
+        await _run_blocking(ensure_content_matches, runtime_config, bucket, key, data)
+    return response_code
+
+
+@_get_response_or_exc_info_async
+async def _standard_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    hash_data: bool = True,
+    expect_continue: bool = False,
+) -> int:
+    await _ensure_bucket_exists_async(runtime_config, bucket)
+    # Hashing the payload for the signature is as slow as sending it, so it runs off the loop
+    built_request = await _run_blocking(
+        prepare_standard_upload, runtime_config, bucket, key, data, hash_data
+    )
+    return await _send_and_verify(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        built_request.request.url,
+        headers_to_send(built_request, expect_continue),
+        # Slices or file regions of the payload, cheap enough to produce on the loop
+        get_sized_body(as_payload_source(data), file_regions=True),
+    )
+
+
+async def standard_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    hash_data: bool = True,
+    expect_continue: bool = False,
+) -> TestResult:
+    return standard_upload_result(
+        hash_data,
+        await _standard_upload_async(
+            runtime_config, bucket, key, data, hash_data, expect_continue
+        ),
+        expect_continue,
+    )
+
+
+@_get_response_or_exc_info_async
+async def _unauthorized_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    expect_continue: bool,
+) -> int:
+    await _ensure_bucket_exists_async(runtime_config, bucket)
+    built_request = await _run_blocking(
+        prepare_standard_upload, wrong_secret(runtime_config), bucket, key, data, True
+    )
+    return await _send_and_verify(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        built_request.request.url,
+        headers_to_send(built_request, expect_continue),
+        # Slices or file regions of the payload, cheap enough to produce on the loop
+        get_sized_body(as_payload_source(data), file_regions=True),
+    )
+
+
+async def unauthorized_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    expect_continue: bool = True,
+) -> TestResult:
+    return unauthorized_upload_result(
+        expect_continue,
+        await _unauthorized_upload_async(
+            runtime_config, bucket, key, data, expect_continue
+        ),
+    )
+
+
+@_get_response_or_exc_info_async
+async def _aws_chunked_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_checksum_algorithm: str | None = None,
+    expect_continue: bool = False,
+) -> int:
+    await _ensure_bucket_exists_async(runtime_config, bucket)
+    built_request, body = await _run_blocking(
+        prepare_aws_chunked_upload,
+        runtime_config,
+        bucket,
+        key,
+        data,
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_checksum_algorithm=trailer_checksum_algorithm,
+    )
+    return await _send_and_verify(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        built_request.request.url,
+        headers_to_send(built_request, expect_continue),
+        _iter_encoded(body),
+    )
+
+
+async def aws_chunked_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str = "aws-chunked",
+    sha256_header: str = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    add_decoded_content_length: bool = True,
+    expect_continue: bool = False,
+) -> TestResult:
+    return aws_chunked_upload_result(
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        await _aws_chunked_upload_async(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            chunk_count=chunk_count,
+            content_encoding=content_encoding,
+            sha256_header=sha256_header,
+            add_decoded_content_length=add_decoded_content_length,
+            expect_continue=expect_continue,
+        ),
+        expect_continue,
+    )
+
+
+async def aws_chunked_upload_with_signed_trailer_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    add_decoded_content_length: bool = True,
+) -> TestResult:
+    return aws_chunked_upload_with_signed_trailer_result(
+        chunk_count,
+        checksum_algorithm,
+        add_decoded_content_length,
+        await _aws_chunked_upload_async(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            chunk_count=chunk_count,
+            content_encoding="aws-chunked",
+            sha256_header=SIGNED_TRAILER_PAYLOAD,
+            add_decoded_content_length=add_decoded_content_length,
+            trailer_checksum_algorithm=checksum_algorithm,
+        ),
+    )
+
+
+@_get_response_or_exc_info_async
+async def _http_chunked_upload_with_trailer_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_header: str | None,
+    trailer_header_value: str | None,
+    data_generator: DataGenerator | None = None,
+    expect_continue: bool = False,
+) -> int:
+    await _ensure_bucket_exists_async(runtime_config, bucket)
+    built_request, data_to_send = await _run_blocking(
+        prepare_http_chunked_upload,
+        runtime_config,
+        bucket,
+        key,
+        data,
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
+        trailer_header_value,
+        data_generator,
+    )
+    return await _send_and_verify(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        built_request.request.url,
+        headers_to_send(built_request, expect_continue),
+        _iter_encoded(data_to_send),
+    )
+
+
+async def http_chunked_upload_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str = "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
+    add_decoded_content_length: bool = True,
+    trailer_header: str | None = None,
+    trailer_header_value: str | None = None,
+    expect_continue: bool = False,
+) -> TestResult:
+    return http_chunked_upload_result(
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
+        await _http_chunked_upload_with_trailer_async(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            chunk_count=chunk_count,
+            content_encoding=content_encoding,
+            sha256_header=sha256_header,
+            add_decoded_content_length=add_decoded_content_length,
+            trailer_header=trailer_header,
+            trailer_header_value=trailer_header_value,
+            expect_continue=expect_continue,
+        ),
+        expect_continue,
+    )
+
+
+async def aws_chunked_upload_with_chunked_transfer_encoding_async(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    aws_chunk_count: int,
+    http_chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    add_decoded_content_length: bool = True,
+    trailer_header: str | None = None,
+    trailer_header_value: str | None = None,
+    expect_continue: bool = False,
+) -> TestResult:
+    return aws_and_http_chunked_upload_result(
+        aws_chunk_count,
+        http_chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
+        await _http_chunked_upload_with_trailer_async(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            chunk_count=http_chunk_count,
+            content_encoding=content_encoding,
+            sha256_header=sha256_header,
+            add_decoded_content_length=add_decoded_content_length,
+            trailer_header=trailer_header,
+            trailer_header_value=trailer_header_value,
+            data_generator=aws_chunked_data_generator(aws_chunk_count),
+            expect_continue=expect_continue,
+        ),
+        expect_continue,
+    )
+
+
+ASYNC_VARIANTS: dict[
+    Callable[..., TestResult], Callable[..., Awaitable[TestResult]]
+] = {
+    standard_upload: standard_upload_async,
+    unauthorized_upload: unauthorized_upload_async,
+    aws_chunked_upload: aws_chunked_upload_async,
+    aws_chunked_upload_with_signed_trailer: aws_chunked_upload_with_signed_trailer_async,
+    http_chunked_upload: http_chunked_upload_async,
+    aws_chunked_upload_with_chunked_transfer_encoding: aws_chunked_upload_with_chunked_transfer_encoding_async,
+}
+
+
+async def run_test_cases_async(
+    runtime_config: RuntimeConfig,
+    scheduled: Iterable[tuple[str, Callable[..., TestResult], dict[str, Any]]],
+    concurrency: int = 1000,
+    on_result: Callable[[int, TestResult], None] | None = None,
+) -> list[TestResult]:
+    """
+    Run (bucket, test callable, args) triples on the current event loop, keeping at most
+    concurrency uploads in flight. Results are returned in scheduling order, with their phase
+    timings, and also passed to on_result with their position as each case finishes
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(
+        position: int,
+        bucket: str,
+        test_callable: Callable[..., TestResult],
+        args: dict[str, Any],
+    ) -> TestResult:
+        async with semaphore:
+            started = time.perf_counter()
+            with record_phases() as recorder:
+                if (async_callable := ASYNC_VARIANTS.get(test_callable)) is None:
+                    # No native variant (e.g. multipart uploads); run it off the event loop
+                    result = await _run_blocking(
+                        test_callable, runtime_config, bucket, uuid4().hex, **args
+                    )
+                else:
+                    result = await async_callable(
+                        runtime_config, bucket, uuid4().hex, **args
+                    )
+            result.elapsed = time.perf_counter() - started
+            result.timings = recorder.timings()
+            if on_result is not None:
+                on_result(position, result)
+            return result
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="async-cases"
+    ) as executor:
+        # Set before the cases' tasks are created, so that each inherits it
+        token = _BLOCKING_EXECUTOR.set(executor)
+        try:
+            return await asyncio.gather(
+                *(
+                    _run(position, bucket, test_callable, args)
+                    for position, (bucket, test_callable, args) in enumerate(scheduled)
+                )
+            )
+        finally:
+            _BLOCKING_EXECUTOR.reset(token)
@@ -1,70 +1,285 @@
-from math import ceil
-from textwrap import dedent
-from .constants import HEX_SIGNATURE_SIZE
+import hashlib
+import hmac
+from typing import Iterator
+from .checksums import StreamingChecksum
+from .chunking import ChunkingPlan, as_chunking_plan
+from .constants import EMPTY_SHA256
 from .datamodel import BaseSignedAwsRequest
-from .request_helpers import sha256
+from .signing import ChunkSigner
+from .streams import (
+    PayloadInput,
+    SizedBody,
+    as_payload_source,
+    iter_source_slices,
+    source_length,
+)
+
+# Longest chunk header or trailer line accepted by AwsChunkedDecoder
+MAX_CHUNK_LINE_SIZE = 4096
+TRAILER_SIGNATURE_HEADER = "x-amz-trailer-signature"
 
 
 def get_aws_chunked_content_length(
     unchunked_data_length: int,
-    chunk_count: int,
+    chunking: int | ChunkingPlan,
+    trailer_checksum: StreamingChecksum | None = None,
+    send_trailer: bool = True,
 ) -> int:
-    chunk_size = ceil(unchunked_data_length / chunk_count)
-    penultimate_chunk_size = unchunked_data_length - (chunk_size * (chunk_count - 1))
-    chunk_header_size = len(";chunk-signature=\r\n") + HEX_SIGNATURE_SIZE
-    return (
-        # Data length
-        unchunked_data_length
-        +
-        # Number of chunks * chunk header size, plus 1 for the final chunk
-        (chunk_header_size * (chunk_count + 1))
-        +
-        # Main data chunks - 1 * the size of the chunk as a hex string
-        ((chunk_count - 1) * len(f"{chunk_size:x}"))
-        +
-        # Size of the penultimate chunk as a hex string
-        len(f"{penultimate_chunk_size:x}")
-        +
-        # Size of the last chunk ("0", a 1 character hex string)
-        1
-        +
-        # \r\n for each chunk, including the final one
-        2 * (chunk_count + 1)
+    plan = as_chunking_plan(unchunked_data_length, chunking)
+    if trailer_checksum is None or not send_trailer:
+        return plan.aws_chunked_length()
+    return plan.aws_chunked_length(
+        trailer_headers=trailer_checksum.sized_trailer(), trailer_signature=True
     )
 
 
-def get_aws_chunked_content_string(
-    data_to_encode: str, chunk_count: int, built_request: BaseSignedAwsRequest
-) -> str:
-    def _get_string_to_sign(previous_signature: str, data_hash: str) -> str:
-        return dedent(
-            f"""
-        AWS4-HMAC-SHA256-PAYLOAD
-        {built_request.formatted_request_timestamp}
-        {built_request.key_path}
-        {previous_signature}
-        e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855
-        {data_hash}"""
-        ).strip()
-
-    def _get_chunk(previous_signature: str, data_in_chunk: str) -> tuple[str, str]:
-        signature = built_request.signer.signature(
-            _get_string_to_sign(previous_signature, sha256(data_in_chunk)),
-            built_request.request,
-        )
+def iter_aws_chunked_content(
+    data_to_encode: PayloadInput,
+    chunking: int | ChunkingPlan,
+    built_request: BaseSignedAwsRequest,
+    trailer_checksum: StreamingChecksum | None = None,
+    send_trailer: bool = True,
+) -> Iterator[bytes]:
+    """
+    Yield the aws-chunked encoding of data_to_encode one signed chunk at a time, followed by
+    the final empty chunk. Memory use is bounded by the chunk size. trailer_checksum is computed
+    from the chunks as they are encoded and sent after the final chunk as a signed trailer
+    (STREAMING-AWS4-HMAC-SHA256-PAYLOAD-TRAILER), unless send_trailer is False because an
+    outer encoding carries it
+    """
+
+    chunk_signer = ChunkSigner.from_signed_request(built_request)
+
+    def _get_chunk(
+        previous_signature: str, data_in_chunk: bytes | memoryview
+    ) -> tuple[str, bytes]:
+        signature = chunk_signer.sign_chunk(previous_signature, data_in_chunk)
 
         return (
             signature,
-            f"{len(data_in_chunk):x};chunk-signature={signature}\r\n{data_in_chunk}\r\n",
+            b"".join(
+                (
+                    f"{len(data_in_chunk):x};chunk-signature={signature}\r\n".encode(),
+                    data_in_chunk,
+                    b"\r\n",
+                )
+            ),
         )
 
-    result = ""
-    chunk_size = ceil(len(data_to_encode.encode("utf-8")) / chunk_count)
+    data_to_encode = as_payload_source(data_to_encode)
+    plan = as_chunking_plan(source_length(data_to_encode), chunking)
     last_seen_signature = built_request.signature
-    for chunk_pos in range(chunk_count + 1):
+    for data_in_chunk in iter_source_slices(data_to_encode, plan.chunk_size):
+        if trailer_checksum is not None:
+            trailer_checksum.update(data_in_chunk)
         last_seen_signature, this_chunk_data = _get_chunk(
-            last_seen_signature,
-            data_to_encode[chunk_pos * chunk_size : (chunk_pos + 1) * chunk_size],
+            last_seen_signature, data_in_chunk
         )
-        result += this_chunk_data
-    return result
+        yield this_chunk_data
+    last_seen_signature, final_chunk = _get_chunk(last_seen_signature, b"")
+    if trailer_checksum is None or not send_trailer:
+        yield final_chunk
+        return
+    trailer_headers = trailer_checksum.trailer()
+    trailer_signature = chunk_signer.sign_trailer(last_seen_signature, trailer_headers)
+    # The final chunk's closing CRLF is replaced by the trailers and their own empty line
+    yield b"".join(
+        (
+            final_chunk[:-2],
+            *(
+                f"{name}:{value}\r\n".encode("utf-8")
+                for name, value in trailer_headers.items()
+            ),
+            f"{TRAILER_SIGNATURE_HEADER}:{trailer_signature}\r\n\r\n".encode(),
+        )
+    )
+
+
+def get_aws_chunked_body(
+    data_to_encode: PayloadInput,
+    chunking: int | ChunkingPlan,
+    built_request: BaseSignedAwsRequest,
+    trailer_checksum: StreamingChecksum | None = None,
+    send_trailer: bool = True,
+) -> SizedBody:
+    data_to_encode = as_payload_source(data_to_encode)
+    plan = as_chunking_plan(source_length(data_to_encode), chunking)
+    return SizedBody(
+        iter_aws_chunked_content(
+            data_to_encode, plan, built_request, trailer_checksum, send_trailer
+        ),
+        get_aws_chunked_content_length(
+            plan.payload_size, plan, trailer_checksum, send_trailer
+        ),
+    )
+
+
+class AwsChunkedDecodeError(ValueError):
+    pass
+
+
+class ChunkSignatureError(AwsChunkedDecodeError):
+    pass
+
+
+class AwsChunkedDecoder:
+    """
+    Incremental aws-chunked decoder. Bytes can be fed in pieces of any size; feed() returns the
+    decoded payload as memoryview slices of the fed data, so payload bytes are never copied or
+    buffered. With a chunk signer, every chunk signature is checked against the chain seeded by
+    the request signature. Trailers following the final chunk are collected in trailers; their
+    x-amz-trailer-signature is checked when present, and required with signed_trailer
+    """
+
+    _HEADER, _DATA, _DATA_END, _TRAILER, _DONE = range(5)
+
+    def __init__(
+        self,
+        chunk_signer: ChunkSigner | None = None,
+        seed_signature: str | None = None,
+        max_line_size: int = MAX_CHUNK_LINE_SIZE,
+        signed_trailer: bool = False,
+    ):
+        self._chunk_signer = chunk_signer
+        self._signed_trailer = signed_trailer
+        self._previous_signature = seed_signature
+        self._max_line_size = max_line_size
+        self._state = self._HEADER
+        self._partial_line = bytearray()
+        self._remaining = 0
+        self._chunk_signature: str | None = None
+        self._chunk_hasher = None
+        self.trailers: dict[str, str] = {}
+        self.decoded_length = 0
+        self.chunk_count = 0
+
+    @classmethod
+    def from_signed_request(
+        cls, built_request: BaseSignedAwsRequest
+    ) -> "AwsChunkedDecoder":
+        return cls(
+            ChunkSigner.from_signed_request(built_request), built_request.signature
+        )
+
+    @property
+    def complete(self) -> bool:
+        return self._state == self._DONE
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[memoryview]:
+        view = memoryview(data).cast("B")
+        # bytes.find is much faster than scanning a memoryview, so search the original
+        # object when it supports it
+        searchable = data if isinstance(data, (bytes, bytearray)) else None
+        decoded = []
+        position = 0
+        while position < len(view):
+            if self._state == self._DATA:
+                size = min(self._remaining, len(view) - position)
+                data_piece = view[position : position + size]
+                if self._chunk_hasher is not None:
+                    self._chunk_hasher.update(data_piece)
+                decoded.append(data_piece)
+                self._remaining -= size
+                self.decoded_length += size
+                position += size
+                if not self._remaining:
+                    self._state = self._DATA_END
+                continue
+            if self._state == self._DONE:
+                raise AwsChunkedDecodeError(
+                    "Data after the end of the aws-chunked body"
+                )
+            line, position = self._read_line(view, searchable, position)
+            if line is not None:
+                self._process_line(line)
+        return decoded
+
+    def finish(self) -> None:
+        if self._state != self._DONE:
+            raise AwsChunkedDecodeError("Truncated aws-chunked body")
+
+    def _read_line(
+        self, view: memoryview, searchable: bytes | bytearray | None, position: int
+    ) -> tuple[bytes | None, int]:
+        if self._partial_line.endswith(b"\r") and view[position] == 0x0A:
+            line = bytes(self._partial_line[:-1])
+            self._partial_line.clear()
+            return line, position + 1
+        search_end = min(len(view), position + self._max_line_size + 2)
+        if searchable is not None:
+            line_end = searchable.find(b"\r\n", position, search_end)
+        else:
+            line_end = bytes(view[position:search_end]).find(b"\r\n")
+            line_end = line_end + position if line_end >= 0 else -1
+        if line_end < 0:
+            self._partial_line += view[position:search_end]
+            if len(self._partial_line) > self._max_line_size:
+                raise AwsChunkedDecodeError("aws-chunked line too long")
+            return None, search_end
+        line = bytes(view[position:line_end])
+        if self._partial_line:
+            line = bytes(self._partial_line) + line
+            self._partial_line.clear()
+        return line, line_end + 2
+
+    def _process_line(self, line: bytes) -> None:
+        if self._state == self._HEADER:
+            self._start_chunk(line)
+        elif self._state == self._DATA_END:
+            if line:
+                raise AwsChunkedDecodeError("Chunk data overruns its declared size")
+            self._verify_chunk(
+                self._chunk_hasher.hexdigest() if self._chunk_hasher else ""
+            )
+            self._state = self._HEADER
+        elif not line:
+            self._verify_trailer()
+            self._state = self._DONE
+        else:
+            header_name, _, header_value = line.decode("latin-1").partition(":")
+            self.trailers[header_name.strip().lower()] = header_value.strip()
+
+    def _start_chunk(self, line: bytes) -> None:
+        size_text, _, extension = line.partition(b";")
+        try:
+            self._remaining = int(size_text, 16)
+        except ValueError:
+            raise AwsChunkedDecodeError(f"Invalid chunk size {size_text!r}")
+        self.chunk_count += 1
+        self._chunk_signature = None
+        if extension.startswith(b"chunk-signature="):
+            self._chunk_signature = extension[len(b"chunk-signature=") :].decode(
+                "latin-1"
+            )
+        if self._chunk_signer is not None:
+            if self._chunk_signature is None:
+                raise ChunkSignatureError(f"Chunk {self.chunk_count} is not signed")
+            self._chunk_hasher = hashlib.sha256()
+        if self._remaining:
+            self._state = self._DATA
+        else:
+            self._verify_chunk(EMPTY_SHA256)
+            self._state = self._TRAILER
+
+    def _verify_trailer(self) -> None:
+        trailers = dict(self.trailers)
+        signature = trailers.pop(TRAILER_SIGNATURE_HEADER, None)
+        if self._chunk_signer is None:
+            return
+        if signature is None:
+            if self._signed_trailer:
+                raise ChunkSignatureError("The trailer is not signed")
+            return
+        expected = self._chunk_signer.sign_trailer(self._previous_signature, trailers)
+        if not hmac.compare_digest(expected, signature):
+            raise ChunkSignatureError("Signature mismatch for the trailer")
+
+    def _verify_chunk(self, data_hash: str) -> None:
+        if self._chunk_signer is None:
+            return
+        expected = self._chunk_signer.sign(self._previous_signature, data_hash)
+        if not hmac.compare_digest(expected, self._chunk_signature):
+            raise ChunkSignatureError(
+                f"Signature mismatch for chunk {self.chunk_count}"
+            )
+        self._previous_signature = expected
@@ -0,0 +1,562 @@
+import argparse
+import hashlib
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from math import ceil
+from typing import Any, Callable
+from uuid import uuid4
+from tabulate import tabulate
+from .aws_chunked import AwsChunkedDecoder, get_aws_chunked_body
+from .datamodel import RuntimeConfig, TestResult
+from .downloads import (
+    DOWNLOAD_MODES,
+    format_download_sweep_results,
+    run_download_sweep,
+)
+from .local_server import LocalS3Server
+from .multipart import (
+    PART_ENCODINGS,
+    format_multipart_sweep_results,
+    run_multipart_sweep,
+)
+from .payloads import GeneratedPayload, format_size, parse_size
+from .request_helpers import build_request
+from .s3_helpers import content_verification, ensure_bucket_exists
+from .signing import ChunkSigner
+from .test_cases import (
+    aws_chunked_upload,
+    aws_chunked_upload_with_chunked_transfer_encoding,
+    http_chunked_upload,
+    standard_upload,
+)
+
+BENCHMARK_BUCKET = "payload-sweep-benchmarks"
+DEFAULT_SWEEP_SIZES = ("1KiB", "64KiB", "1MiB", "16MiB", "256MiB", "1GiB", "4GiB")
+TARGET_CHUNK_SIZE = 64 * 1024
+DEFAULT_DECODER_SIZES = ("1MiB", "16MiB", "256MiB")
+# Objects are held in memory by the local server, so downloads stop short of the upload sweep
+DEFAULT_DOWNLOAD_SIZES = ("1MiB", "16MiB", "256MiB")
+DECODER_FEED_SIZE = 64 * 1024
+# Import and CLI overhead, on top of a bare interpreter, allowed before the startup suite fails
+DEFAULT_STARTUP_BUDGET_MS = 200.0
+STARTUP_COMMANDS = {
+    "python -c pass": ("-c", "pass"),
+    "python -m proxy_testing --list": ("-m", "proxy_testing", "--list"),
+}
+
+
+def _chunk_count(payload_size: int) -> int:
+    return max(1, ceil(payload_size / TARGET_CHUNK_SIZE))
+
+
+# Each encoding maps a payload size to the test case and the arguments used to upload it
+SWEEP_ENCODINGS: dict[
+    str, tuple[Callable[..., TestResult], Callable[[int], dict[str, Any]]]
+] = {
+    "standard": (standard_upload, lambda _: {"hash_data": False}),
+    "aws-chunked": (
+        aws_chunked_upload,
+        lambda size: {"chunk_count": _chunk_count(size)},
+    ),
+    "http-chunked": (
+        http_chunked_upload,
+        lambda size: {
+            "chunk_count": _chunk_count(size),
+            "content_encoding": None,
+            "sha256_header": "UNSIGNED-PAYLOAD",
+        },
+    ),
+    "aws-chunked+http-chunked": (
+        aws_chunked_upload_with_chunked_transfer_encoding,
+        lambda size: {
+            "aws_chunk_count": _chunk_count(size),
+            "http_chunk_count": _chunk_count(size),
+            "content_encoding": "aws-chunked",
+        },
+    ),
+}
+
+
+@dataclass
+class SweepResult:
+    encoding: str
+    payload_size: int
+    result: str | int
+    seconds: float
+    peak_rss_bytes: int
+    # Imports, client setup and the first connection of the fresh worker process
+    warm_up_seconds: float = 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.payload_size / self.seconds / 1_000_000 if self.seconds else 0.0
+
+
+def _peak_rss_bytes() -> int:
+    # VmHWM belongs to the current address space, whereas ru_maxrss survives exec and can
+    # report the peak of whichever process spawned this worker
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _run_sweep_case(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    encoding: str,
+    payload_size: int,
+    verify: bool,
+) -> SweepResult:
+    test_callable, build_args = SWEEP_ENCODINGS[encoding]
+    payload = GeneratedPayload(payload_size)
+    # Every case runs in a fresh process: a one-byte upload first pays for the lazy imports,
+    # the clients and the connection, which would otherwise dominate small payloads. It is
+    # verified like the measured upload so that the first verification is paid for here too
+    warm_up_started = time.perf_counter()
+    with content_verification(verify):
+        test_callable(
+            runtime_config,
+            bucket,
+            uuid4().hex,
+            data=GeneratedPayload(1),
+            **build_args(1),
+        )
+    warm_up_seconds = time.perf_counter() - warm_up_started
+    started = time.perf_counter()
+    with content_verification(verify):
+        test_result = test_callable(
+            runtime_config,
+            bucket,
+            uuid4().hex,
+            data=payload,
+            **build_args(payload_size),
+        )
+    elapsed = time.perf_counter() - started
+    return SweepResult(
+        encoding=encoding,
+        payload_size=payload_size,
+        result=test_result.result,
+        seconds=elapsed,
+        peak_rss_bytes=_peak_rss_bytes(),
+        warm_up_seconds=warm_up_seconds,
+    )
+
+
+def run_payload_sweep(
+    runtime_config: RuntimeConfig,
+    payload_sizes: list[int],
+    encodings: list[str],
+    bucket: str = BENCHMARK_BUCKET,
+    verify: bool = False,
+) -> list[SweepResult]:
+    """
+    Upload a generated payload of every size with every encoding. Each case runs in a fresh
+    worker process so that its peak RSS is not polluted by earlier, larger cases
+    """
+    ensure_bucket_exists(runtime_config, bucket)
+    results = []
+    for payload_size in payload_sizes:
+        for encoding in encodings:
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                results.append(
+                    pool.submit(
+                        _run_sweep_case,
+                        runtime_config,
+                        bucket,
+                        encoding,
+                        payload_size,
+                        verify,
+                    ).result()
+                )
+    return results
+
+
+def format_sweep_results(results: list[SweepResult]) -> str:
+    return tabulate(
+        [
+            (
+                result.encoding,
+                format_size(result.payload_size),
+                result.result,
+                f"{result.seconds:.3f}",
+                f"{result.megabytes_per_second:.1f}",
+                f"{result.peak_rss_bytes / (1 << 20):.1f}",
+                f"{result.warm_up_seconds:.3f}",
+            )
+            for result in results
+        ],
+        headers=(
+            "Encoding",
+            "Payload size",
+            "Result",
+            "Seconds",
+            "MB/s",
+            "Peak client RSS (MiB)",
+            "Warm-up (s)",
+        ),
+    )
+
+
+_NAIVE_CHUNK_HEADER = re.compile(rb"([0-9a-fA-F]+);chunk-signature=([0-9a-f]+)\r\n")
+
+
+def _naive_regex_decode(
+    body: bytes, chunk_signer: ChunkSigner, seed_signature: str
+) -> bytes:
+    """Baseline for AwsChunkedDecoder: match headers on the fully buffered body and copy chunks"""
+    decoded = []
+    previous_signature = seed_signature
+    position = 0
+    while True:
+        match = _NAIVE_CHUNK_HEADER.match(body, position)
+        if match is None:
+            raise ValueError(f"Invalid chunk header at byte {position}")
+        size = int(match[1], 16)
+        data_in_chunk = body[match.end() : match.end() + size]
+        previous_signature = chunk_signer.sign(
+            previous_signature, hashlib.sha256(data_in_chunk).hexdigest()
+        )
+        if previous_signature != match[2].decode():
+            raise ValueError(f"Signature mismatch at byte {position}")
+        decoded.append(data_in_chunk)
+        position = match.end() + size + 2
+        if not size:
+            return b"".join(decoded)
+
+
+@dataclass
+class DecoderBenchmarkResult:
+    decoder: str
+    payload_size: int
+    chunk_size: int
+    seconds: float
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.payload_size / self.seconds / 1_000_000 if self.seconds else 0.0
+
+
+def run_decoder_benchmark(
+    payload_sizes: list[int],
+    chunk_size: int = TARGET_CHUNK_SIZE,
+    feed_size: int = DECODER_FEED_SIZE,
+    repeat: int = 3,
+) -> list[DecoderBenchmarkResult]:
+    """
+    Time signed aws-chunked decoding of generated payloads, best of repeat runs. The streaming
+    decoder is fed feed_size pieces, whereas the regex baseline gets the whole body at once
+    """
+    built_request = build_request(
+        RuntimeConfig("http://localhost", "benchmark", "benchmark"),
+        BENCHMARK_BUCKET,
+        "decoder",
+        "PUT",
+    )
+    chunk_signer = ChunkSigner.from_signed_request(built_request)
+    results = []
+    for payload_size in payload_sizes:
+        body = b"".join(
+            get_aws_chunked_body(
+                GeneratedPayload(payload_size),
+                max(1, ceil(payload_size / chunk_size)),
+                built_request,
+            )
+        )
+
+        def _streaming() -> None:
+            decoder = AwsChunkedDecoder(chunk_signer, built_request.signature)
+            with memoryview(body) as body_view:
+                for offset in range(0, len(body), feed_size):
+                    decoder.feed(body_view[offset : offset + feed_size])
+            decoder.finish()
+
+        def _naive() -> None:
+            _naive_regex_decode(body, chunk_signer, built_request.signature)
+
+        for decoder_name, decode in (
+            ("streaming", _streaming),
+            ("naive regex", _naive),
+        ):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                decode()
+                timings.append(time.perf_counter() - started)
+            results.append(
+                DecoderBenchmarkResult(
+                    decoder_name, payload_size, chunk_size, min(timings)
+                )
+            )
+    return results
+
+
+def format_decoder_benchmark_results(results: list[DecoderBenchmarkResult]) -> str:
+    return tabulate(
+        [
+            (
+                result.decoder,
+                format_size(result.payload_size),
+                format_size(result.chunk_size),
+                f"{result.seconds:.3f}",
+                f"{result.megabytes_per_second:.1f}",
+            )
+            for result in results
+        ],
+        headers=("Decoder", "Payload size", "Chunk size", "Seconds", "MB/s"),
+    )
+
+
+@dataclass
+class StartupResult:
+    command: str
+    median_seconds: float
+    best_seconds: float
+
+
+def run_startup_benchmark(runs: int = 11) -> list[StartupResult]:
+    """
+    Time fresh interpreters running each of STARTUP_COMMANDS, as every short-lived worker of a
+    sharded run pays this cost before doing anything useful
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, (package_root, os.environ.get("PYTHONPATH")))
+        ),
+    }
+    results = []
+    for command, arguments in STARTUP_COMMANDS.items():
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(
+                (sys.executable, *arguments),
+                check=True,
+                stdout=subprocess.DEVNULL,
+                env=environment,
+            )
+            timings.append(time.perf_counter() - started)
+        results.append(StartupResult(command, statistics.median(timings), min(timings)))
+    return results
+
+
+def startup_overhead_ms(results: list[StartupResult]) -> float:
+    """Median startup of the CLI minus that of a bare interpreter"""
+    interpreter, *commands = results
+    return max(
+        (result.median_seconds - interpreter.median_seconds) * 1000
+        for result in commands
+    )
+
+
+def format_startup_results(results: list[StartupResult], budget_ms: float) -> str:
+    table = tabulate(
+        [
+            (
+                result.command,
+                f"{result.median_seconds * 1000:.1f}",
+                f"{result.best_seconds * 1000:.1f}",
+            )
+            for result in results
+        ],
+        headers=("Command", "Median (ms)", "Best (ms)"),
+    )
+    return (
+        f"{table}\n\nOverhead over the interpreter: "
+        f"{startup_overhead_ms(results):.1f}ms (budget {budget_ms:g}ms)"
+    )
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Sweep payload sizes for every upload encoding or download mode, or part "
+        "sizes for multipart uploads"
+    )
+    parser.add_argument(
+        "--suite",
+        choices=(
+            "payload-sweep",
+            "multipart",
+            "downloads",
+            "aws-chunked-decoder",
+            "startup",
+        ),
+        default="payload-sweep",
+    )
+    parser.add_argument("--endpoint", default="https://localhost:8443")
+    parser.add_argument("--access-key", default="testidentity")
+    parser.add_argument("--secret-key", default="testsecret")
+    parser.add_argument("--bucket", default=BENCHMARK_BUCKET)
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=list(DEFAULT_SWEEP_SIZES),
+        help="Payload sizes, e.g. 1KiB 16MiB 4GiB",
+    )
+    parser.add_argument(
+        "--encodings",
+        nargs="+",
+        choices=sorted(SWEEP_ENCODINGS),
+        default=list(SWEEP_ENCODINGS),
+    )
+    parser.add_argument(
+        "--multipart-payload-size",
+        default="256MiB",
+        help="Object size for the multipart suite",
+    )
+    parser.add_argument(
+        "--part-sizes",
+        nargs="+",
+        default=["5MiB", "16MiB", "64MiB"],
+        help="Part sizes for the multipart suite",
+    )
+    parser.add_argument(
+        "--part-encodings",
+        nargs="+",
+        choices=PART_ENCODINGS,
+        default=list(PART_ENCODINGS),
+    )
+    parser.add_argument(
+        "--download-sizes",
+        nargs="+",
+        default=list(DEFAULT_DOWNLOAD_SIZES),
+        help="Object sizes for the downloads suite",
+    )
+    parser.add_argument(
+        "--download-modes",
+        nargs="+",
+        choices=DOWNLOAD_MODES,
+        default=list(DOWNLOAD_MODES),
+    )
+    parser.add_argument(
+        "--range-count",
+        type=int,
+        default=8,
+        help="Ranges fetched concurrently by the parallel-range download mode",
+    )
+    parser.add_argument(
+        "--decoder-sizes",
+        nargs="+",
+        default=list(DEFAULT_DECODER_SIZES),
+        help="Payload sizes for the aws-chunked-decoder suite, held in memory",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        default="64KiB",
+        help="aws-chunked chunk size for the aws-chunked-decoder suite",
+    )
+    parser.add_argument(
+        "--startup-budget-ms",
+        type=float,
+        default=DEFAULT_STARTUP_BUDGET_MS,
+        help="Exit with an error when the startup suite measures more overhead than this",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Parts uploaded concurrently in the multipart suite",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Verify uploaded content (included in the measured time)",
+    )
+    parser.add_argument(
+        "--local-server",
+        nargs="?",
+        choices=("http", "https"),
+        const="http",
+        default=None,
+        help="Benchmark against an in-process S3 stand-in instead of --endpoint",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = _parse_args()
+    if cli_args.suite == "startup":
+        startup_results = run_startup_benchmark()
+        print(format_startup_results(startup_results, cli_args.startup_budget_ms))
+        raise SystemExit(
+            startup_overhead_ms(startup_results) > cli_args.startup_budget_ms
+        )
+    local_server = (
+        # Uploaded data is only kept when it will be read back
+        LocalS3Server(
+            tls=cli_args.local_server == "https",
+            keep_data=cli_args.verify or cli_args.suite == "downloads",
+        )
+        if cli_args.local_server
+        else nullcontext()
+    )
+    with local_server:
+        config = (
+            local_server.runtime_config()
+            if cli_args.local_server
+            else RuntimeConfig(
+                cli_args.endpoint, cli_args.access_key, cli_args.secret_key
+            )
+        )
+        if cli_args.suite == "aws-chunked-decoder":
+            print(
+                format_decoder_benchmark_results(
+                    run_decoder_benchmark(
+                        [parse_size(size) for size in cli_args.decoder_sizes],
+                        chunk_size=parse_size(cli_args.chunk_size),
+                    )
+                )
+            )
+        elif cli_args.suite == "multipart":
+            print(
+                format_multipart_sweep_results(
+                    run_multipart_sweep(
+                        config,
+                        cli_args.bucket,
+                        parse_size(cli_args.multipart_payload_size),
+                        [parse_size(size) for size in cli_args.part_sizes],
+                        cli_args.part_encodings,
+                        concurrency=cli_args.concurrency,
+                        verify=cli_args.verify,
+                    )
+                )
+            )
+        elif cli_args.suite == "downloads":
+            print(
+                format_download_sweep_results(
+                    run_download_sweep(
+                        config,
+                        cli_args.bucket,
+                        [parse_size(size) for size in cli_args.download_sizes],
+                        cli_args.download_modes,
+                        range_count=cli_args.range_count,
+                    )
+                )
+            )
+        else:
+            print(
+                format_sweep_results(
+                    run_payload_sweep(
+                        config,
+                        [parse_size(size) for size in cli_args.sizes],
+                        cli_args.encodings,
+                        bucket=cli_args.bucket,
+                        verify=cli_args.verify,
+                    )
+                )
+            )
@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator
+
+# Reflected CRC-32C (Castagnoli) polynomial
+_CRC32C_POLYNOMIAL = 0x82F63B78
+
+
+def _crc32c_table() -> list[int]:
+    table = []
+    for byte in range(256):
+        value = byte
+        for _ in range(8):
+            value = (value >> 1) ^ (_CRC32C_POLYNOMIAL if value & 1 else 0)
+        table.append(value)
+    return table
+
+
+_CRC32C_TABLE = _crc32c_table()
+
+
+def _crc32c_python(data: bytes | memoryview, value: int = 0) -> int:
+    table = _CRC32C_TABLE
+    value ^= 0xFFFFFFFF
+    for byte in bytes(data):
+        value = table[(value ^ byte) & 0xFF] ^ (value >> 8)
+    return value ^ 0xFFFFFFFF
+
+
+@lru_cache(maxsize=None)
+def _load_crc32c() -> Callable[[bytes | memoryview, int], int]:
+    # The crc32c package is optional; its C implementation is orders of magnitude faster
+    # than the pure Python fallback, and releases the GIL
+    try:
+        from crc32c import crc32c
+    except ImportError:
+        return _crc32c_python
+    return crc32c
+
+
+class _Crc:
+    digest_size = 4
+
+    def __init__(self, update: Callable[[bytes | memoryview, int], int]):
+        self._update = update
+        self._value = 0
+
+    def update(self, data: bytes | memoryview) -> None:
+        self._value = self._update(data, self._value)
+
+    def digest(self) -> bytes:
+        return self._value.to_bytes(4, "big")
+
+
+# hashlib and zlib release the GIL while hashing buffers of a few KiB or more, so hashing
+# whole chunks lets concurrent uploads hash on several cores
+CHECKSUM_ALGORITHMS: dict[str, Callable] = {
+    "crc32": lambda: _Crc(zlib.crc32),
+    "crc32c": lambda: _Crc(_load_crc32c()),
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+}
+# crc32c needs the optional crc32c package to be fast, so it is only used when asked for
+DEFAULT_CHECKSUM_ALGORITHM = "crc32"
+
+
+def checksum_header(algorithm: str) -> str:
+    return f"x-amz-checksum-{algorithm}"
+
+
+class StreamingChecksum:
+    """
+    x-amz-checksum-* value computed from the payload while it is being encoded, so it can be
+    sent as a trailer without reading the payload beforehand
+    """
+
+    def __init__(self, algorithm: str):
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError(f"Unsupported checksum algorithm {algorithm}")
+        self.algorithm = algorithm
+        self.header_name = checksum_header(algorithm)
+        self._hasher = CHECKSUM_ALGORITHMS[algorithm]()
+
+    @classmethod
+    def from_header(cls, header_name: str) -> "StreamingChecksum":
+        return cls(header_name.lower().removeprefix("x-amz-checksum-"))
+
+    @property
+    def value_size(self) -> int:
+        """Length of the base64 value, known before any data is hashed"""
+        return len(base64.b64encode(bytes(self._hasher.digest_size)))
+
+    def update(self, data: bytes | memoryview) -> None:
+        self._hasher.update(data)
+
+    def value(self) -> str:
+        return base64.b64encode(self._hasher.digest()).decode("ascii")
+
+    def trailer(self) -> dict[str, str]:
+        return {self.header_name: self.value()}
+
+    def sized_trailer(self) -> dict[str, str]:
+        """A trailer the same size as the final one, to compute Content-Length upfront"""
+        return {self.header_name: "=" * self.value_size}
+
+
+def iter_checksummed(
+    pieces: Iterable[bytes | memoryview], checksum: StreamingChecksum | None
+) -> Iterator[bytes | memoryview]:
+    """Feed every piece to checksum on its way through"""
+    if checksum is None:
+        yield from pieces
+        return
+    for piece in pieces:
+        checksum.update(piece)
+        yield piece
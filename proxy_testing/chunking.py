@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from math import ceil
+from typing import Callable, Iterator
+from .constants import HEX_SIGNATURE_SIZE
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# S3 rejects aws-chunked bodies whose chunks, other than the last, are smaller than this
+AWS_CHUNKED_MIN_CHUNK_SIZE = 8 * 1024
+
+_CHUNK_SIGNATURE_EXTENSION_SIZE = len(";chunk-signature=") + HEX_SIGNATURE_SIZE
+_TRAILER_SIGNATURE_LINE_SIZE = len("x-amz-trailer-signature:\r\n") + HEX_SIGNATURE_SIZE
+
+
+@dataclass(frozen=True)
+class ChunkingPlan:
+    """
+    Split of a payload into data chunks of chunk_size bytes, the last one possibly shorter,
+    followed by the final empty chunk. Boundaries and encoded lengths are computed in O(1),
+    so the Content-Length of a multi-GB body is known without generating it
+    """
+
+    payload_size: int
+    chunk_size: int
+
+    def __post_init__(self):
+        if self.chunk_size < 1:
+            raise ValueError(f"Invalid chunk size {self.chunk_size}")
+
+    @classmethod
+    def from_chunk_count(cls, payload_size: int, chunk_count: int) -> "ChunkingPlan":
+        """At most chunk_count data chunks of equal size, the last one possibly shorter"""
+        if chunk_count < 1:
+            raise ValueError(f"Invalid chunk count {chunk_count}")
+        return cls(payload_size, max(1, ceil(payload_size / chunk_count)))
+
+    @classmethod
+    def from_chunk_size(
+        cls,
+        payload_size: int,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        minimum_chunk_size: int = 1,
+    ) -> "ChunkingPlan":
+        if chunk_size < minimum_chunk_size:
+            raise ValueError(
+                f"Chunk size {chunk_size} is below the minimum of {minimum_chunk_size}"
+            )
+        return cls(payload_size, chunk_size)
+
+    @property
+    def chunk_count(self) -> int:
+        """Number of data chunks, excluding the final empty chunk"""
+        return ceil(self.payload_size / self.chunk_size)
+
+    @property
+    def last_chunk_size(self) -> int:
+        if not self.payload_size:
+            return 0
+        return self.payload_size - self.chunk_size * (self.chunk_count - 1)
+
+    def chunk_bounds(self, index: int) -> tuple[int, int]:
+        """Offset and size of data chunk index"""
+        if not 0 <= index < self.chunk_count:
+            raise IndexError(f"Chunk {index} out of range")
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.payload_size - offset)
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for offset in range(0, self.payload_size, self.chunk_size):
+            yield offset, min(self.chunk_size, self.payload_size - offset)
+
+    def _sum_chunk_lines(self, header_size_for: Callable[[int], int]) -> int:
+        # Every data chunk but the last has the same size, hence the same header
+        if not self.chunk_count:
+            return 0
+        return (self.chunk_count - 1) * header_size_for(
+            self.chunk_size
+        ) + header_size_for(self.last_chunk_size)
+
+    @staticmethod
+    def http_chunk_header_size(data_size: int, extension: str = "") -> int:
+        return len(f"{data_size:x}") + len(extension.encode("utf-8")) + 2
+
+    @staticmethod
+    def aws_chunk_header_size(data_size: int, signed: bool = True) -> int:
+        return (
+            len(f"{data_size:x}")
+            + (_CHUNK_SIGNATURE_EXTENSION_SIZE if signed else 0)
+            + 2
+        )
+
+    @staticmethod
+    def trailer_size(trailer_headers: dict[str, str] | None, separator: str) -> int:
+        return sum(
+            len(f"{name}{separator}{value}\r\n".encode("utf-8"))
+            for name, value in (trailer_headers or {}).items()
+        )
+
+    def http_chunked_length(
+        self, extension: str = "", trailer_headers: dict[str, str] | None = None
+    ) -> int:
+        """Length of the Transfer-Encoding: chunked body, as written by the http_chunked encoders"""
+        return (
+            self.payload_size
+            # Each data chunk's header plus the CRLF after its data
+            + self._sum_chunk_lines(
+                lambda size: self.http_chunk_header_size(size, extension) + 2
+            )
+            + self.http_chunk_header_size(0, extension)
+            + self.trailer_size(trailer_headers, ": ")
+            + 2
+        )
+
+    def aws_chunked_length(
+        self,
+        signed: bool = True,
+        trailer_headers: dict[str, str] | None = None,
+        trailer_signature: bool = False,
+    ) -> int:
+        """
+        Length of the aws-chunked body. The final chunk is followed by the trailers, plus
+        x-amz-trailer-signature when trailer_signature is set, and an empty line
+        """
+        return (
+            self.payload_size
+            + self._sum_chunk_lines(
+                lambda size: self.aws_chunk_header_size(size, signed) + 2
+            )
+            + self.aws_chunk_header_size(0, signed)
+            + self.trailer_size(trailer_headers, ":")
+            + (_TRAILER_SIGNATURE_LINE_SIZE if trailer_signature else 0)
+            + 2
+        )
+
+
+def as_chunking_plan(payload_size: int, chunking: int | ChunkingPlan) -> ChunkingPlan:
+    """Accept either a ready plan or, as the test cases pass, a chunk count"""
+    if isinstance(chunking, ChunkingPlan):
+        if chunking.payload_size != payload_size:
+            raise ValueError(
+                f"Plan for {chunking.payload_size} bytes used for {payload_size} bytes"
+            )
+        return chunking
+    return ChunkingPlan.from_chunk_count(payload_size, chunking)
@@ -0,0 +1,325 @@
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from math import erfc, exp, lgamma, log, log1p, sqrt
+from typing import Any
+from tabulate import tabulate
+from .results import iter_result_records
+
+DEFAULT_ALPHA = 0.01
+DEFAULT_MIN_CHANGE = 0.05
+# Above this many degrees of freedom the t distribution is replaced by the normal one
+_NORMAL_APPROXIMATION_DF = 1000
+
+
+@dataclass
+class RunningStats:
+    """
+    Mean and variance updated one sample at a time (Welford's algorithm), so files with
+    millions of rows are summarised in a single pass and constant memory per case
+    """
+
+    count: int = 0
+    mean: float = 0.0
+    squared_deviations: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, 0 with fewer than two samples"""
+        if self.count < 2:
+            return 0.0
+        return self.squared_deviations / (self.count - 1)
+
+
+@dataclass
+class CaseSummary:
+    statuses: Counter = field(default_factory=Counter)
+    latency_ms: RunningStats = field(default_factory=RunningStats)
+    throughput_mbps: RunningStats = field(default_factory=RunningStats)
+
+    def add(self, record: dict[str, Any]) -> None:
+        self.statuses[str(record["result"])] += 1
+        latency_ms = record.get("latency_ms")
+        if latency_ms is None:
+            return
+        self.latency_ms.add(latency_ms)
+        transferred = (record.get("bytes_sent") or 0) + (
+            record.get("bytes_received") or 0
+        )
+        if latency_ms > 0 and transferred:
+            self.throughput_mbps.add(transferred / latency_ms / 1000)
+
+    @property
+    def status(self) -> str:
+        """Most common result of the case"""
+        return self.statuses.most_common(1)[0][0]
+
+
+def summarize_results(path: str) -> dict[str, CaseSummary]:
+    summaries: dict[str, CaseSummary] = {}
+    for record in iter_result_records(path):
+        summaries.setdefault(record["case"], CaseSummary()).add(record)
+    return summaries
+
+
+def _beta_continued_fraction(a: float, b: float, x: float) -> float:
+    # Lentz's method, as in Numerical Recipes' betacf
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, 10_000):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            fraction *= c * d
+        if abs(c * d - 1.0) < 1e-14:
+            break
+    return fraction
+
+
+def _regularized_incomplete_beta(a: float, b: float, x: float) -> float:
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * log(x) + b * log1p(-x))
+    # The continued fraction converges quickly only on this side of the mean
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _beta_continued_fraction(a, b, x) / a
+    return 1.0 - front * _beta_continued_fraction(b, a, 1.0 - x) / b
+
+
+def welch_t_test(baseline: RunningStats, candidate: RunningStats) -> float | None:
+    """
+    Two-sided p-value of Welch's t-test for a difference between the two means, which does not
+    assume equal variances. None with fewer than two samples on either side
+    """
+    if baseline.count < 2 or candidate.count < 2:
+        return None
+    baseline_error = baseline.variance / baseline.count
+    candidate_error = candidate.variance / candidate.count
+    standard_error = sqrt(baseline_error + candidate_error)
+    if standard_error == 0.0:
+        return 1.0 if baseline.mean == candidate.mean else 0.0
+    t = (candidate.mean - baseline.mean) / standard_error
+    df = (baseline_error + candidate_error) ** 2 / (
+        baseline_error**2 / (baseline.count - 1)
+        + candidate_error**2 / (candidate.count - 1)
+    )
+    if df > _NORMAL_APPROXIMATION_DF:
+        return erfc(abs(t) / sqrt(2))
+    return _regularized_incomplete_beta(df / 2, 0.5, df / (df + t * t))
+
+
+@dataclass
+class MetricComparison:
+    metric: str
+    baseline: RunningStats
+    candidate: RunningStats
+    higher_is_better: bool
+    p_value: float | None
+
+    @property
+    def change(self) -> float | None:
+        """Relative change of the mean, positive when the candidate's is higher"""
+        if (
+            not self.baseline.count
+            or not self.candidate.count
+            or not self.baseline.mean
+        ):
+            return None
+        return (self.candidate.mean - self.baseline.mean) / self.baseline.mean
+
+    def regressed(self, alpha: float, min_change: float) -> bool:
+        """Worse by at least min_change, and significantly so at level alpha"""
+        if self.change is None or self.p_value is None or self.p_value >= alpha:
+            return False
+        worsening = -self.change if self.higher_is_better else self.change
+        return worsening >= min_change
+
+
+@dataclass
+class CaseComparison:
+    case: str
+    baseline: CaseSummary | None
+    candidate: CaseSummary | None
+    metrics: list[MetricComparison] = field(default_factory=list)
+
+    @property
+    def status_changed(self) -> bool:
+        return (
+            self.baseline is not None
+            and self.candidate is not None
+            and self.baseline.status != self.candidate.status
+        )
+
+    def regressions(self, alpha: float, min_change: float) -> list[MetricComparison]:
+        return [
+            metric for metric in self.metrics if metric.regressed(alpha, min_change)
+        ]
+
+    def failed(self, alpha: float, min_change: float) -> bool:
+        """Whether this case should fail the comparison; cases only in the candidate never do"""
+        return (
+            self.candidate is None
+            or self.status_changed
+            or bool(self.regressions(alpha, min_change))
+        )
+
+
+def compare_results(baseline_path: str, candidate_path: str) -> list[CaseComparison]:
+    """Match the cases of two result files by name, in the baseline's order"""
+    baseline = summarize_results(baseline_path)
+    candidate = summarize_results(candidate_path)
+    comparisons = []
+    for case in [*baseline, *(case for case in candidate if case not in baseline)]:
+        comparison = CaseComparison(case, baseline.get(case), candidate.get(case))
+        if comparison.baseline is not None and comparison.candidate is not None:
+            for metric, higher_is_better in (
+                ("latency_ms", False),
+                ("throughput_mbps", True),
+            ):
+                baseline_stats = getattr(comparison.baseline, metric)
+                candidate_stats = getattr(comparison.candidate, metric)
+                comparison.metrics.append(
+                    MetricComparison(
+                        metric,
+                        baseline_stats,
+                        candidate_stats,
+                        higher_is_better,
+                        welch_t_test(baseline_stats, candidate_stats),
+                    )
+                )
+        comparisons.append(comparison)
+    return comparisons
+
+
+def _verdict(comparison: CaseComparison, alpha: float, min_change: float) -> str:
+    if comparison.baseline is None:
+        return "new case"
+    if comparison.candidate is None:
+        return "missing from candidate"
+    verdicts = []
+    if comparison.status_changed:
+        verdicts.append(
+            f"status {comparison.baseline.status} -> {comparison.candidate.status}"
+        )
+    verdicts.extend(
+        f"{metric.metric} regressed"
+        for metric in comparison.regressions(alpha, min_change)
+    )
+    return ", ".join(verdicts) or "ok"
+
+
+def _metric_cells(comparison: CaseComparison, metric_name: str) -> tuple[str, ...]:
+    metric = next(
+        (metric for metric in comparison.metrics if metric.metric == metric_name), None
+    )
+    if metric is None or not metric.baseline.count or not metric.candidate.count:
+        return ("-", "-", "-")
+    return (
+        f"{metric.baseline.mean:.2f} -> {metric.candidate.mean:.2f}",
+        f"{100 * metric.change:+.1f}%" if metric.change is not None else "-",
+        f"{metric.p_value:.3g}" if metric.p_value is not None else "-",
+    )
+
+
+def format_comparison(
+    comparisons: list[CaseComparison],
+    alpha: float = DEFAULT_ALPHA,
+    min_change: float = DEFAULT_MIN_CHANGE,
+    show_all: bool = False,
+) -> str:
+    header_text = (
+        "Case",
+        "Samples",
+        "Latency (ms)",
+        "Change",
+        "p",
+        "Throughput (MB/s)",
+        "Change",
+        "p",
+        "Verdict",
+    )
+    rows = [
+        (
+            comparison.case,
+            f"{sum(comparison.baseline.statuses.values()) if comparison.baseline else 0}"
+            f" / {sum(comparison.candidate.statuses.values()) if comparison.candidate else 0}",
+            *_metric_cells(comparison, "latency_ms"),
+            *_metric_cells(comparison, "throughput_mbps"),
+            _verdict(comparison, alpha, min_change),
+        )
+        for comparison in comparisons
+        if show_all
+        or comparison.baseline is None
+        or comparison.failed(alpha, min_change)
+    ]
+    failures = sum(comparison.failed(alpha, min_change) for comparison in comparisons)
+    summary = (
+        f"{len(comparisons)} cases compared, {failures} failed "
+        f"(alpha={alpha:g}, minimum change {100 * min_change:g}%)"
+    )
+    if not rows:
+        return summary
+    return tabulate(rows, headers=header_text) + "\n\n" + summary
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m proxy_testing.compare",
+        description=(
+            "Compare two result files written with --results. Exits with 1 when a case "
+            "changed status, went missing or regressed significantly"
+        ),
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=DEFAULT_ALPHA,
+        help="Significance level of Welch's t-test",
+    )
+    parser.add_argument(
+        "--min-change",
+        type=float,
+        default=DEFAULT_MIN_CHANGE,
+        help="Smallest relative slowdown treated as a regression, e.g. 0.05 for 5%%",
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="List every case, not only flagged ones"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = _parse_args()
+    try:
+        case_comparisons = compare_results(cli_args.baseline, cli_args.candidate)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Could not read results: {e}")
+    print(
+        format_comparison(
+            case_comparisons, cli_args.alpha, cli_args.min_change, cli_args.all
+        )
+    )
+    raise SystemExit(
+        any(
+            comparison.failed(cli_args.alpha, cli_args.min_change)
+            for comparison in case_comparisons
+        )
+    )
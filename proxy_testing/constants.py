@@ -1,13 +1,12 @@
-from botocore.credentials import Credentials
-from botocore.auth import SigV4Auth
-
 TEST_CONTENT_TYPE = "text/plain;charset=utf-8"
 DEFAULT_REGION = "us-east-1"
 
 AWS_TIMESTAMP_FORMAT = "%Y%m%dT%H%M%SZ"
-HEX_SIGNATURE_SIZE = len(
-    SigV4Auth(Credentials("foo", "foo"), "s3", DEFAULT_REGION)._sign(b"a", "b", True)
-)
+EMPTY_SHA256 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+# Connections kept alive per host by the shared requests session, as many as the raw pool keeps
+DEFAULT_HTTP_POOL_SIZE = 32
+# Hex-encoded HMAC-SHA256, as produced by SigV4 signing
+HEX_SIGNATURE_SIZE = 64
 LONG_TEXT = (
     "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et "
     "dolore magna aliqua. Viverra aliquet eget sit amet tellus cras adipiscing. Viverra mauris in aliquam sem "
@@ -1,10 +1,59 @@
-from dataclasses import dataclass
-from functools import cached_property
+from dataclasses import dataclass, field
 import datetime as dt
-from botocore.awsrequest import AWSRequest
-from botocore.auth import SigV4Auth
-from .constants import AWS_TIMESTAMP_FORMAT
-import boto3
+import threading
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+from .constants import AWS_TIMESTAMP_FORMAT, DEFAULT_HTTP_POOL_SIZE
+from .s3_clients import S3ClientProvider
+
+if TYPE_CHECKING:
+    from botocore.auth import SigV4Auth
+    from botocore.awsrequest import AWSRequest
+    from botocore.client import BaseClient
+    from .sessions import PooledSession
+    from .throttling import UploadThrottle
+
+
+class KnownBuckets:
+    """
+    Thread-safe record of buckets known to exist. Concurrent callers ensuring the same bucket
+    share a single creation attempt
+    """
+
+    def __init__(self):
+        self._known: set[str] = set()
+        self._lock = threading.Lock()
+        self._bucket_locks: dict[str, threading.Lock] = {}
+
+    def __contains__(self, bucket_name: str) -> bool:
+        return bucket_name in self._known
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._known))
+
+    def mark_existing(self, bucket_names: Iterable[str]) -> None:
+        with self._lock:
+            self._known.update(bucket_names)
+
+    def ensure(self, bucket_name: str, create_if_missing: Callable[[], None]) -> None:
+        if bucket_name in self._known:
+            return
+        with self._lock:
+            bucket_lock = self._bucket_locks.setdefault(bucket_name, threading.Lock())
+        with bucket_lock:
+            if bucket_name in self._known:
+                return
+            create_if_missing()
+            self._known.add(bucket_name)
+
+    def invalidate(self, bucket_name: str | None = None) -> None:
+        with self._lock:
+            if bucket_name is None:
+                self._known.clear()
+            else:
+                self._known.discard(bucket_name)
+
+
+_HTTP_SESSION_LOCK = threading.Lock()
 
 
 @dataclass
@@ -12,17 +61,66 @@ class RuntimeConfig:
     s3_endpoint: str
     access_key: str
     secret_access_key: str
+    # Send uploads as a slow client would; only the raw HTTP clients can pace their writes
+    upload_throttle: "UploadThrottle | None" = None
+    # Connections kept alive per host by http_session; retries are off so results stay honest
+    http_pool_size: int = DEFAULT_HTTP_POOL_SIZE
+    http_retries: int = 0
+    # Connections kept by the shared boto3 client used for bucket setup and verification
+    s3_max_pool_connections: int = DEFAULT_HTTP_POOL_SIZE
+    known_buckets: KnownBuckets = field(
+        default_factory=KnownBuckets, init=False, repr=False, compare=False
+    )
+    s3_clients: S3ClientProvider = field(init=False, repr=False, compare=False)
+    _http_session: "PooledSession | None" = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
-    @cached_property
-    def s3_client(self) -> boto3.client:
-        return boto3.client(
-            "s3",
-            endpoint_url=self.s3_endpoint,
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_access_key,
-            verify=False,
+    def __post_init__(self):
+        # Only builds the client on first use, so configs stay cheap to create and copy
+        self.s3_clients = S3ClientProvider(
+            self.s3_endpoint,
+            self.access_key,
+            self.secret_access_key,
+            self.s3_max_pool_connections,
         )
 
+    @property
+    def http_session(self) -> "PooledSession":
+        """requests session shared by every case run with this config"""
+        if self._http_session is None:
+            with _HTTP_SESSION_LOCK:
+                if self._http_session is None:
+                    # requests is only imported by the cases that use it, keeping startup fast
+                    from .sessions import PooledSession
+
+                    self._http_session = PooledSession(
+                        self.http_pool_size, self.http_retries
+                    )
+        return self._http_session
+
+    @property
+    def s3_client(self) -> "BaseClient":
+        return self.s3_clients.client
+
+    def __getstate__(self) -> dict:
+        # Drop cached clients so configs can be shipped to worker processes
+        return {
+            "s3_endpoint": self.s3_endpoint,
+            "access_key": self.access_key,
+            "secret_access_key": self.secret_access_key,
+            "upload_throttle": self.upload_throttle,
+            "http_pool_size": self.http_pool_size,
+            "http_retries": self.http_retries,
+            "s3_max_pool_connections": self.s3_max_pool_connections,
+            "known_buckets": list(self.known_buckets),
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        known_buckets = state.pop("known_buckets", ())
+        self.__init__(**state)
+        self.known_buckets.mark_existing(known_buckets)
+
 
 @dataclass
 class BaseSignedAwsRequest:
@@ -32,8 +130,8 @@ class BaseSignedAwsRequest:
     region: str
     service: str
     signature: str
-    request: AWSRequest
-    signer: SigV4Auth
+    request: "AWSRequest"
+    signer: "SigV4Auth"
 
     @property
     def key_path(self) -> str:
@@ -44,6 +142,41 @@ class BaseSignedAwsRequest:
         return self.request_timestamp.strftime(AWS_TIMESTAMP_FORMAT)
 
 
+@dataclass
+class PhaseTimings:
+    """
+    Wall-clock seconds a test case spent in each phase, summed over every request it made. A
+    phase that never happened (e.g. TLS on a plain HTTP or reused connection) is None. ttfb and
+    response are measured from the first byte of the request being written. continue_wait is the
+    time spent waiting for 100 Continue, and continue_outcome how the last request sent with
+    Expect: 100-continue was answered
+    """
+
+    signing: float | None = None
+    encoding: float | None = None
+    connect: float | None = None
+    tls: float | None = None
+    continue_wait: float | None = None
+    ttfb: float | None = None
+    response: float | None = None
+    verification: float | None = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    continue_outcome: str | None = None
+
+
+PHASES = (
+    "signing",
+    "encoding",
+    "connect",
+    "tls",
+    "continue_wait",
+    "ttfb",
+    "response",
+    "verification",
+)
+
+
 @dataclass
 class TestResult:
     request_content: str
@@ -53,3 +186,6 @@ class TestResult:
     transfer_encoding_header: str | None
     content_encoding_header: str | None
     result: str | int
+    timings: PhaseTimings | None = None
+    # Seconds from the start of the test case (its scheduled start under load) to its result
+    elapsed: float | None = None
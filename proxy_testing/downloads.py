@@ -0,0 +1,482 @@
+import base64
+import hashlib
+import io
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass
+from uuid import uuid4
+from tabulate import tabulate
+from .constants import EMPTY_SHA256
+from .datamodel import RuntimeConfig, TestResult
+from .payloads import GeneratedPayload, format_size
+from .raw_http import (
+    RawHttpConnectionPool,
+    RawHttpResponse,
+    ResponseBodySink,
+    get_default_pool,
+)
+from .request_helpers import build_request
+from .s3_helpers import ensure_bucket_exists
+from .streams import (
+    DEFAULT_READ_SIZE,
+    IterableReader,
+    PayloadInput,
+    PayloadSource,
+    as_payload_source,
+    iter_source_slices,
+    slice_source,
+    source_length,
+)
+from .test_cases import get_response_or_exc_info
+from .timings import record_phases
+
+DOWNLOAD_MODES = ("full", "range", "multi-range", "parallel-range", "chunked")
+TRAILER_CHECKSUM_HEADER = "x-amz-checksum-sha256"
+_CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+_BOUNDARY_PATTERN = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+
+ByteRange = tuple[int, int]
+
+
+class HashingSink(ResponseBodySink):
+    """Hash a response body as it arrives instead of buffering it"""
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def __call__(self, data: memoryview) -> None:
+        self.hasher.update(data)
+        self.size += len(data)
+
+
+@dataclass
+class ReceivedPart:
+    content_range: str | None
+    sink: HashingSink
+
+
+class DownloadSink(HashingSink):
+    """
+    Body sink for GETs of several byte ranges. A multipart/byteranges response is split into its
+    parts, each hashed as it arrives; only the tail that might hold a boundary split across reads
+    is kept between calls. Any other response is hashed as a whole
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parts: list[ReceivedPart] = []
+        self._delimiter: bytes | None = None
+        # The first delimiter may open the body without a preceding CRLF
+        self._buffer = bytearray(b"\r\n")
+        self._state = "preamble"
+
+    def start(self, response: RawHttpResponse) -> None:
+        content_type = response.get_header("Content-Type") or ""
+        boundary = _BOUNDARY_PATTERN.search(content_type)
+        if content_type.lower().startswith("multipart/byteranges") and boundary:
+            self._delimiter = b"\r\n--" + boundary[1].encode("latin-1")
+
+    @property
+    def complete(self) -> bool:
+        return self._delimiter is None or self._state == "done"
+
+    def __call__(self, data: memoryview) -> None:
+        if self._delimiter is None:
+            super().__call__(data)
+            return
+        self._buffer += data
+        while self._advance():
+            pass
+
+    def _advance(self) -> bool:
+        if self._state in ("preamble", "data"):
+            index = self._buffer.find(self._delimiter)
+            if index < 0:
+                kept = min(len(self._buffer), len(self._delimiter) - 1)
+                if self._state == "data":
+                    with memoryview(self._buffer) as view:
+                        self.parts[-1].sink(view[: len(self._buffer) - kept])
+                del self._buffer[: len(self._buffer) - kept]
+                return False
+            if self._state == "data":
+                with memoryview(self._buffer) as view:
+                    self.parts[-1].sink(view[:index])
+            del self._buffer[: index + len(self._delimiter)]
+            self._state = "delimiter"
+            return True
+        if self._state == "delimiter":
+            if len(self._buffer) < 2:
+                return False
+            if self._buffer[:2] == b"--":
+                self._buffer.clear()
+                self._state = "done"
+                return False
+            self._state = "headers"
+            return True
+        if self._state == "headers":
+            headers_end = self._buffer.find(b"\r\n\r\n")
+            if headers_end < 0:
+                return False
+            header_lines = bytes(self._buffer[:headers_end]).decode("latin-1")
+            del self._buffer[: headers_end + 4]
+            content_range = None
+            for header_line in header_lines.split("\r\n"):
+                name, _, value = header_line.partition(":")
+                if name.strip().lower() == "content-range":
+                    content_range = value.strip()
+            self.parts.append(ReceivedPart(content_range, HashingSink()))
+            self._state = "data"
+            return True
+        return False
+
+
+def _range_header(ranges: list[ByteRange]) -> str:
+    return "bytes=" + ",".join(f"{start}-{end}" for start, end in ranges)
+
+
+def _middle_range(size: int) -> ByteRange:
+    start = size // 4
+    return start, max(start, size - size // 4 - 1)
+
+
+def _edge_ranges(size: int) -> list[ByteRange]:
+    edge = max(1, size // 8)
+    return [(0, edge - 1), (size - edge, size - 1)]
+
+
+def split_ranges(size: int, count: int) -> list[ByteRange]:
+    """Split an object into at most count contiguous ranges of about the same size"""
+    range_size = max(1, -(-size // count))
+    return [
+        (start, min(start + range_size, size) - 1)
+        for start in range(0, size, range_size)
+    ]
+
+
+def _expected_sha256(payload: PayloadSource, byte_range: ByteRange) -> bytes:
+    start, end = byte_range
+    hasher = hashlib.sha256()
+    for data in iter_source_slices(
+        slice_source(payload, start, end - start + 1), DEFAULT_READ_SIZE
+    ):
+        hasher.update(data)
+    return hasher.digest()
+
+
+class ExpectedDigests:
+    """
+    SHA-256 of byte ranges of a payload, each hashed once on first use. Sweeps precompute the
+    ranges a download asks for so that regenerating the payload is not timed with it
+    """
+
+    def __init__(self, payload: PayloadSource):
+        self.payload = payload
+        self.size = source_length(payload)
+        self._digests: dict[ByteRange, bytes] = {}
+
+    def precompute(self, ranges: list[ByteRange]) -> None:
+        for byte_range in [(0, self.size - 1), *ranges]:
+            self(byte_range)
+
+    def __call__(self, byte_range: ByteRange) -> bytes:
+        if byte_range not in self._digests:
+            self._digests[byte_range] = _expected_sha256(self.payload, byte_range)
+        return self._digests[byte_range]
+
+
+def _check_part(
+    expected: ExpectedDigests,
+    content_range: str | None,
+    sink: HashingSink,
+    requested: list[ByteRange],
+) -> None:
+    match = _CONTENT_RANGE_PATTERN.fullmatch(content_range or "")
+    assert match is not None, f"Unexpected Content-Range {content_range}"
+    received = int(match[1]), int(match[2])
+    assert received in requested, f"Got {content_range}, asked for {requested}"
+    assert (
+        sink.size == received[1] - received[0] + 1
+    ), f"Got {sink.size} bytes for {content_range}"
+    assert sink.hasher.digest() == expected(
+        received
+    ), f"Unexpected contents in {content_range}"
+
+
+def _check_download(
+    expected: ExpectedDigests,
+    response: RawHttpResponse,
+    sink: HashingSink,
+    requested: list[ByteRange] | None = None,
+) -> int:
+    """
+    Check a GET response against the payload. Servers may ignore Range, as S3 does for several
+    ranges, so a 200 is checked against the whole object
+    """
+    size = expected.size
+    if response.status_code == 200:
+        assert sink.size == size, f"Got {sink.size} bytes, expected {size}"
+        assert sink.hasher.digest() == expected((0, size - 1)), "Unexpected contents"
+        trailer = response.get_trailer(TRAILER_CHECKSUM_HEADER)
+        if trailer is not None:
+            assert trailer == base64.b64encode(sink.hasher.digest()).decode(
+                "ascii"
+            ), f"Unexpected {TRAILER_CHECKSUM_HEADER} trailer {trailer}"
+    elif response.status_code == 206:
+        assert requested, "Got 206 Partial Content without asking for a range"
+        if isinstance(sink, DownloadSink) and sink.parts:
+            assert sink.complete, "multipart/byteranges response ended early"
+            for part in sink.parts:
+                _check_part(expected, part.content_range, part.sink, requested)
+        else:
+            _check_part(expected, response.get_header("Content-Range"), sink, requested)
+    return response.status_code
+
+
+def _get(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    sink: HashingSink,
+    pool: RawHttpConnectionPool,
+    ranges: list[ByteRange] | None = None,
+    trailers: bool = False,
+) -> RawHttpResponse:
+    def _prepare_headers(headers: dict[str, str]) -> None:
+        headers["X-Amz-Content-Sha256"] = EMPTY_SHA256
+        if ranges:
+            headers["Range"] = _range_header(ranges)
+
+    built_request = build_request(runtime_config, bucket, key, "GET", _prepare_headers)
+    headers = dict(built_request.request.headers.items())
+    if trailers:
+        # Hop-by-hop, so it is added after signing like Expect
+        headers["TE"] = "trailers"
+    return pool.request("GET", built_request.request.url, headers, b"", body_sink=sink)
+
+
+def _get_and_check(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    expected: ExpectedDigests,
+    pool: RawHttpConnectionPool,
+    ranges: list[ByteRange] | None = None,
+    trailers: bool = False,
+) -> int:
+    sink = DownloadSink()
+    response = _get(runtime_config, bucket, key, sink, pool, ranges, trailers)
+    return _check_download(expected, response, sink, ranges)
+
+
+def request_count(mode: str, size: int, range_count: int) -> int:
+    """GET requests a download in this mode is made of"""
+    return len(split_ranges(size, range_count)) if mode == "parallel-range" else 1
+
+
+def _requested_ranges(mode: str, size: int, range_count: int) -> list[ByteRange]:
+    if mode in ("full", "chunked"):
+        return []
+    if not size:
+        raise ValueError(f"Cannot download ranges of an empty object ({mode})")
+    if mode == "range":
+        return [_middle_range(size)]
+    if mode == "multi-range":
+        return _edge_ranges(size)
+    if mode == "parallel-range":
+        return split_ranges(size, range_count)
+    raise ValueError(f"Unknown download mode {mode}")
+
+
+def _download_object(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    expected: ExpectedDigests,
+    mode: str,
+    range_count: int,
+    pool: RawHttpConnectionPool | None = None,
+) -> int:
+    pool = pool or get_default_pool()
+    ranges = _requested_ranges(mode, expected.size, range_count)
+    if mode in ("full", "chunked"):
+        return _get_and_check(
+            runtime_config, bucket, key, expected, pool, trailers=mode == "chunked"
+        )
+    if mode != "parallel-range":
+        return _get_and_check(runtime_config, bucket, key, expected, pool, ranges)
+    # Ranges run in the caller's context so that their timings are recorded
+    context = copy_context()
+    with ThreadPoolExecutor(max_workers=range_count) as executor:
+        statuses = set(
+            executor.map(
+                lambda byte_range: context.copy().run(
+                    _get_and_check,
+                    runtime_config,
+                    bucket,
+                    key,
+                    expected,
+                    pool,
+                    [byte_range],
+                ),
+                ranges,
+            )
+        )
+    assert len(statuses) == 1, f"Ranges were answered with {sorted(statuses)}"
+    return statuses.pop()
+
+
+def _put_object(
+    runtime_config: RuntimeConfig, bucket: str, key: str, payload: PayloadSource
+) -> None:
+    # Set up with boto3 rather than a raw client so that a failure points at the GET. It still
+    # goes to the same endpoint as the download
+    runtime_config.s3_client.upload_fileobj(
+        io.BufferedReader(
+            IterableReader(iter_source_slices(payload, DEFAULT_READ_SIZE))
+        ),
+        bucket,
+        key,
+    )
+
+
+@get_response_or_exc_info
+def _download(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    mode: str,
+    range_count: int,
+) -> int:
+    ensure_bucket_exists(runtime_config, bucket)
+    payload = as_payload_source(data)
+    _put_object(runtime_config, bucket, key, payload)
+    return _download_object(
+        runtime_config, bucket, key, ExpectedDigests(payload), mode, range_count
+    )
+
+
+def download(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    mode: str = "full",
+    range_count: int = 4,
+) -> TestResult:
+    """
+    Upload data, then GET it back through the proxy in the given mode, hashing the response as
+    it streams in. parallel-range fetches range_count ranges concurrently
+    """
+    return TestResult(
+        f"download-{mode}",
+        False,
+        False,
+        "empty hash",
+        "not present",
+        "not present",
+        _download(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            mode=mode,
+            range_count=range_count,
+        ),
+    )
+
+
+@dataclass
+class DownloadSweepResult:
+    mode: str
+    payload_size: int
+    requests: int
+    result: str | int
+    seconds: float
+    bytes_received: int
+    ttfb_seconds: float | None
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_received / self.seconds / 1_000_000 if self.seconds else 0.0
+
+
+def run_download_sweep(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    payload_sizes: list[int],
+    modes: list[str],
+    range_count: int = 8,
+) -> list[DownloadSweepResult]:
+    """
+    Upload one generated payload of every size, then download it in every mode, reporting
+    throughput on the wire and the mean time to first byte of its requests
+    """
+    ensure_bucket_exists(runtime_config, bucket)
+    results = []
+    for payload_size in payload_sizes:
+        payload = GeneratedPayload(payload_size)
+        key = uuid4().hex
+        _put_object(runtime_config, bucket, key, payload)
+        expected = ExpectedDigests(payload)
+        for mode in modes:
+            try:
+                expected.precompute(_requested_ranges(mode, payload_size, range_count))
+            except ValueError:
+                # Left for the download to report as its result
+                pass
+            started = time.perf_counter()
+            with record_phases() as recorder:
+                result = get_response_or_exc_info(_download_object)(
+                    runtime_config, bucket, key, expected, mode, range_count
+                )
+            seconds = time.perf_counter() - started
+            timings = recorder.timings()
+            requests = request_count(mode, payload_size, range_count)
+            results.append(
+                DownloadSweepResult(
+                    mode=mode,
+                    payload_size=payload_size,
+                    requests=requests,
+                    result=result,
+                    seconds=seconds,
+                    bytes_received=timings.bytes_received,
+                    ttfb_seconds=(
+                        timings.ttfb / requests if timings.ttfb is not None else None
+                    ),
+                )
+            )
+    return results
+
+
+def format_download_sweep_results(results: list[DownloadSweepResult]) -> str:
+    return tabulate(
+        [
+            (
+                result.mode,
+                format_size(result.payload_size),
+                result.requests,
+                result.result,
+                f"{result.seconds:.3f}",
+                f"{result.megabytes_per_second:.1f}",
+                (
+                    f"{result.ttfb_seconds * 1000:.1f}"
+                    if result.ttfb_seconds is not None
+                    else "-"
+                ),
+            )
+            for result in results
+        ],
+        headers=(
+            "Mode",
+            "Payload size",
+            "Requests",
+            "Result",
+            "Seconds",
+            "MB/s",
+            "Mean TTFB (ms)",
+        ),
+    )
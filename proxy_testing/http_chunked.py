@@ -1,60 +1,102 @@
-from math import ceil
 from typing import Iterator
+from .checksums import StreamingChecksum, iter_checksummed
+from .chunking import ChunkingPlan, as_chunking_plan
+from .streams import (
+    FilePayload,
+    FileRegion,
+    PayloadInput,
+    SizedBody,
+    as_payload_source,
+    iter_source_slices,
+    source_length,
+)
 
 
 def get_http_chunked_content_length(
     unchunked_data_length: int,
-    chunk_count: int,
+    chunking: int | ChunkingPlan,
 ) -> int:
-    chunk_size = ceil(unchunked_data_length / chunk_count)
-    penultimate_chunk_size = unchunked_data_length - (chunk_size * (chunk_count - 1))
-    return (
-        # Data length
-        unchunked_data_length
-        +
-        # Main data chunks - 1 * the size of the chunk as a hex string
-        ((chunk_count - 1) * len(f"{chunk_size:x}"))
-        +
-        # Size of the penultimate chunk as a hex string
-        len(f"{penultimate_chunk_size:x}")
-        +
-        # Size of the last chunk ("0", a 1 character hex string)
-        1
-        +
-        # \r\n for each chunk's header, including the final one
-        # another \r\n for each chunk after its data, including the final one
-        4 * (chunk_count + 1)
-    )
+    return as_chunking_plan(unchunked_data_length, chunking).http_chunked_length()
 
 
 def get_http_encoded_chunks_iter(
-    data_to_encode: str, chunk_count: int
-) -> Iterator[bytes]:
-    data_bytes = data_to_encode.encode("utf-8")
-    chunk_size = ceil(len(data_bytes) / chunk_count)
-    for chunk_pos in range(chunk_count):
-        yield data_bytes[chunk_pos * chunk_size : (chunk_pos + 1) * chunk_size]
+    data_to_encode: PayloadInput | SizedBody, chunking: int | ChunkingPlan
+) -> Iterator[bytes | memoryview]:
+    if not isinstance(data_to_encode, SizedBody):
+        data_to_encode = as_payload_source(data_to_encode)
+    plan = as_chunking_plan(source_length(data_to_encode), chunking)
+    yield from iter_source_slices(data_to_encode, plan.chunk_size)
 
 
-def get_http_encoded_chunks_raw(
-    data_to_encode: str,
-    chunk_count: int,
+def _iter_chunk_data(
+    data_to_encode: PayloadInput | SizedBody,
+    chunking: int | ChunkingPlan,
+    trailer_checksum: StreamingChecksum | None = None,
+) -> Iterator[bytes | memoryview | FileRegion]:
+    if not isinstance(data_to_encode, SizedBody):
+        data_to_encode = as_payload_source(data_to_encode)
+        if trailer_checksum is not None:
+            # Checksummed data has to pass through memory anyway, so no FileRegions
+            yield from iter_checksummed(
+                get_http_encoded_chunks_iter(data_to_encode, chunking),
+                trailer_checksum,
+            )
+            return
+    if isinstance(data_to_encode, FilePayload):
+        # File chunks stay on disk for the raw clients to sendfile()
+        plan = as_chunking_plan(len(data_to_encode), chunking)
+        yield from data_to_encode.iter_regions(plan.chunk_size)
+    else:
+        yield from get_http_encoded_chunks_iter(data_to_encode, chunking)
+
+
+def iter_http_encoded_chunks_raw(
+    data_to_encode: PayloadInput | SizedBody,
+    chunking: int | ChunkingPlan,
     extra_chunk_header_content: str = "",
     trailer_headers: dict[str, str] | None = None,
-) -> bytes:
-    def _get_header_for_chunk(chunk: bytes) -> bytes:
-        return f"{len(chunk):x}{extra_chunk_header_content}\r\n".encode("utf-8")
+    trailer_checksum: StreamingChecksum | None = None,
+) -> Iterator[bytes | memoryview | FileRegion]:
+    """
+    Yield the chunked transfer encoding of data_to_encode as separate buffers: every chunk's
+    header, its data (a memoryview or FileRegion, never copied) and its CRLF, then the final
+    chunk with any trailers. Raw clients send these with vectored writes. trailer_checksum is
+    fed the payload as it is chunked, unless data_to_encode is already encoded (a SizedBody)
+    and its encoder feeds it, and is added to the trailers
+    """
+    header_suffix = f"{extra_chunk_header_content}\r\n"
+    header_size = -1
+    chunk_header = b""
 
-    result = b""
-    for data_chunk in get_http_encoded_chunks_iter(data_to_encode, chunk_count):
-        result += _get_header_for_chunk(data_chunk)
-        result += data_chunk + b"\r\n"
+    for data_chunk in _iter_chunk_data(data_to_encode, chunking, trailer_checksum):
+        # All chunks but the last share a size, so their header is built once
+        if len(data_chunk) != header_size:
+            header_size = len(data_chunk)
+            chunk_header = f"{header_size:x}{header_suffix}".encode("utf-8")
+        yield chunk_header
+        yield data_chunk
+        yield b"\r\n"
 
     # Final 0-sized chunk
-    result += _get_header_for_chunk(b"")
+    final_chunk = [f"0{header_suffix}".encode("utf-8")]
+    if trailer_checksum is not None:
+        trailer_headers = {**(trailer_headers or {}), **trailer_checksum.trailer()}
     if trailer_headers:
         for header_name, header_value in trailer_headers.items():
-            result += f"{header_name}: {header_value}\r\n".encode("utf-8")
-    result += b"\r\n"
+            final_chunk.append(f"{header_name}: {header_value}\r\n".encode("utf-8"))
+    final_chunk.append(b"\r\n")
+    yield b"".join(final_chunk)
+
 
-    return result
+def get_http_encoded_chunks_raw(
+    data_to_encode: PayloadInput | SizedBody,
+    chunking: int | ChunkingPlan,
+    extra_chunk_header_content: str = "",
+    trailer_headers: dict[str, str] | None = None,
+) -> bytes:
+    return b"".join(
+        piece.read() if isinstance(piece, FileRegion) else piece
+        for piece in iter_http_encoded_chunks_raw(
+            data_to_encode, chunking, extra_chunk_header_content, trailer_headers
+        )
+    )
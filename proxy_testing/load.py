@@ -0,0 +1,277 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
+from uuid import uuid4
+from tabulate import tabulate
+from .checksums import DEFAULT_CHECKSUM_ALGORITHM
+from .datamodel import RuntimeConfig, TestResult
+from .downloads import download
+from .multipart import multipart_upload
+from .s3_helpers import content_verification
+from .timings import record_phases
+from .test_cases import (
+    EXPECT_CONTINUE_SUFFIX,
+    aws_chunked_upload,
+    aws_chunked_upload_with_chunked_transfer_encoding,
+    aws_chunked_upload_with_signed_trailer,
+    http_chunked_upload,
+    standard_upload,
+    unauthorized_upload,
+)
+
+LoadCase = tuple[str, tuple[Callable[..., TestResult], dict[str, Any]]]
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram in the style of HdrHistogram. Values are recorded in microseconds
+    into buckets whose width grows with magnitude, keeping the relative error of every
+    reported percentile below 2 ** -(sub_bucket_bits - 1)
+    """
+
+    def __init__(self, sub_bucket_bits: int = 8):
+        self._sub_bucket_bits = sub_bucket_bits
+        self._counts: dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us: int | None = None
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self._sub_bucket_bits
+        if shift <= 0:
+            return value
+        return (shift << (self._sub_bucket_bits - 1)) + (value >> shift)
+
+    def _highest_equivalent_value(self, index: int) -> int:
+        sub_bucket_count = 1 << self._sub_bucket_bits
+        if index < sub_bucket_count:
+            return index
+        half_count = sub_bucket_count >> 1
+        shift = (index - half_count) // half_count
+        top = index - (shift << (self._sub_bucket_bits - 1))
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, round(seconds * 1_000_000))
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+        self.max_us = max(self.max_us, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, bucket_count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + bucket_count
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None:
+            self.min_us = (
+                other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+            )
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile_ms(self, percentile: float) -> float:
+        if not self.count:
+            return 0.0
+        target = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent_value(index), self.max_us) / 1000
+        return self.max_us / 1000
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_us / self.count / 1000 if self.count else 0.0
+
+
+@dataclass
+class LoadStats:
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    successes: int = 0
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def requests(self) -> int:
+        return self.successes + sum(self.errors.values())
+
+
+@dataclass
+class LoadReport:
+    duration: float
+    stats: dict[str, LoadStats]
+
+    def rows(self) -> list[tuple]:
+        rows = []
+        for encoding, stats in sorted(self.stats.items()):
+            failures = sum(stats.errors.values())
+            rows.append(
+                (
+                    encoding,
+                    stats.requests,
+                    failures,
+                    (
+                        f"{100 * failures / stats.requests:.2f}%"
+                        if stats.requests
+                        else "-"
+                    ),
+                    f"{stats.requests / self.duration:.1f}" if self.duration else "-",
+                    *(
+                        f"{stats.histogram.percentile_ms(percentile):.2f}"
+                        for percentile in PERCENTILES
+                    ),
+                    f"{stats.histogram.max_us / 1000:.2f}",
+                )
+            )
+        return rows
+
+    def format(self) -> str:
+        header_text = (
+            "Encoding",
+            "Requests",
+            "Errors",
+            "Error rate",
+            "Throughput (req/s)",
+            *(f"p{percentile:g} (ms)" for percentile in PERCENTILES),
+            "max (ms)",
+        )
+        table = tabulate(self.rows(), headers=header_text)
+        error_lines = [
+            f"  {encoding}: {count}x {message}"
+            for encoding, stats in sorted(self.stats.items())
+            for message, count in stats.errors.most_common(3)
+        ]
+        if error_lines:
+            table += "\n\nMost common errors:\n" + "\n".join(error_lines)
+        return table
+
+
+def encoding_label(
+    test_callable: Callable[..., TestResult], args: dict[str, Any]
+) -> str:
+    trailer_suffix = "+trailer" if args.get("trailer_header") else ""
+    continue_suffix = EXPECT_CONTINUE_SUFFIX if args.get("expect_continue") else ""
+    if test_callable is standard_upload:
+        return f"standard{continue_suffix}"
+    if test_callable is unauthorized_upload:
+        return f"standard+wrong-signature{continue_suffix}"
+    if test_callable is aws_chunked_upload:
+        return f"aws-chunked{continue_suffix}"
+    if test_callable is aws_chunked_upload_with_signed_trailer:
+        return f"aws-chunked+signed-trailer-{args.get('checksum_algorithm', DEFAULT_CHECKSUM_ALGORITHM)}"
+    if test_callable is http_chunked_upload:
+        return f"http-chunked{trailer_suffix}{continue_suffix}"
+    if test_callable is aws_chunked_upload_with_chunked_transfer_encoding:
+        return f"aws-chunked+http-chunked{trailer_suffix}{continue_suffix}"
+    if test_callable is multipart_upload:
+        return f"multipart-{args.get('part_encoding', 'plain')}"
+    if test_callable is download:
+        return f"download-{args.get('mode', 'full')}"
+    return getattr(test_callable, "__name__", str(test_callable))
+
+
+# Cases that pass when the upload is rejected with this status
+_EXPECTED_STATUSES: dict[Callable[..., TestResult], int] = {unauthorized_upload: 403}
+
+
+def _classify(
+    test_callable: Callable[..., TestResult], result: TestResult
+) -> str | None:
+    """The error a result counts as, or None if it is what the case expects"""
+    if isinstance(result.result, int):
+        expected_status = _EXPECTED_STATUSES.get(test_callable)
+        if (
+            result.result == expected_status
+            if expected_status is not None
+            else 400 > result.result >= 200
+        ):
+            return None
+        return f"HTTP {result.result}"
+    return str(result.result)[:200]
+
+
+def run_load(
+    runtime_config: RuntimeConfig,
+    cases: Sequence[LoadCase],
+    duration: float,
+    concurrency: int = 16,
+    rate: float | None = None,
+    verify: bool = False,
+    on_result: Callable[[int, TestResult], None] | None = None,
+) -> LoadReport:
+    """
+    Replay cases round-robin for duration seconds. Without a rate, concurrency workers issue
+    requests back to back (closed model). With a rate, requests are started on a fixed schedule
+    and latency is measured from the scheduled start, so queueing delay caused by a slow proxy is
+    included rather than hidden (open model, no coordinated omission). Each result is passed to
+    on_result, if given, with the index of its case and its phase timings
+    """
+    if not cases:
+        raise ValueError("No load cases given")
+    stats: dict[str, LoadStats] = {}
+    stats_lock = threading.Lock()
+
+    def _timed_call(case_index: int, scheduled_at: float) -> None:
+        bucket, (test_callable, args) = cases[case_index % len(cases)]
+        with content_verification(verify):
+            if on_result is None:
+                result = test_callable(runtime_config, bucket, uuid4().hex, **args)
+            else:
+                with record_phases() as recorder:
+                    result = test_callable(runtime_config, bucket, uuid4().hex, **args)
+                result.timings = recorder.timings()
+        latency = time.perf_counter() - scheduled_at
+        if on_result is not None:
+            result.elapsed = latency
+            on_result(case_index % len(cases), result)
+        error = _classify(test_callable, result)
+        with stats_lock:
+            case_stats = stats.setdefault(
+                encoding_label(test_callable, args), LoadStats()
+            )
+            case_stats.histogram.record(latency)
+            if error is None:
+                case_stats.successes += 1
+            else:
+                case_stats.errors[error] += 1
+
+    started = time.perf_counter()
+    deadline = started + duration
+    if rate is None:
+        counter = iter(range(1 << 62))
+        counter_lock = threading.Lock()
+
+        def _closed_loop_worker() -> None:
+            while (now := time.perf_counter()) < deadline:
+                with counter_lock:
+                    case_index = next(counter)
+                _timed_call(case_index, now)
+
+        workers = [
+            threading.Thread(target=_closed_loop_worker, daemon=True)
+            for _ in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        interval = 1 / rate
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            case_index = 0
+            while (scheduled_at := started + case_index * interval) < deadline:
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(_timed_call, case_index, scheduled_at)
+                case_index += 1
+
+    return LoadReport(duration=time.perf_counter() - started, stats=stats)
@@ -0,0 +1,886 @@
+import argparse
+import asyncio
+import base64
+import calendar
+import hashlib
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from http import HTTPStatus
+from typing import AsyncIterator
+from urllib.parse import parse_qsl, unquote, urlsplit
+from uuid import uuid4
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from .aws_chunked import AwsChunkedDecodeError, AwsChunkedDecoder, ChunkSignatureError
+from .checksums import CHECKSUM_ALGORITHMS
+from .constants import AWS_TIMESTAMP_FORMAT
+from .datamodel import RuntimeConfig
+from .signing import ChunkSigner, derive_signing_key
+
+DEFAULT_CREDENTIALS = {"testidentity": "testsecret"}
+STREAM_LIMIT = 256 * 1024
+READ_SIZE = 256 * 1024
+SIGNED_TRAILER_PAYLOAD = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD-TRAILER"
+SIGNED_STREAMING_PAYLOADS = (
+    "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    SIGNED_TRAILER_PAYLOAD,
+)
+_AUTHORIZATION_PATTERN = re.compile(
+    r"AWS4-HMAC-SHA256\s+Credential=(?P<access_key>[^/]+)/(?P<scope>[^,\s]+),\s*"
+    r"SignedHeaders=(?P<signed_headers>[^,\s]+),\s*Signature=(?P<signature>[0-9a-f]+)"
+)
+_S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+# Chunk size of GET responses sent with chunked transfer encoding
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+class S3Error(Exception):
+    def __init__(self, status: int, code: str, message: str = ""):
+        super().__init__(message or code)
+        self.status = status
+        self.code = code
+        self.message = message or code
+
+
+@dataclass
+class StoredObject:
+    data: bytes | None
+    size: int
+    etag: str
+    content_type: str
+    last_modified: float
+    checksums: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class MultipartUpload:
+    bucket: str
+    key: str
+    content_type: str
+    parts: dict[int, StoredObject] = field(default_factory=dict)
+
+
+@dataclass
+class _Request:
+    method: str
+    target: str
+    headers: dict[str, str]
+    trailers: dict[str, str] = field(default_factory=dict)
+    body_consumed: bool = False
+    chunk_signer: ChunkSigner | None = None
+    seed_signature: str | None = None
+
+    @property
+    def path(self) -> str:
+        return unquote(urlsplit(self.target).path)
+
+    @property
+    def query(self) -> dict[str, str]:
+        return dict(parse_qsl(urlsplit(self.target).query, keep_blank_values=True))
+
+    def header(self, name: str, default: str | None = None) -> str | None:
+        return self.headers.get(name, default)
+
+
+class _ObjectWriter:
+    """Accumulates a decoded object body together with every digest it is checked against"""
+
+    def __init__(self, keep_data: bool, checksum_algorithms: set[str], sha256: bool):
+        self._data = bytearray() if keep_data else None
+        self.size = 0
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256() if sha256 else None
+        self._checksums = {
+            algorithm: CHECKSUM_ALGORITHMS[algorithm]()
+            for algorithm in checksum_algorithms
+        }
+
+    def write(self, data: memoryview | bytes) -> None:
+        self.size += len(data)
+        self._md5.update(data)
+        if self._sha256 is not None:
+            self._sha256.update(data)
+        for hasher in self._checksums.values():
+            hasher.update(data)
+        if self._data is not None:
+            self._data += data
+
+    @property
+    def data(self) -> bytes | None:
+        return bytes(self._data) if self._data is not None else None
+
+    @property
+    def md5_digest(self) -> bytes:
+        return self._md5.digest()
+
+    @property
+    def sha256_hex(self) -> str | None:
+        return self._sha256.hexdigest() if self._sha256 is not None else None
+
+    def checksum(self, algorithm: str) -> bytes:
+        return self._checksums[algorithm].digest()
+
+
+def _parse_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """Inclusive (start, end) of a single satisfiable byte range, None to send everything"""
+    if not range_header or "," in range_header:
+        return None
+    match = _RANGE_PATTERN.fullmatch(range_header.strip())
+    if match is None or not (match[1] or match[2]):
+        return None
+    if match[1]:
+        start = int(match[1])
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+        if match[2] and int(match[2]) < start:
+            return None
+    else:
+        start, end = max(0, size - int(match[2])), size - 1
+    if start >= size or end < start:
+        raise S3Error(416, "InvalidRange", "The requested range is not satisfiable")
+    return start, end
+
+
+def _chunked_response_body(data: memoryview) -> bytes:
+    pieces: list[bytes | memoryview] = []
+    for start in range(0, len(data), RESPONSE_CHUNK_SIZE):
+        chunk = data[start : start + RESPONSE_CHUNK_SIZE]
+        pieces += (f"{len(chunk):x}\r\n".encode("ascii"), chunk, b"\r\n")
+    checksum = base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+    pieces.append(f"0\r\nx-amz-checksum-sha256: {checksum}\r\n\r\n".encode("ascii"))
+    return b"".join(pieces)
+
+
+def _checksum_matches(expected: str, digest: bytes) -> bool:
+    return expected == base64.b64encode(digest).decode("ascii")
+
+
+def _error_body(error: S3Error, resource: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f"<Error><Code>{error.code}</Code><Message>{escape(error.message)}</Message>"
+        f"<Resource>{escape(resource)}</Resource><RequestId>{uuid4().hex}</RequestId>"
+        "</Error>"
+    ).encode("utf-8")
+
+
+def _xml(root: str, content: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<{root} xmlns="{_S3_XMLNS}">{content}</{root}>'
+    ).encode("utf-8")
+
+
+def generate_self_signed_certificate(directory: str) -> tuple[str, str]:
+    """Create a throwaway certificate for localhost with the openssl command line tool"""
+    if shutil.which("openssl") is None:
+        raise RuntimeError(
+            "TLS needs the openssl command line tool to generate a certificate; "
+            "install it or pass certfile and keyfile"
+        )
+    certfile = os.path.join(directory, "localhost.pem")
+    keyfile = os.path.join(directory, "localhost-key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+class LocalS3Server:
+    """
+    In-process stand-in for S3, or for the proxy in front of it, so test cases and benchmarks
+    run without external services. Supports PUT/GET/HEAD/DELETE object, HEAD/PUT/DELETE bucket
+    and multipart uploads. Request signatures, aws-chunked chunk signatures, x-amz-content-sha256
+    and x-amz-checksum-* headers or trailers are verified. Bodies are decoded as they stream in;
+    with keep_data=False only digests are kept, so arbitrarily large uploads fit in memory but
+    objects cannot be read back. GET honours a single byte range and, like S3, ignores requests
+    for several. Clients sending TE: trailers get a chunked response ending in an
+    x-amz-checksum-sha256 trailer
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tls: bool = False,
+        certfile: str | None = None,
+        keyfile: str | None = None,
+        credentials: dict[str, str] | None = None,
+        keep_data: bool = True,
+        verify_signatures: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.credentials = dict(credentials or DEFAULT_CREDENTIALS)
+        self.keep_data = keep_data
+        self.verify_signatures = verify_signatures
+        self.buckets: dict[str, dict[str, StoredObject]] = {}
+        self.uploads: dict[str, MultipartUpload] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self._certificate_directory: tempfile.TemporaryDirectory | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def endpoint(self) -> str:
+        return f"{'https' if self.tls else 'http'}://{self.host}:{self.port}"
+
+    def runtime_config(self, access_key: str | None = None) -> RuntimeConfig:
+        access_key = access_key or next(iter(self.credentials))
+        return RuntimeConfig(self.endpoint, access_key, self.credentials[access_key])
+
+    def _ssl_context(self) -> ssl.SSLContext | None:
+        if not self.tls:
+            return None
+        if self.certfile is None:
+            self._certificate_directory = tempfile.TemporaryDirectory()
+            self.certfile, self.keyfile = generate_self_signed_certificate(
+                self._certificate_directory.name
+            )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        return context
+
+    async def start_async(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+            ssl=self._ssl_context(),
+            limit=STREAM_LIMIT,
+            backlog=1024,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start_async()
+        await self._server.serve_forever()
+
+    def start(self) -> "LocalS3Server":
+        """Serve from a background thread running its own event loop"""
+        started = threading.Event()
+        failure: list[BaseException] = []
+
+        def _run() -> None:
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(self.start_async())
+            except BaseException as e:
+                failure.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._server.close()
+            # Closing the server leaves open keep-alive connections running; aborting their
+            # transports lets each handler see EOF and return
+            for writer in list(self._writers):
+                writer.transport.abort()
+            self._loop.run_until_complete(
+                asyncio.gather(*asyncio.all_tasks(self._loop), return_exceptions=True)
+            )
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(
+            target=_run, name="local-s3-server", daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        if failure:
+            raise failure[0]
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = self._thread = None
+        if self._certificate_directory is not None:
+            self._certificate_directory.cleanup()
+            self._certificate_directory = None
+
+    def __enter__(self) -> "LocalS3Server":
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    request_head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                request = self._parse_request_head(request_head)
+                if request is None:
+                    await self._respond(writer, 400, {"Connection": "close"})
+                    return
+                try:
+                    status, headers, body = await self._dispatch(
+                        request, reader, writer
+                    )
+                except S3Error as e:
+                    status, headers = e.status, {"Content-Type": "application/xml"}
+                    body = _error_body(e, request.path)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    status, headers = 500, {"Content-Type": "application/xml"}
+                    body = _error_body(
+                        S3Error(500, "InternalError", str(e)), request.path
+                    )
+                keep_alive = request.body_consumed and (
+                    request.header("connection", "").lower() != "close"
+                )
+                if not keep_alive:
+                    headers["Connection"] = "close"
+                await self._respond(
+                    writer, status, headers, body, head_only=request.method == "HEAD"
+                )
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse_request_head(request_head: bytes) -> _Request | None:
+        lines = request_head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return _Request(method.upper(), target, headers)
+
+    @staticmethod
+    async def _respond(
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: dict[str, str],
+        body: bytes | memoryview = b"",
+        head_only: bool = False,
+    ) -> None:
+        headers = {
+            "x-amz-request-id": uuid4().hex[:16].upper(),
+            "Date": formatdate(usegmt=True),
+            **headers,
+        }
+        if "Transfer-Encoding" not in headers:
+            headers.setdefault("Content-Length", str(len(body)))
+        writer.write(
+            "".join(
+                [
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n",
+                    *(f"{name}: {value}\r\n" for name, value in headers.items()),
+                    "\r\n",
+                ]
+            ).encode("latin-1")
+        )
+        if body and not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    def _authenticate(self, request: _Request) -> None:
+        if not self.verify_signatures:
+            return
+        authorization = request.header("authorization")
+        if authorization is None:
+            raise S3Error(403, "AccessDenied", "Anonymous requests are not allowed")
+        match = _AUTHORIZATION_PATTERN.match(authorization)
+        if match is None:
+            raise S3Error(400, "AuthorizationHeaderMalformed")
+        secret_access_key = self.credentials.get(match["access_key"])
+        if secret_access_key is None:
+            raise S3Error(403, "InvalidAccessKeyId")
+        date_stamp, region, service, _ = match["scope"].split("/", 3)
+        amz_date = request.header("x-amz-date", "")
+
+        # Imported here so that servers which skip verification never load botocore
+        from botocore.auth import S3SigV4Auth
+        from botocore.awsrequest import AWSRequest
+        from botocore.credentials import Credentials
+
+        signed_header_names = match["signed_headers"].split(";")
+        try:
+            signed_headers = {
+                name: request.headers[name] for name in signed_header_names
+            }
+        except KeyError as e:
+            raise S3Error(403, "SignatureDoesNotMatch", f"Signed header {e} missing")
+        aws_request = AWSRequest(
+            method=request.method,
+            url=f"{'https' if self.tls else 'http'}://{request.header('host', '')}"
+            f"{request.target}",
+            headers=signed_headers,
+        )
+        aws_request.context["timestamp"] = amz_date
+        signer = S3SigV4Auth(
+            Credentials(match["access_key"], secret_access_key), service, region
+        )
+        string_to_sign = signer.string_to_sign(
+            aws_request, signer.canonical_request(aws_request)
+        )
+        if signer.signature(string_to_sign, aws_request) != match["signature"]:
+            raise S3Error(403, "SignatureDoesNotMatch")
+
+        if request.header("x-amz-content-sha256") in SIGNED_STREAMING_PAYLOADS:
+            request.chunk_signer = ChunkSigner(
+                derive_signing_key(secret_access_key, date_stamp, region, service),
+                amz_date,
+                match["scope"],
+            )
+            request.seed_signature = match["signature"]
+
+    async def _dispatch(
+        self,
+        request: _Request,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> tuple[int, dict[str, str], bytes]:
+        if not request.header("content-length") and not request.header(
+            "transfer-encoding"
+        ):
+            request.body_consumed = True
+        self._authenticate(request)
+        if request.header("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+
+        bucket, _, key = request.path.lstrip("/").partition("/")
+        query = request.query
+        method = request.method
+        if not bucket:
+            if method == "GET":
+                return self._list_buckets()
+            raise S3Error(405, "MethodNotAllowed")
+        if not key:
+            if method == "PUT":
+                await self._drain_body(request, reader)
+                return self._create_bucket(bucket)
+            if method == "HEAD":
+                self._get_bucket(bucket)
+                return 200, {}, b""
+            if method == "DELETE":
+                return self._delete_bucket(bucket)
+            raise S3Error(405, "MethodNotAllowed")
+
+        objects = self._get_bucket(bucket)
+        if method == "PUT" and "uploadId" in query:
+            return await self._upload_part(request, reader, bucket, key, query)
+        if method == "PUT":
+            stored = await self._receive_object(request, reader)
+            objects[key] = stored
+            return 200, self._object_write_headers(stored), b""
+        if method in ("GET", "HEAD"):
+            return self._get_object(objects, key, method, request)
+        if method == "DELETE" and "uploadId" in query:
+            self._get_upload(query["uploadId"], bucket, key)
+            del self.uploads[query["uploadId"]]
+            return 204, {}, b""
+        if method == "DELETE":
+            objects.pop(key, None)
+            return 204, {}, b""
+        if method == "POST" and "uploads" in query:
+            await self._drain_body(request, reader)
+            return self._create_multipart_upload(request, bucket, key)
+        if method == "POST" and "uploadId" in query:
+            return await self._complete_multipart_upload(
+                request, reader, bucket, key, query["uploadId"]
+            )
+        raise S3Error(405, "MethodNotAllowed")
+
+    def _get_bucket(self, bucket: str) -> dict[str, StoredObject]:
+        try:
+            return self.buckets[bucket]
+        except KeyError:
+            raise S3Error(404, "NoSuchBucket", f"The bucket {bucket} does not exist")
+
+    def _get_upload(self, upload_id: str, bucket: str, key: str) -> MultipartUpload:
+        upload = self.uploads.get(upload_id)
+        # Like S3, an upload ID is only valid for the bucket and key it was created for
+        if upload is None or (upload.bucket, upload.key) != (bucket, key):
+            raise S3Error(404, "NoSuchUpload")
+        return upload
+
+    def _list_buckets(self) -> tuple[int, dict[str, str], bytes]:
+        buckets = "".join(
+            f"<Bucket><Name>{escape(name)}</Name></Bucket>" for name in self.buckets
+        )
+        return (
+            200,
+            {"Content-Type": "application/xml"},
+            _xml("ListAllMyBucketsResult", f"<Buckets>{buckets}</Buckets>"),
+        )
+
+    def _create_bucket(self, bucket: str) -> tuple[int, dict[str, str], bytes]:
+        if bucket in self.buckets:
+            raise S3Error(409, "BucketAlreadyOwnedByYou")
+        self.buckets[bucket] = {}
+        return 200, {"Location": f"/{bucket}"}, b""
+
+    def _delete_bucket(self, bucket: str) -> tuple[int, dict[str, str], bytes]:
+        if self._get_bucket(bucket):
+            raise S3Error(409, "BucketNotEmpty")
+        del self.buckets[bucket]
+        return 204, {}, b""
+
+    def _get_object(
+        self,
+        objects: dict[str, StoredObject],
+        key: str,
+        method: str,
+        request: _Request,
+    ) -> tuple[int, dict[str, str], bytes]:
+        try:
+            stored = objects[key]
+        except KeyError:
+            raise S3Error(404, "NoSuchKey")
+        if stored.data is None and method == "GET":
+            raise S3Error(501, "NotImplemented", "Object data was not kept")
+        status = 200
+        headers = {
+            "Content-Type": stored.content_type,
+            "Content-Length": str(stored.size),
+            "ETag": stored.etag,
+            "Last-Modified": formatdate(stored.last_modified, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+        data = memoryview(stored.data if method == "GET" else b"")
+        byte_range = _parse_range(request.header("range"), stored.size)
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            data = data[start : end + 1]
+        if method == "GET" and "trailers" in request.header("te", "").lower():
+            del headers["Content-Length"]
+            headers["Transfer-Encoding"] = "chunked"
+            headers["Trailer"] = "x-amz-checksum-sha256"
+            return status, headers, _chunked_response_body(data)
+        return status, headers, data
+
+    @staticmethod
+    def _object_write_headers(stored: StoredObject) -> dict[str, str]:
+        return {
+            "ETag": stored.etag,
+            **{
+                f"x-amz-checksum-{algorithm}": value
+                for algorithm, value in stored.checksums.items()
+            },
+        }
+
+    async def _upload_part(
+        self,
+        request: _Request,
+        reader: asyncio.StreamReader,
+        bucket: str,
+        key: str,
+        query: dict[str, str],
+    ) -> tuple[int, dict[str, str], bytes]:
+        upload = self._get_upload(query["uploadId"], bucket, key)
+        try:
+            part_number = int(query.get("partNumber", ""))
+        except ValueError:
+            raise S3Error(400, "InvalidArgument", "Invalid part number")
+        stored = await self._receive_object(request, reader)
+        upload.parts[part_number] = stored
+        return 200, self._object_write_headers(stored), b""
+
+    def _create_multipart_upload(
+        self, request: _Request, bucket: str, key: str
+    ) -> tuple[int, dict[str, str], bytes]:
+        upload_id = uuid4().hex
+        self.uploads[upload_id] = MultipartUpload(
+            bucket, key, request.header("content-type", "binary/octet-stream")
+        )
+        return (
+            200,
+            {"Content-Type": "application/xml"},
+            _xml(
+                "InitiateMultipartUploadResult",
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId>",
+            ),
+        )
+
+    async def _complete_multipart_upload(
+        self,
+        request: _Request,
+        reader: asyncio.StreamReader,
+        bucket: str,
+        key: str,
+        upload_id: str,
+    ) -> tuple[int, dict[str, str], bytes]:
+        upload = self._get_upload(upload_id, bucket, key)
+        body = bytearray()
+        async for data in self._iter_body(request, reader):
+            body += data
+        try:
+            part_elements = ElementTree.fromstring(body).iter(f"{{{_S3_XMLNS}}}Part")
+            requested_parts = [
+                (
+                    int(part.findtext(f"{{{_S3_XMLNS}}}PartNumber")),
+                    part.findtext(f"{{{_S3_XMLNS}}}ETag"),
+                )
+                for part in part_elements
+            ]
+        except (ElementTree.ParseError, TypeError, ValueError):
+            raise S3Error(400, "MalformedXML")
+        if not requested_parts:
+            raise S3Error(400, "MalformedXML", "No parts given")
+
+        parts = []
+        for part_number, etag in requested_parts:
+            part = upload.parts.get(part_number)
+            if part is None or part.etag.strip('"') != (etag or "").strip('"'):
+                raise S3Error(400, "InvalidPart", f"Invalid part {part_number}")
+            parts.append(part)
+        if [number for number, _ in requested_parts] != sorted(
+            {number for number, _ in requested_parts}
+        ):
+            raise S3Error(400, "InvalidPartOrder")
+
+        md5_of_parts = hashlib.md5(
+            b"".join(bytes.fromhex(part.etag.strip('"')) for part in parts)
+        )
+        etag = f'"{md5_of_parts.hexdigest()}-{len(parts)}"'
+        self.buckets[upload.bucket][upload.key] = StoredObject(
+            data=(
+                b"".join(part.data for part in parts)
+                if all(part.data is not None for part in parts)
+                else None
+            ),
+            size=sum(part.size for part in parts),
+            etag=etag,
+            content_type=upload.content_type,
+            last_modified=parts[-1].last_modified,
+        )
+        del self.uploads[upload_id]
+        return (
+            200,
+            {"Content-Type": "application/xml"},
+            _xml(
+                "CompleteMultipartUploadResult",
+                f"<Bucket>{escape(upload.bucket)}</Bucket><Key>{escape(upload.key)}</Key>"
+                f"<ETag>{escape(etag)}</ETag>",
+            ),
+        )
+
+    async def _iter_body(
+        self, request: _Request, reader: asyncio.StreamReader
+    ) -> AsyncIterator[bytes]:
+        """Yield the request body with any Transfer-Encoding removed, keeping HTTP trailers"""
+        if request.header("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                try:
+                    remaining = int(size_line.split(b";", 1)[0], 16)
+                except ValueError:
+                    raise S3Error(400, "IncompleteBody", "Bad HTTP chunk size")
+                if not remaining:
+                    while (trailer_line := await reader.readuntil(b"\r\n")) != b"\r\n":
+                        name, _, value = trailer_line.decode("latin-1").partition(":")
+                        request.trailers[name.strip().lower()] = value.strip()
+                    break
+                while remaining:
+                    data = await reader.read(min(remaining, READ_SIZE))
+                    if not data:
+                        raise S3Error(400, "IncompleteBody")
+                    remaining -= len(data)
+                    yield data
+                if await reader.readexactly(2) != b"\r\n":
+                    raise S3Error(400, "IncompleteBody", "HTTP chunk data overruns")
+        else:
+            remaining = int(request.header("content-length") or 0)
+            while remaining:
+                data = await reader.read(min(remaining, READ_SIZE))
+                if not data:
+                    raise S3Error(400, "IncompleteBody")
+                remaining -= len(data)
+                yield data
+        request.body_consumed = True
+
+    async def _drain_body(
+        self, request: _Request, reader: asyncio.StreamReader
+    ) -> None:
+        async for _ in self._iter_body(request, reader):
+            pass
+
+    async def _receive_object(
+        self, request: _Request, reader: asyncio.StreamReader
+    ) -> StoredObject:
+        content_sha256 = request.header("x-amz-content-sha256", "UNSIGNED-PAYLOAD")
+        content_encodings = [
+            encoding.strip()
+            for encoding in request.header("content-encoding", "").split(",")
+            if encoding.strip()
+        ]
+        aws_chunked = (
+            "aws-chunked" in content_encodings
+            or content_sha256 in SIGNED_STREAMING_PAYLOADS
+        )
+        checksum_algorithms = {
+            name.removeprefix("x-amz-checksum-")
+            for name in [
+                *request.headers,
+                *request.header("x-amz-trailer", "").lower().split(","),
+            ]
+            if name.strip().startswith("x-amz-checksum-")
+        }
+        checksum_algorithms = {
+            algorithm.strip()
+            for algorithm in checksum_algorithms
+            if algorithm.strip() in CHECKSUM_ALGORITHMS
+        }
+        object_writer = _ObjectWriter(
+            self.keep_data,
+            checksum_algorithms,
+            sha256=not content_sha256.startswith(("STREAMING-", "UNSIGNED-")),
+        )
+
+        decoder = None
+        if aws_chunked:
+            decoder = AwsChunkedDecoder(
+                request.chunk_signer,
+                request.seed_signature,
+                signed_trailer=content_sha256 == SIGNED_TRAILER_PAYLOAD,
+            )
+        trailers = {}
+        try:
+            async for data in self._iter_body(request, reader):
+                if decoder is None:
+                    object_writer.write(data)
+                    continue
+                for data_piece in decoder.feed(data):
+                    object_writer.write(data_piece)
+            if decoder is not None:
+                decoder.finish()
+                trailers.update(decoder.trailers)
+        except ChunkSignatureError as e:
+            raise S3Error(403, "SignatureDoesNotMatch", str(e))
+        except AwsChunkedDecodeError as e:
+            raise S3Error(400, "IncompleteBody", str(e))
+        trailers.update(request.trailers)
+
+        decoded_length = request.header("x-amz-decoded-content-length")
+        if decoded_length is not None and int(decoded_length) != object_writer.size:
+            raise S3Error(400, "IncompleteBody", "Decoded content length mismatch")
+        if object_writer.sha256_hex is not None and (
+            object_writer.sha256_hex != content_sha256
+        ):
+            raise S3Error(400, "XAmzContentSHA256Mismatch")
+        if (content_md5 := request.header("content-md5")) is not None:
+            if not _checksum_matches(content_md5, object_writer.md5_digest):
+                raise S3Error(400, "BadDigest")
+
+        checksums = {}
+        for algorithm in checksum_algorithms:
+            name = f"x-amz-checksum-{algorithm}"
+            expected = trailers.get(name, request.header(name))
+            if expected is None:
+                raise S3Error(400, "MalformedTrailerError", f"Missing {name}")
+            digest = object_writer.checksum(algorithm)
+            if not _checksum_matches(expected, digest):
+                raise S3Error(400, "BadDigest", f"{name} does not match")
+            checksums[algorithm] = base64.b64encode(digest).decode("ascii")
+
+        return StoredObject(
+            data=object_writer.data,
+            size=object_writer.size,
+            etag=f'"{object_writer.md5_digest.hex()}"',
+            content_type=request.header("content-type", "binary/octet-stream"),
+            last_modified=_timestamp(request.header("x-amz-date")),
+            checksums=checksums,
+        )
+
+
+def _timestamp(amz_date: str | None) -> float:
+    try:
+        return calendar.timegm(time.strptime(amz_date or "", AWS_TIMESTAMP_FORMAT))
+    except ValueError:
+        return time.time()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Serve a local S3 stand-in for offline test runs and benchmarks"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--tls", action="store_true", help="Serve HTTPS")
+    parser.add_argument("--certfile", default=None)
+    parser.add_argument("--keyfile", default=None)
+    parser.add_argument(
+        "--discard-data",
+        action="store_true",
+        help="Keep only object digests, so uploads of any size fit in memory",
+    )
+    parser.add_argument(
+        "--no-verify-signatures",
+        action="store_true",
+        help="Accept requests without checking their signatures",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    cli_args = _parse_args()
+    server = LocalS3Server(
+        cli_args.host,
+        cli_args.port,
+        tls=cli_args.tls,
+        certfile=cli_args.certfile,
+        keyfile=cli_args.keyfile,
+        keep_data=not cli_args.discard_data,
+        verify_signatures=not cli_args.no_verify_signatures,
+    )
+    print(f"Serving on {server.endpoint}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
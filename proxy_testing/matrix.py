@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field
+from itertools import product
+from math import prod
+from typing import Any, Callable, Generic, Iterator, Mapping, Sequence, TypeVar
+
+ItemT = TypeVar("ItemT")
+
+# An exclusion either maps axis names to the value, or tuple of values, that rules a
+# combination out when all of them match, or is a predicate called with the combination
+Exclusion = Mapping[str, Any] | Callable[..., bool]
+
+
+def _matches(exclusion: Exclusion, combination: dict[str, Any]) -> bool:
+    if callable(exclusion):
+        return exclusion(**combination)
+    return all(
+        (
+            combination[axis] in excluded
+            if isinstance(excluded, tuple)
+            else combination[axis] == excluded
+        )
+        for axis, excluded in exclusion.items()
+    )
+
+
+@dataclass(frozen=True)
+class TestMatrix(Generic[ItemT]):
+    """
+    Cartesian product of named axes, built into test cases lazily and in a fixed order (the
+    last axis varies fastest), so that a case's position identifies it across runs. build is
+    called with one keyword argument per axis; combinations matching any exclusion are skipped
+    """
+
+    axes: dict[str, Sequence[Any]]
+    build: Callable[..., ItemT]
+    exclusions: Sequence[Exclusion] = field(default_factory=tuple)
+
+    def __post_init__(self):
+        for exclusion in self.exclusions:
+            if not callable(exclusion) and (unknown := set(exclusion) - set(self.axes)):
+                raise ValueError(f"Exclusion on unknown axes {sorted(unknown)}")
+
+    @property
+    def combination_count(self) -> int:
+        """Size of the product before exclusions"""
+        return prod(len(values) for values in self.axes.values())
+
+    def combinations(self) -> Iterator[dict[str, Any]]:
+        for values in product(*self.axes.values()):
+            combination = dict(zip(self.axes, values))
+            if not any(_matches(rule, combination) for rule in self.exclusions):
+                yield combination
+
+    def __iter__(self) -> Iterator[ItemT]:
+        for combination in self.combinations():
+            yield self.build(**combination)
@@ -0,0 +1,330 @@
+import base64
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass
+from math import ceil
+from uuid import uuid4
+from tabulate import tabulate
+from .chunking import AWS_CHUNKED_MIN_CHUNK_SIZE, DEFAULT_CHUNK_SIZE, ChunkingPlan
+from .datamodel import RuntimeConfig, TestResult
+from .payloads import GeneratedPayload, format_size
+from .raw_http import RawHttpConnectionPool, get_default_pool
+from .s3_helpers import (
+    content_verification,
+    ensure_bucket_exists,
+    ensure_etag_matches,
+)
+from .streams import (
+    DEFAULT_READ_SIZE,
+    PayloadInput,
+    PayloadSource,
+    as_payload_source,
+    get_sized_body,
+    iter_source_slices,
+    slice_source,
+    source_length,
+)
+from .test_cases import (
+    get_response_or_exc_info,
+    prepare_aws_chunked_upload,
+    prepare_http_chunked_upload,
+    prepare_standard_upload,
+)
+
+PART_ENCODINGS = ("plain", "aws-chunked", "http-chunked-trailer")
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_CHUNK_SIZE = DEFAULT_CHUNK_SIZE
+TRAILER_CHECKSUM_HEADER = "x-amz-checksum-sha256"
+
+
+@dataclass
+class UploadedPart:
+    part_number: int
+    etag: str
+    md5_digest: bytes
+    checksum_sha256: str
+
+
+def composite_etag(part_md5_digests: list[bytes]) -> str:
+    """ETag S3 assigns to a completed multipart upload: md5 of the part md5s plus the count"""
+    return (
+        f'"{hashlib.md5(b"".join(part_md5_digests)).hexdigest()}'
+        f'-{len(part_md5_digests)}"'
+    )
+
+
+def _hash_part(part: PayloadSource) -> tuple[bytes, bytes]:
+    md5_hasher = hashlib.md5()
+    sha256_hasher = hashlib.sha256()
+    for data in iter_source_slices(part, DEFAULT_READ_SIZE):
+        md5_hasher.update(data)
+        sha256_hasher.update(data)
+    return md5_hasher.digest(), sha256_hasher.digest()
+
+
+def _upload_part(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    upload_id: str,
+    part_number: int,
+    part: PayloadSource,
+    part_encoding: str,
+    pool: RawHttpConnectionPool,
+) -> UploadedPart:
+    query = {"partNumber": str(part_number), "uploadId": upload_id}
+    chunking = ChunkingPlan.from_chunk_size(
+        source_length(part), PART_CHUNK_SIZE, AWS_CHUNKED_MIN_CHUNK_SIZE
+    )
+    md5_digest, sha256_digest = _hash_part(part)
+    checksum_sha256 = base64.b64encode(sha256_digest).decode("ascii")
+
+    if part_encoding == "plain":
+        built_request = prepare_standard_upload(
+            runtime_config,
+            bucket,
+            key,
+            part,
+            hash_data=True,
+            query=query,
+            payload_sha256=sha256_digest.hex(),
+        )
+        body = get_sized_body(part, file_regions=True)
+    elif part_encoding == "aws-chunked":
+        built_request, body = prepare_aws_chunked_upload(
+            runtime_config,
+            bucket,
+            key,
+            part,
+            chunking,
+            "aws-chunked",
+            "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+            True,
+            query=query,
+        )
+    elif part_encoding == "http-chunked-trailer":
+        built_request, body = prepare_http_chunked_upload(
+            runtime_config,
+            bucket,
+            key,
+            part,
+            chunking,
+            None,
+            "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
+            True,
+            TRAILER_CHECKSUM_HEADER,
+            checksum_sha256,
+            query=query,
+        )
+    else:
+        raise ValueError(f"Unknown part encoding {part_encoding}")
+
+    response = pool.request(
+        "PUT",
+        built_request.request.url,
+        dict(built_request.request.headers.items()),
+        body,
+    )
+    if not 300 > response.status_code >= 200:
+        raise ValueError(
+            f"UploadPart {part_number} failed with HTTP {response.status_code}"
+        )
+    etag = response.get_header("ETag") or ""
+    assert (
+        etag.strip('"') == md5_digest.hex()
+    ), f"Unexpected ETag {etag} for part {part_number}"
+    return UploadedPart(part_number, etag, md5_digest, checksum_sha256)
+
+
+def _split_into_parts(payload: PayloadSource, part_size: int) -> list[PayloadSource]:
+    total_size = source_length(payload)
+    return [
+        slice_source(payload, offset, part_size)
+        for offset in range(0, max(total_size, 1), part_size)
+    ]
+
+
+@get_response_or_exc_info
+def _multipart_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    part_size: int,
+    part_encoding: str,
+    concurrency: int,
+    pool: RawHttpConnectionPool | None = None,
+) -> int:
+    ensure_bucket_exists(runtime_config, bucket)
+    pool = pool or get_default_pool()
+    parts = _split_into_parts(as_payload_source(data), part_size)
+    s3_client = runtime_config.s3_client
+    with_checksum = part_encoding == "http-chunked-trailer"
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        **({"ChecksumAlgorithm": "SHA256"} if with_checksum else {}),
+    )["UploadId"]
+    # Parts run in the caller's context so their timings and verification settings apply
+    context = copy_context()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            uploaded_parts = list(
+                executor.map(
+                    lambda numbered_part: context.copy().run(
+                        _upload_part,
+                        runtime_config,
+                        bucket,
+                        key,
+                        upload_id,
+                        *numbered_part,
+                        part_encoding,
+                        pool,
+                    ),
+                    enumerate(parts, start=1),
+                )
+            )
+        completed = s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {
+                        "PartNumber": part.part_number,
+                        "ETag": part.etag,
+                        **(
+                            {"ChecksumSHA256": part.checksum_sha256}
+                            if with_checksum
+                            else {}
+                        ),
+                    }
+                    for part in uploaded_parts
+                ]
+            },
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    ensure_etag_matches(
+        runtime_config,
+        bucket,
+        key,
+        composite_etag([part.md5_digest for part in uploaded_parts]),
+    )
+    return completed["ResponseMetadata"]["HTTPStatusCode"]
+
+
+def multipart_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    part_size: int = MIN_PART_SIZE,
+    part_encoding: str = "plain",
+    concurrency: int = 4,
+) -> TestResult:
+    part_count = max(1, ceil(source_length(as_payload_source(data)) / part_size))
+    return TestResult(
+        f"multipart-{part_count}-parts-{part_encoding}",
+        part_encoding != "http-chunked-trailer",
+        part_encoding != "plain",
+        {
+            "plain": "actual hash",
+            "aws-chunked": "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+            "http-chunked-trailer": "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
+        }[part_encoding],
+        "chunked" if part_encoding == "http-chunked-trailer" else "not present",
+        "aws-chunked" if part_encoding == "aws-chunked" else "not present",
+        _multipart_upload(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            part_size=part_size,
+            part_encoding=part_encoding,
+            concurrency=concurrency,
+        ),
+    )
+
+
+@dataclass
+class MultipartSweepResult:
+    part_encoding: str
+    part_size: int
+    part_count: int
+    payload_size: int
+    result: str | int
+    seconds: float
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.payload_size / self.seconds / 1_000_000 if self.seconds else 0.0
+
+
+def run_multipart_sweep(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    payload_size: int,
+    part_sizes: list[int],
+    part_encodings: list[str],
+    concurrency: int = 8,
+    verify: bool = False,
+) -> list[MultipartSweepResult]:
+    """Upload one generated payload split at every part size, reporting aggregate throughput"""
+    ensure_bucket_exists(runtime_config, bucket)
+    payload = GeneratedPayload(payload_size)
+    results = []
+    for part_size in part_sizes:
+        for part_encoding in part_encodings:
+            started = time.perf_counter()
+            with content_verification(verify):
+                test_result = multipart_upload(
+                    runtime_config,
+                    bucket,
+                    uuid4().hex,
+                    payload,
+                    part_size=part_size,
+                    part_encoding=part_encoding,
+                    concurrency=concurrency,
+                )
+            results.append(
+                MultipartSweepResult(
+                    part_encoding=part_encoding,
+                    part_size=part_size,
+                    part_count=max(1, ceil(payload_size / part_size)),
+                    payload_size=payload_size,
+                    result=test_result.result,
+                    seconds=time.perf_counter() - started,
+                )
+            )
+    return results
+
+
+def format_multipart_sweep_results(results: list[MultipartSweepResult]) -> str:
+    return tabulate(
+        [
+            (
+                result.part_encoding,
+                format_size(result.payload_size),
+                format_size(result.part_size),
+                result.part_count,
+                result.result,
+                f"{result.seconds:.3f}",
+                f"{result.megabytes_per_second:.1f}",
+            )
+            for result in results
+        ],
+        headers=(
+            "Part encoding",
+            "Payload size",
+            "Part size",
+            "Parts",
+            "Result",
+            "Seconds",
+            "MB/s",
+        ),
+    )
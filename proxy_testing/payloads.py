@@ -0,0 +1,82 @@
+import io
+import os
+import random
+from .streams import Payload
+
+# A prime block length keeps the repeating pattern from lining up with power-of-two chunk sizes
+GENERATED_BLOCK_SIZE = 65521
+
+_SIZE_SUFFIXES = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    """Parse sizes such as 1024, 64KiB, 16M or 4GiB into a number of bytes"""
+    normalised = size.strip().upper().removesuffix("B").removesuffix("I")
+    suffix = normalised[-1:] if normalised[-1:] in _SIZE_SUFFIXES else ""
+    return int(float(normalised.removesuffix(suffix)) * _SIZE_SUFFIXES[suffix])
+
+
+def format_size(size: int) -> str:
+    for suffix in ("TiB", "GiB", "MiB", "KiB"):
+        unit = _SIZE_SUFFIXES[suffix[0]]
+        if size >= unit and size % unit == 0:
+            return f"{size // unit}{suffix}"
+    return f"{size}B"
+
+
+class _GeneratedPayloadReader(io.RawIOBase):
+    def __init__(self, block: bytes, size: int):
+        # Doubling the block lets any window of up to one block be sliced without wrapping
+        self._blocks = memoryview(block * 2)
+        self._block_size = len(block)
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer).cast("B") as target:
+            wanted = min(len(target), max(0, self._size - self._position))
+            written = 0
+            while written < wanted:
+                block_offset = (self._position + written) % self._block_size
+                size = min(wanted - written, self._block_size)
+                target[written : written + size] = self._blocks[
+                    block_offset : block_offset + size
+                ]
+                written += size
+        self._position += written
+        return written
+
+
+class GeneratedPayload(Payload):
+    """
+    Deterministic, seekable payload of arbitrary size that is never held in memory. The same
+    size and seed always produce the same bytes
+    """
+
+    def __init__(self, size: int, seed: int = 0):
+        self.size = size
+        self.seed = seed
+        self._block = random.Random(seed).randbytes(GENERATED_BLOCK_SIZE)
+
+    def __repr__(self) -> str:
+        return f"GeneratedPayload({format_size(self.size)}, seed={self.seed})"
+
+    def open(self) -> io.BufferedReader:
+        return io.BufferedReader(_GeneratedPayloadReader(self._block, self.size))
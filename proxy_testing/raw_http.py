@@ -1,64 +1,728 @@
-from contextlib import contextmanager
-import re
+import select
 import socket
 import ssl
-from typing import Iterator
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Callable, Iterable, Iterator
 from urllib.parse import urlparse
+from .streams import FileRegion
+from .throttling import UploadPacer, UploadThrottle
+from .timings import ExchangeTimer, timed_phase
 
+RECV_SIZE = 64 * 1024
+DEFAULT_TIMEOUT = 5.0
+# How long to wait for 100 Continue before sending the body anyway, as curl does
+CONTINUE_TIMEOUT = 1.0
+# How the server answered a request sent with Expect: 100-continue
+CONTINUE_RECEIVED = "100-continue"
+CONTINUE_FINAL_RESPONSE = "final-response"
+CONTINUE_TIMED_OUT = "timeout"
+# Most platforms cap a single sendmsg() at 1024 buffers
+MAX_IOVEC = 1024
 
-@contextmanager
-def _get_socket(scheme: str, url_host: str) -> Iterator[socket.socket]:
-    @contextmanager
-    def _obtain_sock(hostname: str):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as open_sock:
-            open_sock.settimeout(5.0)
-            if "https" in scheme.lower():
-                context = ssl.create_default_context()
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-                with context.wrap_socket(
-                    open_sock, server_hostname=hostname, do_handshake_on_connect=False
-                ) as open_ssl_sock:
-                    yield open_ssl_sock
-            else:
-                yield open_sock
+RawBody = bytes | Iterable[bytes | memoryview | FileRegion]
+# How a keep-alive connection the server has already closed shows up on the first write or read
+STALE_CONNECTION_ERRORS = (
+    ConnectionResetError,
+    BrokenPipeError,
+    ssl.SSLEOFError,
+    ssl.SSLZeroReturnError,
+)
 
+
+class StaleConnectionError(ConnectionError):
+    """
+    A reused keep-alive connection turned out to be closed by the server before any of the
+    request could have reached it, so the request is safe to send again
+    """
+
+
+def _find_header(
+    headers: list[tuple[str, str]], name: str, default: str | None
+) -> str | None:
+    name = name.lower()
+    for header_name, header_value in headers:
+        if header_name.lower() == name:
+            return header_value
+    return default
+
+
+@dataclass
+class RawHttpResponse:
+    status_code: int
+    reason: str
+    http_version: str
+    headers: list[tuple[str, str]] = field(default_factory=list)
+    body: bytes = b""
+    trailers: list[tuple[str, str]] = field(default_factory=list)
+    continue_outcome: str | None = None
+
+    def get_header(self, name: str, default: str | None = None) -> str | None:
+        return _find_header(self.headers, name, default)
+
+    def get_trailer(self, name: str, default: str | None = None) -> str | None:
+        return _find_header(self.trailers, name, default)
+
+    @property
+    def keep_alive(self) -> bool:
+        if self.continue_outcome == CONTINUE_FINAL_RESPONSE:
+            # The server may still be waiting for the body that was never sent
+            return False
+        connection = (self.get_header("Connection") or "").lower()
+        if self.http_version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class ResponseBodySink(ABC):
+    """
+    Body sink that is shown the final response head before any of its body, e.g. to pick a
+    decoder from the Content-Type
+    """
+
+    def start(self, response: RawHttpResponse) -> None:
+        pass
+
+    @abstractmethod
+    def __call__(self, data: memoryview) -> None: ...
+
+
+class HttpResponseParser:
+    """
+    Incremental HTTP/1.1 response parser. Bytes are fed as they arrive from the network, the
+    body is framed by Content-Length, chunked transfer encoding or connection close, and
+    interim 1xx responses are skipped. When body_sink is given, body bytes are handed to it
+    instead of being buffered on the response
+    """
+
+    _HEADERS = "headers"
+    _BODY = "body"
+    _CHUNK_SIZE = "chunk-size"
+    _CHUNK_DATA = "chunk-data"
+    _CHUNK_END = "chunk-end"
+    _TRAILERS = "trailers"
+    _UNTIL_CLOSE = "until-close"
+    _DONE = "done"
+
+    def __init__(
+        self,
+        request_method: str = "PUT",
+        body_sink: Callable[[memoryview], None] | None = None,
+    ):
+        self._request_method = request_method.upper()
+        self._body_sink = body_sink
+        self._buffer = bytearray()
+        self._body = bytearray()
+        self._state = self._HEADERS
+        self._remaining = 0
+        self.response: RawHttpResponse | None = None
+        self.interim_responses: list[RawHttpResponse] = []
+
+    @property
+    def complete(self) -> bool:
+        return self._state == self._DONE
+
+    @property
+    def headers_complete(self) -> bool:
+        return self.response is not None
+
+    @property
+    def continue_received(self) -> bool:
+        return any(response.status_code == 100 for response in self.interim_responses)
+
+    @property
+    def continue_outcome(self) -> str:
+        """How Expect: 100-continue has been answered so far"""
+        if self.headers_complete:
+            return CONTINUE_FINAL_RESPONSE
+        if self.continue_received:
+            return CONTINUE_RECEIVED
+        return CONTINUE_TIMED_OUT
+
+    def feed(self, data: bytes) -> None:
+        if data:
+            self._buffer += data
+        while self._state != self._DONE and self._advance():
+            pass
+
+    def feed_eof(self) -> None:
+        if self._state == self._UNTIL_CLOSE:
+            self._finish()
+        elif self._state != self._DONE:
+            raise ConnectionError(
+                f"Connection closed while reading response ({self._state})"
+            )
+
+    def _advance(self) -> bool:
+        if self._state == self._HEADERS:
+            return self._parse_head()
+        if self._state == self._BODY:
+            return self._consume_body()
+        if self._state == self._CHUNK_SIZE:
+            return self._parse_chunk_size()
+        if self._state == self._CHUNK_DATA:
+            return self._consume_body()
+        if self._state == self._CHUNK_END:
+            if len(self._buffer) < 2:
+                return False
+            if self._buffer[:2] != b"\r\n":
+                raise ValueError("Malformed chunked response body")
+            del self._buffer[:2]
+            self._state = self._CHUNK_SIZE
+            return True
+        if self._state == self._TRAILERS:
+            return self._parse_trailers()
+        if self._state == self._UNTIL_CLOSE:
+            with memoryview(self._buffer) as view:
+                self._emit_body(view)
+            self._buffer.clear()
+            return False
+        return False
+
+    def _parse_head(self) -> bool:
+        head_end = self._buffer.find(b"\r\n\r\n")
+        if head_end < 0:
+            return False
+        head = bytes(self._buffer[:head_end]).decode("latin-1")
+        del self._buffer[: head_end + 4]
+        status_line, *header_lines = head.split("\r\n")
+        http_version, status_code, *reason = status_line.split(" ", 2)
+        response = RawHttpResponse(
+            status_code=int(status_code),
+            reason=reason[0] if reason else "",
+            http_version=http_version,
+            headers=_parse_header_lines(header_lines),
+        )
+        if 100 <= response.status_code < 200 and response.status_code != 101:
+            self.interim_responses.append(response)
+            return True
+
+        self.response = response
+        if isinstance(self._body_sink, ResponseBodySink):
+            self._body_sink.start(response)
+        transfer_encoding = (response.get_header("Transfer-Encoding") or "").lower()
+        content_length = response.get_header("Content-Length")
+        if (
+            self._request_method == "HEAD"
+            or response.status_code in (101, 204, 304)
+            or (content_length is not None and int(content_length) == 0)
+        ):
+            self._finish()
+        elif "chunked" in transfer_encoding:
+            self._state = self._CHUNK_SIZE
+        elif content_length is not None:
+            self._remaining = int(content_length)
+            self._state = self._BODY
+        else:
+            self._state = self._UNTIL_CLOSE
+        return True
+
+    def _parse_chunk_size(self) -> bool:
+        line_end = self._buffer.find(b"\r\n")
+        if line_end < 0:
+            return False
+        size_field = bytes(self._buffer[:line_end]).split(b";", 1)[0].strip()
+        del self._buffer[: line_end + 2]
+        self._remaining = int(size_field, 16)
+        self._state = self._CHUNK_DATA if self._remaining else self._TRAILERS
+        return True
+
+    def _consume_body(self) -> bool:
+        if not self._buffer:
+            return False
+        taken = min(self._remaining, len(self._buffer))
+        with memoryview(self._buffer) as view:
+            self._emit_body(view[:taken])
+        del self._buffer[:taken]
+        self._remaining -= taken
+        if self._remaining:
+            return False
+        if self._state == self._CHUNK_DATA:
+            self._state = self._CHUNK_END
+        else:
+            self._finish()
+        return True
+
+    def _parse_trailers(self) -> bool:
+        if self._buffer[:2] == b"\r\n":
+            del self._buffer[:2]
+            self._finish()
+            return True
+        trailers_end = self._buffer.find(b"\r\n\r\n")
+        if trailers_end < 0:
+            return False
+        trailer_lines = bytes(self._buffer[:trailers_end]).decode("latin-1")
+        del self._buffer[: trailers_end + 4]
+        self.response.trailers = _parse_header_lines(trailer_lines.split("\r\n"))
+        self._finish()
+        return True
+
+    def _emit_body(self, data: memoryview) -> None:
+        if not data:
+            return
+        if self._body_sink is not None:
+            self._body_sink(data)
+        else:
+            self._body += data
+
+    def _finish(self) -> None:
+        self.response.body = bytes(self._body)
+        self._state = self._DONE
+
+
+def _parse_header_lines(header_lines: list[str]) -> list[tuple[str, str]]:
+    headers = []
+    for header_line in header_lines:
+        if not header_line:
+            continue
+        header_name, _, header_value = header_line.partition(":")
+        headers.append((header_name.strip(), header_value.strip()))
+    return headers
+
+
+def build_request_head(method: str, path: str, headers: dict[str, str]) -> bytearray:
+    return bytearray(
+        "\r\n".join(
+            [
+                f"{method} {path} HTTP/1.1",
+                *[
+                    f"{header_name}: {header_value}"
+                    for header_name, header_value in headers.items()
+                ],
+                "",
+                "",
+            ]
+        ).encode("utf-8")
+    )
+
+
+def parse_host(scheme: str, url_host: str) -> tuple[str, int]:
     host_parts = url_host.split(":")
     if len(host_parts) < 1 or len(host_parts) > 2:
         raise ValueError(f"Invalid host {host_parts}")
     try:
         hostname = host_parts[0].strip()
-        port = int(host_parts[1]) if len(host_parts) > 1 else 80
-        with _obtain_sock(hostname) as sock:
-            sock.connect((hostname, port))
-            yield sock
+        default_port = 443 if "https" in scheme.lower() else 80
+        port = int(host_parts[1]) if len(host_parts) > 1 else default_port
     except ValueError:
         raise ValueError(f"Invalid host {host_parts}")
+    return hostname, port
+
+
+def expects_continue(headers: dict[str, str]) -> bool:
+    return any(
+        name.lower() == "expect" and value.lower() == "100-continue"
+        for name, value in headers.items()
+    )
+
+
+def prepare_raw_request(
+    method: str, final_url: str, headers: dict[str, str]
+) -> tuple[tuple[str, str, int], bytearray]:
+    parsed_url = urlparse(final_url)
+    scheme = "https" if "https" in parsed_url.scheme.lower() else "http"
+    pool_key = (scheme, *parse_host(scheme, parsed_url.netloc))
+    path = parsed_url.path + (f"?{parsed_url.query}" if parsed_url.query else "")
+    if not any(name.lower() == "connection" for name in headers):
+        headers = {**headers, "Connection": "keep-alive"}
+    return pool_key, build_request_head(method, path, headers)
 
 
-def send_raw_http_request(final_url: str, headers: dict[str, str], data: bytes) -> int:
+def coalesce_buffers(
+    buffers: list[bytes | memoryview],
+) -> Iterator[bytes | memoryview]:
     """
-    Horrible (but useful) helper to send HTTP requests by hand since most libraries don't support
-    HTTP trailer headers
+    Join runs of small buffers while passing large ones through uncopied. Used where each
+    write becomes a TLS record, which makes many tiny writes expensive
     """
-    parsed_url = urlparse(final_url)
-    raw_data_to_send = "\r\n".join(
-        [
-            f"PUT {parsed_url.path} HTTP/1.1",
-            *[
-                f"{header_name}: {header_value}"
-                for header_name, header_value in headers.items()
-            ],
-        ]
-    ).encode("utf-8")
-    raw_data_to_send += b"\r\n\r\n"
-    raw_data_to_send += data
-    with _get_socket(parsed_url.scheme, parsed_url.netloc) as open_sock:
-        open_sock.sendall(raw_data_to_send)
-        raw_response_bytes = open_sock.recv(1024)
-        print(raw_response_bytes)
-        return int(
-            re.match(r"HTTP/[\d\.]+ (\d+).*", raw_response_bytes.decode("utf-8"))
-            .group(1)
-            .strip()
+    small_buffers: list[bytes | memoryview] = []
+    for buffer in buffers:
+        if len(buffer) < RECV_SIZE:
+            small_buffers.append(buffer)
+            continue
+        if small_buffers:
+            yield b"".join(small_buffers)
+            small_buffers = []
+        yield buffer
+    if small_buffers:
+        yield b"".join(small_buffers)
+
+
+def _send_buffers(sock: socket.socket, buffers: list[bytes | memoryview]) -> None:
+    if isinstance(sock, ssl.SSLSocket):
+        # sendmsg() is unsupported on TLS sockets
+        for buffer in coalesce_buffers(buffers):
+            sock.sendall(buffer)
+        return
+
+    views = [memoryview(buffer).cast("B") for buffer in buffers if len(buffer)]
+    first = 0
+    while first < len(views):
+        sent = sock.sendmsg(views[first : first + MAX_IOVEC])
+        while first < len(views) and sent >= len(views[first]):
+            sent -= len(views[first])
+            first += 1
+        if sent:
+            views[first] = views[first][sent:]
+
+
+def _send_file_region(sock: socket.socket, region: FileRegion) -> None:
+    if not region.size:
+        return
+    if isinstance(sock, ssl.SSLSocket):
+        sock.sendall(region.read())
+    else:
+        sock.sendfile(region.file, region.offset, region.size)
+
+
+def send_body(
+    sock: socket.socket, request_head: bytes | bytearray, data: RawBody
+) -> int:
+    """
+    Write a request head and body, returning the number of bytes written. Consecutive buffers
+    are gathered into vectored writes of at least RECV_SIZE bytes without being copied, and
+    FileRegions are sent with sendfile()
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = (data,)
+    pending: list[bytes | memoryview] = [request_head]
+    pending_size = len(request_head)
+    bytes_sent = 0
+    for data_piece in data:
+        if isinstance(data_piece, FileRegion):
+            _send_buffers(sock, pending)
+            bytes_sent += pending_size
+            pending, pending_size = [], 0
+            _send_file_region(sock, data_piece)
+            bytes_sent += data_piece.size
+            continue
+        pending.append(data_piece)
+        pending_size += len(data_piece)
+        if pending_size >= RECV_SIZE or len(pending) >= MAX_IOVEC:
+            _send_buffers(sock, pending)
+            bytes_sent += pending_size
+            pending, pending_size = [], 0
+    if pending:
+        _send_buffers(sock, pending)
+        bytes_sent += pending_size
+    return bytes_sent
+
+
+def send_throttled(
+    sock: socket.socket,
+    request_head: bytes | bytearray,
+    data: RawBody,
+    throttle: UploadThrottle,
+) -> int:
+    """
+    Write a request head and body the way a slow client would (see UploadThrottle), returning
+    the number of bytes written
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = (data,)
+    pacer = UploadPacer(throttle)
+    bytes_sent = 0
+    delay = 0.0
+    for data_piece in chain((request_head,), data):
+        for write in throttle.split(data_piece):
+            # Waiting before each write rather than after it keeps the last one from delaying
+            # the response
+            if delay > 0:
+                time.sleep(delay)
+            sock.sendall(write)
+            bytes_sent += len(write)
+            delay = pacer.delay_after(len(write))
+    return bytes_sent
+
+
+def _is_connection_dropped(sock: socket.socket) -> bool:
+    # An idle keep-alive socket should have nothing to read; readable means EOF or garbage
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class RawHttpConnectionPool:
+    """
+    Keep-alive pool of raw sockets keyed by scheme, host and port. All TLS connections share a
+    single SSL context and resume the last session negotiated with the same host. Requests sent
+    with Expect: 100-continue hold their body back for up to continue_timeout, and never send it
+    if a final response comes first
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = 32,
+        timeout: float = DEFAULT_TIMEOUT,
+        ssl_context: ssl.SSLContext | None = None,
+        continue_timeout: float = CONTINUE_TIMEOUT,
+    ):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.continue_timeout = continue_timeout
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        self.ssl_context = ssl_context
+        self._idle: dict[tuple[str, str, int], list[socket.socket]] = {}
+        self._tls_sessions: dict[tuple[str, str, int], ssl.SSLSession] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, pool_key: tuple[str, str, int]) -> socket.socket:
+        scheme, hostname, port = pool_key
+        with timed_phase("connect"):
+            sock = socket.create_connection((hostname, port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if scheme != "https":
+            return sock
+        try:
+            with timed_phase("tls"):
+                return self.ssl_context.wrap_socket(
+                    sock,
+                    server_hostname=hostname,
+                    session=self._tls_sessions.get(pool_key),
+                )
+        except Exception:
+            sock.close()
+            raise
+
+    def _acquire(self, pool_key: tuple[str, str, int]) -> tuple[socket.socket, bool]:
+        with self._lock:
+            idle_socks = self._idle.get(pool_key, [])
+            while idle_socks:
+                sock = idle_socks.pop()
+                if not _is_connection_dropped(sock):
+                    return sock, True
+                sock.close()
+        return self._connect(pool_key), False
+
+    def _release(self, pool_key: tuple[str, str, int], sock: socket.socket) -> None:
+        with self._lock:
+            if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+                self._tls_sessions[pool_key] = sock.session
+            idle_socks = self._idle.setdefault(pool_key, [])
+            if len(idle_socks) < self.max_idle_per_host:
+                idle_socks.append(sock)
+                return
+        sock.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for idle_socks in self._idle.values():
+                for sock in idle_socks:
+                    sock.close()
+            self._idle.clear()
+
+    def request(
+        self,
+        method: str,
+        final_url: str,
+        headers: dict[str, str],
+        data: RawBody = b"",
+        body_sink: Callable[[memoryview], None] | None = None,
+        throttle: UploadThrottle | None = None,
+    ) -> RawHttpResponse:
+        pool_key, request_head = prepare_raw_request(method, final_url, headers)
+        replayable = isinstance(data, (bytes, bytearray, memoryview))
+        expect_continue = expects_continue(headers)
+
+        sock, reused = self._acquire(pool_key)
+        try:
+            response = self._send_and_receive(
+                sock,
+                method,
+                request_head,
+                data,
+                body_sink,
+                throttle,
+                expect_continue,
+                may_be_stale=reused and replayable,
+            )
+        except StaleConnectionError:
+            sock.close()
+            # The server closed an idle keep-alive connection under us; retry once. Anything
+            # else, timeouts and resets after a response started included, is the result
+            sock = self._connect(pool_key)
+            try:
+                response = self._send_and_receive(
+                    sock,
+                    method,
+                    request_head,
+                    data,
+                    body_sink,
+                    throttle,
+                    expect_continue,
+                )
+            except BaseException:
+                sock.close()
+                raise
+        except BaseException:
+            sock.close()
+            raise
+
+        if response.keep_alive:
+            if throttle is not None:
+                sock.settimeout(self.timeout)
+            self._release(pool_key, sock)
+        else:
+            sock.close()
+        return response
+
+    def _await_continue(
+        self,
+        sock: socket.socket,
+        parser: HttpResponseParser,
+        timeout: float,
+        may_be_stale: bool = False,
+    ) -> int:
+        """
+        Read until 100 Continue or a final response arrives, for at most continue_timeout.
+        Returns the number of bytes received
+        """
+        bytes_received = 0
+        deadline = time.perf_counter() + self.continue_timeout
+        try:
+            while not (parser.continue_received or parser.headers_complete):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    received = _recv(sock, may_be_stale and not bytes_received)
+                except TimeoutError:
+                    break
+                if not received:
+                    parser.feed_eof()
+                    break
+                bytes_received += len(received)
+                parser.feed(received)
+        finally:
+            sock.settimeout(timeout)
+        return bytes_received
+
+    def _send_and_receive(
+        self,
+        sock: socket.socket,
+        method: str,
+        request_head: bytearray,
+        data: RawBody,
+        body_sink: Callable[[memoryview], None] | None,
+        throttle: UploadThrottle | None = None,
+        expect_continue: bool = False,
+        may_be_stale: bool = False,
+    ) -> RawHttpResponse:
+        """
+        With may_be_stale, failures that can only mean the server had closed the connection
+        before the request arrived raise StaleConnectionError: a reset or EOF on a first write
+        that holds the whole request, or on the first read
+        """
+        exchange_timer = ExchangeTimer()
+        timeout = self.timeout
+        if throttle is not None:
+            timeout = throttle.timeout
+            sock.settimeout(timeout)
+
+        def _send(head: bytes | bytearray, body: RawBody, first: bool = False) -> int:
+            try:
+                if throttle is None:
+                    return send_body(sock, head, body)
+                return send_throttled(sock, head, body, throttle)
+            except STALE_CONNECTION_ERRORS as e:
+                # Larger or throttled requests take several writes, and a reset halfway
+                # through is the result
+                if (
+                    first
+                    and may_be_stale
+                    and throttle is None
+                    and len(head) + len(body) <= RECV_SIZE
+                ):
+                    raise StaleConnectionError(
+                        f"Stale keep-alive connection: {e}"
+                    ) from e
+                raise
+
+        parser = HttpResponseParser(method, body_sink)
+        bytes_received = 0
+        continue_outcome = None
+        if expect_continue:
+            # The body only follows once the server agrees to it, or does not answer in time
+            bytes_sent = _send(request_head, b"", first=True)
+            waiting_since = time.perf_counter()
+            bytes_received = self._await_continue(sock, parser, timeout, may_be_stale)
+            continue_outcome = parser.continue_outcome
+            exchange_timer.continue_outcome(
+                continue_outcome, time.perf_counter() - waiting_since
+            )
+            if continue_outcome != CONTINUE_FINAL_RESPONSE:
+                bytes_sent += _send(b"", data)
+                # The body has gone out, so the server has seen the request by now
+                may_be_stale = False
+        else:
+            bytes_sent = _send(request_head, data, first=True)
+
+        while not parser.complete:
+            received = _recv(sock, may_be_stale and not bytes_received)
+            exchange_timer.first_byte()
+            if not received:
+                parser.feed_eof()
+                break
+            bytes_received += len(received)
+            parser.feed(received)
+        exchange_timer.finish(bytes_sent, bytes_received)
+        parser.response.continue_outcome = continue_outcome
+        return parser.response
+
+
+def _recv(sock: socket.socket, first_read_of_stale: bool) -> bytes:
+    """Read from sock; first_read_of_stale turns a reset or EOF into StaleConnectionError"""
+    try:
+        received = sock.recv(RECV_SIZE)
+    except STALE_CONNECTION_ERRORS as e:
+        if first_read_of_stale:
+            raise StaleConnectionError(f"Stale keep-alive connection: {e}") from e
+        raise
+    if not received and first_read_of_stale:
+        raise StaleConnectionError(
+            "Stale keep-alive connection: closed before responding"
         )
+    return received
+
+
+_DEFAULT_POOL: RawHttpConnectionPool | None = None
+_DEFAULT_POOL_LOCK = threading.Lock()
+
+
+def get_default_pool() -> RawHttpConnectionPool:
+    # Created on first use: loading the default CA bundle slows down every import otherwise
+    global _DEFAULT_POOL
+    if _DEFAULT_POOL is None:
+        with _DEFAULT_POOL_LOCK:
+            if _DEFAULT_POOL is None:
+                _DEFAULT_POOL = RawHttpConnectionPool()
+    return _DEFAULT_POOL
+
+
+def send_raw_http_request(
+    final_url: str,
+    headers: dict[str, str],
+    data: RawBody,
+    method: str = "PUT",
+    pool: RawHttpConnectionPool | None = None,
+    throttle: UploadThrottle | None = None,
+) -> int:
+    """
+    Horrible (but useful) helper to send HTTP requests by hand since most libraries don't support
+    HTTP trailer headers. data may be an iterable of byte buffers, which is streamed to the socket,
+    slowly when throttled
+    """
+    return (
+        (pool or get_default_pool())
+        .request(method, final_url, headers, data, throttle=throttle)
+        .status_code
+    )
@@ -3,29 +3,38 @@ import datetime as dt
 import hashlib
 from .datamodel import BaseSignedAwsRequest, RuntimeConfig
 from .constants import TEST_CONTENT_TYPE, DEFAULT_REGION, AWS_TIMESTAMP_FORMAT
+from .timings import timed_phase
 from typing import Callable
-from botocore.awsrequest import AWSRequest
-from botocore.auth import SigV4Auth
-from botocore.credentials import Credentials
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlencode, urljoin, urlparse
 
 
-def sha256(data: str) -> str:
-    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+def sha256(data: str | bytes | memoryview) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
 
 
+@timed_phase("signing")
 def build_request(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
     method: str,
     header_modifier: Callable[[dict[str, str]], None] | None = None,
+    query: dict[str, str] | None = None,
 ) -> BaseSignedAwsRequest:
+    # Imported on first use so that startup does not pay for botocore
+    from botocore.auth import SigV4Auth
+    from botocore.awsrequest import AWSRequest
+    from botocore.credentials import Credentials
+
     if header_modifier is None:
         header_modifier = lambda _: None  # noqa: E731
     base_url = runtime_config.s3_endpoint
     base_url = base_url + "/" if not base_url.endswith("/") else base_url
     final_url = urljoin(base_url, f"{bucket}/{key}")
+    if query:
+        final_url += f"?{urlencode(query)}"
     parsed_url = urlparse(final_url)
 
     headers = {
@@ -0,0 +1,124 @@
+import csv
+import json
+import threading
+from typing import Any, Iterator
+from .datamodel import PHASES, TestResult
+
+# One flat record per finished test case, in the same layout for JSONL and CSV files
+RESULT_FIELDS = (
+    "case",
+    "request_content",
+    "content_length_header",
+    "decoded_content_length_header",
+    "sha256_header",
+    "transfer_encoding_header",
+    "content_encoding_header",
+    "result",
+    "latency_ms",
+    *(f"{phase}_ms" for phase in PHASES),
+    "bytes_sent",
+    "bytes_received",
+    "continue_outcome",
+)
+_BOOL_FIELDS = ("content_length_header", "decoded_content_length_header")
+_FLOAT_FIELDS = ("latency_ms", *(f"{phase}_ms" for phase in PHASES))
+_INT_FIELDS = ("bytes_sent", "bytes_received")
+
+
+def is_csv_path(path: str) -> bool:
+    """Result files are CSV when named *.csv and JSONL otherwise"""
+    return path.lower().endswith(".csv")
+
+
+def _milliseconds(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def result_record(case: str, result: TestResult) -> dict[str, Any]:
+    timings = result.timings
+    return {
+        "case": case,
+        "request_content": result.request_content,
+        "content_length_header": result.content_length_header,
+        "decoded_content_length_header": result.decoded_content_length_header,
+        "sha256_header": result.sha256_header,
+        "transfer_encoding_header": result.transfer_encoding_header,
+        "content_encoding_header": result.content_encoding_header,
+        "result": result.result,
+        "latency_ms": _milliseconds(result.elapsed),
+        **{
+            f"{phase}_ms": _milliseconds(getattr(timings, phase, None))
+            for phase in PHASES
+        },
+        "bytes_sent": timings.bytes_sent if timings is not None else None,
+        "bytes_received": timings.bytes_received if timings is not None else None,
+        "continue_outcome": timings.continue_outcome if timings is not None else None,
+    }
+
+
+class ResultWriter:
+    """
+    Thread-safe writer appending one record per finished test case. Every record is flushed as
+    it is written, so an interrupted run still leaves a usable file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8", newline="", buffering=1)
+        self._csv_writer = None
+        if is_csv_path(path):
+            self._csv_writer = csv.DictWriter(
+                self._file, RESULT_FIELDS, lineterminator="\n"
+            )
+            self._csv_writer.writeheader()
+        self._lock = threading.Lock()
+
+    def write(self, case: str, result: TestResult) -> None:
+        record = result_record(case, result)
+        with self._lock:
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _parse_csv_record(row: dict[str, str]) -> dict[str, Any]:
+    # csv keeps everything as text; "" stands for None
+    record: dict[str, Any] = {name: value or None for name, value in row.items()}
+    for name in _BOOL_FIELDS:
+        if record.get(name) is not None:
+            record[name] = record[name] == "True"
+    for name in _FLOAT_FIELDS:
+        if record.get(name) is not None:
+            record[name] = float(record[name])
+    for name in _INT_FIELDS:
+        if record.get(name) is not None:
+            record[name] = int(record[name])
+    if record.get("result") is not None and record["result"].isdigit():
+        record["result"] = int(record["result"])
+    return record
+
+
+def iter_result_records(path: str) -> Iterator[dict[str, Any]]:
+    """Lazily read the records of a result file, one line at a time"""
+    with open(path, encoding="utf-8", newline="") as result_file:
+        if is_csv_path(path):
+            for row in csv.DictReader(result_file):
+                yield _parse_csv_record(row)
+            return
+        for line_number, line in enumerate(result_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from None
@@ -0,0 +1,120 @@
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from .constants import DEFAULT_HTTP_POOL_SIZE
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+    from botocore.config import Config
+
+# Setup and verification calls are not what is being measured, so they may retry a little
+S3_CLIENT_MAX_ATTEMPTS = 3
+S3_CLIENT_CONNECT_TIMEOUT = 10.0
+S3_CLIENT_READ_TIMEOUT = 60.0
+
+
+@dataclass
+class S3ClientStats:
+    """
+    Usage of the shared client's connection pool. in_flight counts requests between being sent
+    and their response head arriving; streamed bodies still being read are not included
+    """
+
+    max_pool_connections: int
+    requests: int = 0
+    retries: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+
+    @property
+    def pool_exhausted(self) -> bool:
+        """Whether more requests ran at once than the pool keeps connections for"""
+        return self.peak_in_flight > self.max_pool_connections
+
+    def format(self) -> str:
+        summary = (
+            f"S3 client: {self.requests} requests, {self.retries} retries, at most "
+            f"{self.peak_in_flight} requests in flight for {self.max_pool_connections} "
+            "pooled connections"
+        )
+        if self.pool_exhausted:
+            summary += "; raise the pool size to stop connections from being discarded"
+        return summary
+
+
+def s3_client_config(max_pool_connections: int) -> "Config":
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=S3_CLIENT_CONNECT_TIMEOUT,
+        read_timeout=S3_CLIENT_READ_TIMEOUT,
+        retries={"max_attempts": S3_CLIENT_MAX_ATTEMPTS, "mode": "standard"},
+        tcp_keepalive=True,
+    )
+
+
+class S3ClientProvider:
+    """
+    Builds the boto3 S3 client of a RuntimeConfig on first use and shares it between threads.
+    botocore clients are thread-safe once built, but building one is slow and goes through a
+    boto3 session that is not, so it happens once, under a lock. Requests made with the client
+    are counted in stats()
+    """
+
+    def __init__(
+        self,
+        s3_endpoint: str,
+        access_key: str,
+        secret_access_key: str,
+        max_pool_connections: int = DEFAULT_HTTP_POOL_SIZE,
+    ):
+        self.s3_endpoint = s3_endpoint
+        self.access_key = access_key
+        self.secret_access_key = secret_access_key
+        self.max_pool_connections = max_pool_connections
+        self._client: "BaseClient | None" = None
+        self._lock = threading.Lock()
+        self._stats = S3ClientStats(max_pool_connections)
+
+    @property
+    def client(self) -> "BaseClient":
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> "BaseClient":
+        # Imported here as boto3 takes longer to import than most short runs take to finish
+        import boto3
+
+        client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=self.s3_endpoint,
+            aws_access_key_id=self.access_key,
+            aws_secret_access_key=self.secret_access_key,
+            verify=False,
+            config=s3_client_config(self.max_pool_connections),
+        )
+        client.meta.events.register("before-send.s3", self._request_sent)
+        client.meta.events.register("response-received.s3", self._response_received)
+        return client
+
+    def _request_sent(self, **_) -> None:
+        with self._lock:
+            self._stats.requests += 1
+            self._stats.in_flight += 1
+            self._stats.peak_in_flight = max(
+                self._stats.peak_in_flight, self._stats.in_flight
+            )
+
+    def _response_received(self, context: dict | None = None, **_) -> None:
+        with self._lock:
+            self._stats.in_flight -= 1
+            if context and context.get("retries", {}).get("attempt", 1) > 1:
+                self._stats.retries += 1
+
+    def stats(self) -> S3ClientStats:
+        with self._lock:
+            return S3ClientStats(**vars(self._stats))
@@ -1,8 +1,21 @@
-import io
+import hashlib
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from .datamodel import RuntimeConfig
-from botocore.exceptions import ClientError
-from dataclasses import dataclass
-from typing import Any
+from .timings import timed_phase
+from .streams import (
+    Payload,
+    PayloadInput,
+    as_payload_source,
+    iter_source_slices,
+)
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+VERIFICATION_READ_SIZE = 64 * 1024
+
+_VERIFY_CONTENT: ContextVar[bool] = ContextVar("verify_content", default=True)
 
 
 @dataclass
@@ -11,19 +24,33 @@ class S3File:
     metadata: dict[str, Any] | None = None
 
 
+@dataclass
+class ContentVerification:
+    matches: bool
+    bytes_read: int
+    mismatch_offset: int | None = None
+    sha256: str | None = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+def _get_object(
+    runtime_config: RuntimeConfig, bucket: str, key: str
+) -> tuple[Any, dict]:
+    response = runtime_config.s3_client.get_object(Bucket=bucket, Key=key)
+    body = response.pop("Body")
+    response.pop("ResponseMetadata", None)
+    return body, response
+
+
 def get_file_from_s3(
     runtime_config: RuntimeConfig, bucket: str, key: str
 ) -> S3File | None:
     def _do_get():
-        s3client = runtime_config.s3_client
-        out = io.BytesIO()
-        s3client.download_fileobj(Bucket=bucket, Key=key, Fileobj=out)
-        out.seek(0)
-        object_metadata = s3client.head_object(Bucket=bucket, Key=key)
-        if "ResponseMetadata" in object_metadata:
-            object_metadata.pop("ResponseMetadata")
-
-        return S3File(contents=out.read().decode("utf-8"), metadata=object_metadata)
+        body, object_metadata = _get_object(runtime_config, bucket, key)
+        with body:
+            return S3File(
+                contents=body.read().decode("utf-8"), metadata=object_metadata
+            )
 
     try:
         return _do_get()
@@ -31,15 +58,132 @@ def get_file_from_s3(
         return None
 
 
+def _iter_expected(
+    expected_content: PayloadInput | Iterable[bytes],
+) -> Iterable[bytes | memoryview]:
+    if isinstance(expected_content, (str, os.PathLike)):
+        expected_content = as_payload_source(expected_content)
+    if isinstance(expected_content, (bytes, bytearray, memoryview, Payload)) or hasattr(
+        expected_content, "read"
+    ):
+        return iter_source_slices(expected_content, VERIFICATION_READ_SIZE)
+    return expected_content
+
+
+def _next_piece(pieces: Iterator[bytes | memoryview]) -> memoryview:
+    for piece in pieces:
+        if piece:
+            return memoryview(piece).cast("B")
+    return memoryview(b"")
+
+
+def _first_difference(left: memoryview, right: memoryview) -> int:
+    return next(
+        (position for position, (a, b) in enumerate(zip(left, right)) if a != b),
+        min(len(left), len(right)),
+    )
+
+
+def verify_s3_content(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    expected_content: PayloadInput | Iterable[bytes] | None = None,
+    expected_sha256: str | None = None,
+) -> ContentVerification:
+    """
+    Fetch an object with a single GetObject and check it against expected_content, streamed
+    byte by byte, and/or against the hex SHA-256 digest expected_sha256. The object is never
+    held in memory as a whole
+    """
+    body, object_metadata = _get_object(runtime_config, bucket, key)
+    result = ContentVerification(matches=True, bytes_read=0, metadata=object_metadata)
+    hasher = hashlib.sha256() if expected_sha256 is not None else None
+    expected_pieces = (
+        iter(_iter_expected(expected_content)) if expected_content is not None else None
+    )
+    pending = memoryview(b"")
+
+    with body:
+        for received in body.iter_chunks(VERIFICATION_READ_SIZE):
+            if hasher is not None:
+                hasher.update(received)
+            received_view = memoryview(received)
+            while expected_pieces is not None and received_view and result.matches:
+                if not pending:
+                    pending = _next_piece(expected_pieces)
+                    if not pending:
+                        # Object is longer than expected
+                        result.matches = False
+                        result.mismatch_offset = result.bytes_read
+                        break
+                size = min(len(pending), len(received_view))
+                if pending[:size] != received_view[:size]:
+                    result.matches = False
+                    result.mismatch_offset = result.bytes_read + _first_difference(
+                        pending[:size], received_view[:size]
+                    )
+                    break
+                pending = pending[size:]
+                received_view = received_view[size:]
+                result.bytes_read += size
+            if expected_pieces is None or not result.matches:
+                result.bytes_read += len(received_view)
+            if hasher is None and not result.matches:
+                break
+
+    if expected_pieces is not None and result.matches:
+        if pending or _next_piece(expected_pieces):
+            # Object is shorter than expected
+            result.matches = False
+            result.mismatch_offset = result.bytes_read
+    if hasher is not None:
+        result.sha256 = hasher.hexdigest()
+        if result.sha256 != expected_sha256.lower():
+            result.matches = False
+    return result
+
+
+@contextmanager
+def content_verification(enabled: bool) -> Iterator[None]:
+    """Enable or disable ensure_content_matches for test cases run in this context"""
+    token = _VERIFY_CONTENT.set(enabled)
+    try:
+        yield
+    finally:
+        _VERIFY_CONTENT.reset(token)
+
+
 def ensure_content_matches(
-    runtime_config: RuntimeConfig, bucket: str, key: str, expected_content: str
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    expected_content: PayloadInput | Iterable[bytes],
 ) -> None:
+    if not _VERIFY_CONTENT.get():
+        return
+    with timed_phase("verification"):
+        verification = verify_s3_content(runtime_config, bucket, key, expected_content)
     assert (
-        get_file_from_s3(runtime_config, bucket, key).contents == expected_content
-    ), "Unexpected contents"
+        verification.matches
+    ), f"Unexpected contents (first mismatch at byte {verification.mismatch_offset})"
+
+
+def ensure_etag_matches(
+    runtime_config: RuntimeConfig, bucket: str, key: str, expected_etag: str
+) -> None:
+    if not _VERIFY_CONTENT.get():
+        return
+    with timed_phase("verification"):
+        etag = runtime_config.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+    assert etag.strip('"') == expected_etag.strip(
+        '"'
+    ), f"Unexpected ETag {etag}, expected {expected_etag}"
 
 
 def ensure_bucket_exists(runtime_config: RuntimeConfig, bucket_name: str) -> None:
+    from botocore.exceptions import ClientError
+
     def _try_extract_nested_error(
         parent_key: str, child_key: str, resp: dict
     ) -> int | None:
@@ -54,6 +198,11 @@ def ensure_bucket_exists(runtime_config: RuntimeConfig, bucket_name: str) -> Non
                     pass
         return None
 
+    def _try_extract_nested_code(resp: dict) -> str | None:
+        if isinstance(resp, dict) and isinstance(error := resp.get("Error"), dict):
+            return error.get("Code")
+        return None
+
     def _does_bucket_exist() -> bool:
         try:
             runtime_config.s3_client.head_bucket(Bucket=bucket_name)
@@ -72,5 +221,21 @@ def ensure_bucket_exists(runtime_config: RuntimeConfig, bucket_name: str) -> Non
                 return False
             raise
 
-    if not _does_bucket_exist():
-        runtime_config.s3_client.create_bucket(Bucket=bucket_name)
+    def _create_if_missing() -> None:
+        if _does_bucket_exist():
+            return
+        try:
+            runtime_config.s3_client.create_bucket(Bucket=bucket_name)
+        except ClientError as e:
+            # Another process may have won the race to create it
+            if _try_extract_nested_code(e.response) != "BucketAlreadyOwnedByYou":
+                raise
+
+    runtime_config.known_buckets.ensure(bucket_name, _create_if_missing)
+
+
+def invalidate_known_buckets(
+    runtime_config: RuntimeConfig, bucket_name: str | None = None
+) -> None:
+    """Forget cached bucket existence, e.g. after deleting buckets outside ensure_bucket_exists"""
+    runtime_config.known_buckets.invalidate(bucket_name)
@@ -0,0 +1,122 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from .constants import DEFAULT_HTTP_POOL_SIZE
+from .timings import ExchangeTimer, add_phase
+
+
+class _TimedConnectionMixin:
+    exchange_timer: ExchangeTimer | None = None
+    bytes_sent = 0
+    _tcp_connect_seconds = 0.0
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        sock = super()._new_conn()
+        self._tcp_connect_seconds = time.perf_counter() - started
+        add_phase("connect", self._tcp_connect_seconds)
+        return sock
+
+    def request(self, *args, **kwargs) -> None:
+        # http.client connects lazily on the first write; connect first so the exchange does
+        # not include it
+        if self.sock is None:
+            self.connect()
+        self.bytes_sent = 0
+        self.exchange_timer = ExchangeTimer()
+        super().request(*args, **kwargs)
+
+    def send(self, data) -> None:
+        if not hasattr(data, "read"):
+            self.bytes_sent += len(data)
+        super().send(data)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        if self.exchange_timer is not None:
+            self.exchange_timer.first_byte()
+        return response
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self) -> None:
+        started = time.perf_counter()
+        super().connect()
+        add_phase("tls", time.perf_counter() - started - self._tcp_connect_seconds)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+def _response_size(response: requests.Response, with_body: bool) -> int:
+    # http.client does not expose the raw head, so its size is rebuilt from the parsed one
+    raw = response.raw
+    head_size = len(f"HTTP/1.1 {response.status_code} {response.reason}\r\n") + 2
+    head_size += sum(len(f"{name}: {value}\r\n") for name, value in raw.headers.items())
+    return head_size + (len(response.content) if with_body else 0)
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections report TCP connect, TLS handshake, TTFB, response time and
+    bytes on the wire to the current phase recorder, as the raw clients do
+    """
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs) -> requests.Response:
+        response = super().send(request, stream=stream, **kwargs)
+        connection = response.raw.connection
+        exchange_timer = getattr(connection, "exchange_timer", None)
+        if exchange_timer is not None:
+            bytes_sent = connection.bytes_sent
+            if not stream:
+                # Read the body here, where it is still part of the timed exchange
+                response.content
+            exchange_timer.finish(bytes_sent, _response_size(response, not stream))
+        return response
+
+
+class PooledSession:
+    """
+    requests session shared by every thread of a run. Connections are kept alive in a single
+    TimedHTTPAdapter, whose pools are thread-safe, while each thread sends through its own
+    requests.Session, which is not. Nothing is retried unless asked to, so every result reflects
+    a single attempt
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_HTTP_POOL_SIZE, retries: int = 0):
+        self.adapter = TimedHTTPAdapter(pool_maxsize=pool_size, max_retries=retries)
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.session().put(url, **kwargs)
+
+    def close(self) -> None:
+        self.adapter.close()
@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+from .constants import EMPTY_SHA256
+from .datamodel import BaseSignedAwsRequest
+
+CHUNK_SIGNING_ALGORITHM = "AWS4-HMAC-SHA256-PAYLOAD"
+TRAILER_SIGNING_ALGORITHM = "AWS4-HMAC-SHA256-TRAILER"
+
+
+def derive_signing_key(
+    secret_access_key: str, date_stamp: str, region: str, service: str
+) -> bytes:
+    key = f"AWS4{secret_access_key}".encode("utf-8")
+    for scope_part in (date_stamp, region, service, "aws4_request"):
+        key = hmac.new(key, scope_part.encode("utf-8"), hashlib.sha256).digest()
+    return key
+
+
+class ChunkSigner:
+    """
+    Signs aws-chunked chunks for a single request. The signing key and the constant part of
+    the string to sign are computed once, so each chunk costs a single HMAC
+    """
+
+    def __init__(
+        self,
+        signing_key: bytes,
+        formatted_timestamp: str,
+        scope: str,
+        algorithm: str = CHUNK_SIGNING_ALGORITHM,
+    ):
+        self.signing_key = signing_key
+        self.formatted_timestamp = formatted_timestamp
+        self.scope = scope
+        self._prefix_hmac = hmac.new(
+            signing_key,
+            f"{algorithm}\n{formatted_timestamp}\n{scope}\n".encode("utf-8"),
+            hashlib.sha256,
+        )
+
+    @classmethod
+    def from_signed_request(
+        cls,
+        built_request: BaseSignedAwsRequest,
+        algorithm: str = CHUNK_SIGNING_ALGORITHM,
+    ) -> "ChunkSigner":
+        return cls(
+            derive_signing_key(
+                built_request.secret_access_key,
+                built_request.request_timestamp.strftime("%Y%m%d"),
+                built_request.region,
+                built_request.service,
+            ),
+            built_request.formatted_request_timestamp,
+            built_request.key_path,
+            algorithm,
+        )
+
+    def sign(self, previous_signature: str, data_hash: str) -> str:
+        signer = self._prefix_hmac.copy()
+        signer.update(
+            f"{previous_signature}\n{EMPTY_SHA256}\n{data_hash}".encode("utf-8")
+        )
+        return signer.hexdigest()
+
+    def sign_chunk(
+        self, previous_signature: str, data_in_chunk: bytes | memoryview
+    ) -> str:
+        return self.sign(previous_signature, hashlib.sha256(data_in_chunk).hexdigest())
+
+    def sign_trailer(
+        self, previous_signature: str, trailer_headers: dict[str, str]
+    ) -> str:
+        """
+        x-amz-trailer-signature of the trailers following the final chunk, chained to that
+        chunk's signature. The trailers are hashed as name:value lines ending in a newline
+        """
+        canonical_trailers = "".join(
+            f"{name}:{value}\n" for name, value in trailer_headers.items()
+        )
+        string_to_sign = "\n".join(
+            (
+                TRAILER_SIGNING_ALGORITHM,
+                self.formatted_timestamp,
+                self.scope,
+                previous_signature,
+                hashlib.sha256(canonical_trailers.encode("utf-8")).hexdigest(),
+            )
+        )
+        return hmac.new(
+            self.signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
@@ -0,0 +1,355 @@
+import hashlib
+import io
+import mmap
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterable, Iterator
+
+DEFAULT_READ_SIZE = 64 * 1024
+# Few sendfile() calls per upload, while TLS, which reads regions into memory, stays bounded
+FILE_REGION_SIZE = 1024 * 1024
+
+
+class Payload(ABC):
+    """
+    Re-readable payload of known size. Every call to open() returns an independent reader
+    positioned at the start, so one payload can back concurrent uploads and verifications
+    """
+
+    size: int
+
+    def __len__(self) -> int:
+        return self.size
+
+    @abstractmethod
+    def open(self) -> BinaryIO: ...
+
+
+PayloadSource = bytes | bytearray | memoryview | Payload | BinaryIO
+# What test cases accept: text is encoded as UTF-8 and paths are read from disk
+PayloadInput = str | os.PathLike | PayloadSource
+
+
+class FileRegion:
+    """
+    Byte range of an open file. Raw HTTP clients send these with sendfile() where the
+    transport allows it, so the data never passes through user space
+    """
+
+    __slots__ = ("file", "offset", "size")
+
+    def __init__(self, file: BinaryIO, offset: int, size: int):
+        self.file = file
+        self.offset = offset
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def read(self) -> bytes:
+        parts = []
+        position = self.offset
+        remaining = self.size
+        while remaining > 0:
+            data = os.pread(self.file.fileno(), remaining, position)
+            if not data:
+                raise EOFError(f"{self.file.name} is shorter than expected")
+            parts.append(data)
+            position += len(data)
+            remaining -= len(data)
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+
+class FilePayload(Payload):
+    """
+    Payload backed by a file on disk, or a window of one. Chunking slices a memory map of the
+    file instead of copying it, and raw uploads can send it as FileRegions
+    """
+
+    def __init__(
+        self, path: str | os.PathLike, offset: int = 0, size: int | None = None
+    ):
+        self.path = os.fspath(path)
+        self.offset = offset
+        available = max(0, os.path.getsize(self.path) - offset)
+        self.size = available if size is None else max(0, min(size, available))
+
+    def __repr__(self) -> str:
+        return f"FilePayload({self.path!r}, offset={self.offset}, size={self.size})"
+
+    def open(self) -> BinaryIO:
+        reader = open(self.path, "rb")
+        reader.seek(self.offset)
+        return io.BufferedReader(_BoundedReader(reader, self.size), DEFAULT_READ_SIZE)
+
+    def map(self) -> memoryview:
+        """
+        Read-only view over the payload's bytes. The mapping is released once the view and
+        every slice taken from it have been garbage collected
+        """
+        if not self.size:
+            return memoryview(b"")
+        # mmap offsets must be aligned to the allocation granularity
+        start = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        with open(self.path, "rb") as file:
+            mapped = mmap.mmap(
+                file.fileno(),
+                self.offset + self.size - start,
+                access=mmap.ACCESS_READ,
+                offset=start,
+            )
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        return memoryview(mapped)[self.offset - start :]
+
+    def iter_regions(self, region_size: int) -> Iterator[FileRegion]:
+        """FileRegion counterpart of iter_source_slices, sharing one open file"""
+        with open(self.path, "rb") as file:
+            for position in range(0, self.size, region_size):
+                yield FileRegion(
+                    file,
+                    self.offset + position,
+                    min(region_size, self.size - position),
+                )
+
+
+class _SharedStreamReader(io.RawIOBase):
+    def __init__(self, payload: "StreamPayload"):
+        self._payload = payload
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position}.get(
+            whence, self._payload.size
+        )
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer).cast("B") as target:
+            data = self._payload.read_at(
+                self._position,
+                min(len(target), max(0, self._payload.size - self._position)),
+            )
+            target[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class StreamPayload(Payload):
+    """
+    Payload backed by a seekable file object, from its current position to the end. Test cases
+    read a payload several times (hashing, sending, verifying), so every reader seeks to its own
+    position under a lock and puts the stream back where it was found
+    """
+
+    def __init__(self, stream: BinaryIO):
+        if not (hasattr(stream, "seekable") and stream.seekable()):
+            raise ValueError(
+                f"Cannot use non-seekable {type(stream).__name__} as a payload, as it is read "
+                "more than once; pass bytes, a path or a Payload instead"
+            )
+        self.stream = stream
+        self.offset = stream.tell()
+        self.size = max(0, stream.seek(0, os.SEEK_END) - self.offset)
+        stream.seek(self.offset)
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"StreamPayload({self.stream!r}, offset={self.offset}, size={self.size})"
+
+    def read_at(self, position: int, size: int) -> bytes:
+        with self._lock:
+            previous = self.stream.tell()
+            try:
+                self.stream.seek(self.offset + position)
+                return _read_exactly(self.stream, size)
+            finally:
+                self.stream.seek(previous)
+
+    def open(self) -> BinaryIO:
+        return io.BufferedReader(_SharedStreamReader(self), DEFAULT_READ_SIZE)
+
+
+class SizedBody:
+    """
+    Iterable of byte buffers with a known total length, so HTTP clients send it with a
+    Content-Length header rather than falling back to chunked transfer encoding
+    """
+
+    def __init__(self, pieces: Iterable[bytes | memoryview], length: int):
+        self._pieces = pieces
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes | memoryview]:
+        return iter(self._pieces)
+
+
+class IterableReader(io.RawIOBase):
+    """Read-only file-like view over an iterable of byte buffers"""
+
+    def __init__(self, pieces: Iterable[bytes | memoryview]):
+        self._pieces = iter(pieces)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._pieces)).cast("B")
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def as_payload_source(data: PayloadInput) -> PayloadSource:
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    if isinstance(data, os.PathLike):
+        return FilePayload(data)
+    if not isinstance(data, (bytes, bytearray, memoryview, Payload)):
+        # Streams are re-read by every pass over the payload, or rejected up front
+        return StreamPayload(data)
+    return data
+
+
+def source_length(source: PayloadSource | SizedBody) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview, SizedBody, Payload)):
+        return len(source) if not isinstance(source, memoryview) else source.nbytes
+    position = source.tell()
+    try:
+        return source.seek(0, os.SEEK_END) - position
+    finally:
+        source.seek(position)
+
+
+def iter_source_slices(
+    source: PayloadSource | SizedBody, slice_size: int
+) -> Iterator[bytes | memoryview]:
+    """Yield consecutive non-empty slices of at most slice_size bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        reader = None
+    elif isinstance(source, FilePayload):
+        view = source.map()
+        reader = None
+    elif isinstance(source, SizedBody):
+        view = None
+        reader = io.BufferedReader(IterableReader(source), DEFAULT_READ_SIZE)
+    elif isinstance(source, Payload):
+        view = None
+        reader = source.open()
+    else:
+        view = None
+        reader = source
+
+    position = 0
+    try:
+        while True:
+            if view is not None:
+                data = view[position : position + slice_size]
+                position += len(data)
+            else:
+                data = _read_exactly(reader, slice_size)
+            if not data:
+                return
+            yield data
+    finally:
+        if reader is not None and isinstance(source, Payload):
+            reader.close()
+
+
+class _BoundedReader(io.RawIOBase):
+    def __init__(self, reader: BinaryIO, size: int):
+        self._reader = reader
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer).cast("B") as target:
+            data = self._reader.read(min(len(target), self._remaining))
+            target[: len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._reader.close()
+        super().close()
+
+
+class PayloadSlice(Payload):
+    """Window of size bytes starting at offset within another payload"""
+
+    def __init__(self, payload: Payload, offset: int, size: int):
+        self.payload = payload
+        self.offset = offset
+        self.size = max(0, min(size, len(payload) - offset))
+
+    def open(self) -> BinaryIO:
+        reader = self.payload.open()
+        reader.seek(self.offset)
+        return io.BufferedReader(_BoundedReader(reader, self.size), DEFAULT_READ_SIZE)
+
+
+def slice_source(source: PayloadSource, offset: int, size: int) -> PayloadSource:
+    """Zero-copy window over a re-readable payload source"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).cast("B")[offset : offset + size]
+    if isinstance(source, FilePayload):
+        return FilePayload(
+            source.path, source.offset + offset, min(size, len(source) - offset)
+        )
+    if isinstance(source, Payload):
+        return PayloadSlice(source, offset, size)
+    raise TypeError(f"Cannot slice one-shot payload source {type(source).__name__}")
+
+
+def source_sha256(source: PayloadSource) -> str:
+    hasher = hashlib.sha256()
+    for data in iter_source_slices(source, DEFAULT_READ_SIZE):
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+def get_sized_body(source: PayloadSource, file_regions: bool = False) -> SizedBody:
+    """
+    Unencoded upload body. With file_regions, a FilePayload is sent as FileRegions, which only
+    the raw clients accept
+    """
+    if file_regions and isinstance(source, FilePayload):
+        return SizedBody(source.iter_regions(FILE_REGION_SIZE), source.size)
+    return SizedBody(
+        iter_source_slices(source, DEFAULT_READ_SIZE), source_length(source)
+    )
+
+
+def _read_exactly(reader: BinaryIO, size: int) -> bytes:
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = reader.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return parts[0] if len(parts) == 1 else b"".join(parts)
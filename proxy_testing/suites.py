@@ -0,0 +1,504 @@
+import time
+from collections import namedtuple
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator
+from uuid import uuid4
+from tabulate import tabulate
+from .checksums import CHECKSUM_ALGORITHMS
+from .chunking import ChunkingPlan
+from .constants import LONG_TEXT
+from .datamodel import RuntimeConfig, TestResult
+from .downloads import download
+from .multipart import multipart_upload
+from .matrix import TestMatrix
+from .payloads import GeneratedPayload, parse_size
+from .s3_helpers import ensure_bucket_exists
+from .streams import source_sha256
+from .test_cases import (
+    SIGNED_TRAILER_PAYLOAD,
+    aws_chunked_upload,
+    aws_chunked_upload_with_chunked_transfer_encoding,
+    aws_chunked_upload_with_signed_trailer,
+    http_chunked_upload,
+    standard_upload,
+    unauthorized_upload,
+)
+from .timings import TIMING_HEADERS, record_phases, timing_columns
+
+TestRunner = namedtuple("TestRunner", ("callable", "args"))
+STANDARD_UPLOAD_TESTS = tuple(
+    TestRunner(standard_upload, args)
+    for args in (
+        {"data": "some small string", "hash_data": True},
+        {"data": "some small string", "hash_data": False},
+    )
+)
+AWS_CHUNKED_UPLOAD_TESTS = tuple(
+    TestRunner(aws_chunked_upload, args)
+    for args in (
+        # Cases with the STREAMING sha256 header
+        {
+            "data": LONG_TEXT,
+            "chunk_count": 3,
+            "content_encoding": "aws-chunked",
+            "add_decoded_content_length": True,
+        },
+        {
+            "data": LONG_TEXT,
+            "chunk_count": 3,
+            "content_encoding": "aws-chunked",
+            "add_decoded_content_length": False,
+        },
+    )
+)
+
+
+def _chunked_upload_runner(
+    test_callable: Callable[..., TestResult], **fixed_args: Any
+) -> Callable[..., TestRunner]:
+    """Builder for a matrix whose axes are arguments of test_callable"""
+    return lambda **axes: TestRunner(test_callable, {**fixed_args, **axes})
+
+
+HTTP_CHUNKED_TEST_CASES = TestMatrix(
+    axes={
+        "sha256_header": ("UNSIGNED-PAYLOAD", "STREAMING-UNSIGNED-PAYLOAD-TRAILER"),
+        "add_decoded_content_length": (True, False),
+        "trailer_header": (None, "x-amz-checksum-sha256"),
+    },
+    build=_chunked_upload_runner(
+        http_chunked_upload, data=LONG_TEXT, chunk_count=3, content_encoding=None
+    ),
+)
+
+AWS_CHUNKED_HTTP_CHUNKED_UPLOADS = TestMatrix(
+    axes={
+        "add_decoded_content_length": (True, False),
+        "trailer_header": (None, "x-amz-checksum-sha256"),
+    },
+    build=_chunked_upload_runner(
+        aws_chunked_upload_with_chunked_transfer_encoding,
+        data=LONG_TEXT,
+        aws_chunk_count=3,
+        http_chunk_count=3,
+        content_encoding="aws-chunked",
+        sha256_header="STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    ),
+)
+
+AWS_CHUNKED_SIGNED_TRAILER_UPLOADS = TestMatrix(
+    axes={
+        "checksum_algorithm": tuple(CHECKSUM_ALGORITHMS),
+        "chunk_count": (1, 3),
+    },
+    build=_chunked_upload_runner(
+        aws_chunked_upload_with_signed_trailer, data=LONG_TEXT
+    ),
+)
+
+# Large enough that sending the body of a rejected request is a visible waste
+EXPECT_CONTINUE_PAYLOAD = GeneratedPayload(8 * 1024 * 1024)
+EXPECT_CONTINUE_TESTS = (
+    TestRunner(
+        standard_upload, {"data": EXPECT_CONTINUE_PAYLOAD, "expect_continue": True}
+    ),
+    TestRunner(
+        http_chunked_upload,
+        {
+            "data": EXPECT_CONTINUE_PAYLOAD,
+            "chunk_count": 3,
+            "content_encoding": None,
+            "trailer_header": "x-amz-checksum-sha256",
+            "expect_continue": True,
+        },
+    ),
+    TestRunner(
+        unauthorized_upload,
+        {"data": EXPECT_CONTINUE_PAYLOAD, "expect_continue": True},
+    ),
+)
+
+DOWNLOAD_TESTS = (
+    *(
+        TestRunner(download, {"data": GeneratedPayload(1024 * 1024), "mode": mode})
+        for mode in ("full", "range", "multi-range", "chunked")
+    ),
+    TestRunner(
+        download,
+        {
+            "data": GeneratedPayload(16 * 1024 * 1024),
+            "mode": "parallel-range",
+            "range_count": 4,
+        },
+    ),
+)
+
+
+MULTIPART_UPLOAD_TESTS = tuple(
+    TestRunner(multipart_upload, args)
+    for args in (
+        {
+            "data": GeneratedPayload(12 * 1024 * 1024),
+            "part_size": 5 * 1024 * 1024,
+            "part_encoding": "plain",
+        },
+        {
+            "data": GeneratedPayload(12 * 1024 * 1024),
+            "part_size": 5 * 1024 * 1024,
+            "part_encoding": "aws-chunked",
+        },
+        {
+            "data": GeneratedPayload(12 * 1024 * 1024),
+            "part_size": 5 * 1024 * 1024,
+            "part_encoding": "http-chunked-trailer",
+        },
+    )
+)
+
+
+UPLOAD_ENCODINGS = (
+    "standard",
+    "aws-chunked",
+    "http-chunked",
+    "aws-chunked+http-chunked",
+)
+# "payload-hash" sends the hex SHA-256 of the payload, the others are sent verbatim
+SHA256_MODES = (
+    "payload-hash",
+    "UNSIGNED-PAYLOAD",
+    "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
+    SIGNED_TRAILER_PAYLOAD,
+)
+# crc32c is left to the smaller suites, as its pure Python fallback is slow on large payloads
+TRAILER_CHECKSUMS = (None, "x-amz-checksum-sha256", "x-amz-checksum-crc32")
+# Chunk counts, or chunk sizes when given as strings
+MATRIX_CHUNKINGS = (1, 3, 16, "8KiB", "64KiB")
+MATRIX_PAYLOAD_SIZES = (0, 1, 1024, 64 * 1024 + 1, 1024 * 1024)
+
+
+@lru_cache(maxsize=None)
+def _generated_payload_sha256(payload_size: int) -> str:
+    return source_sha256(GeneratedPayload(payload_size))
+
+
+def _matrix_chunk_count(chunking: int | str, payload_size: int) -> int:
+    if isinstance(chunking, int):
+        return chunking
+    return max(1, ChunkingPlan(payload_size, parse_size(chunking)).chunk_count)
+
+
+def _is_redundant_chunking(
+    encoding: str, chunking: int | str, payload_size: int, **_: Any
+) -> bool:
+    """
+    Whether the chunking splits the payload like one already covered: the first chunking, a
+    chunk count, or a single chunk. Plain uploads are not chunked at all
+    """
+    if chunking == MATRIX_CHUNKINGS[0]:
+        return False
+    if encoding == "standard":
+        return True
+    chunk_count = _matrix_chunk_count(chunking, payload_size)
+    return (
+        chunk_count == 1
+        or chunk_count > payload_size
+        or (isinstance(chunking, str) and chunk_count in MATRIX_CHUNKINGS)
+    )
+
+
+def _build_matrix_upload(
+    encoding: str,
+    sha256_mode: str,
+    decoded_length: bool,
+    trailer: str | None,
+    chunking: int | str,
+    payload_size: int,
+) -> TestRunner:
+    data = GeneratedPayload(payload_size)
+    if encoding == "standard":
+        return TestRunner(
+            standard_upload, {"data": data, "hash_data": sha256_mode == "payload-hash"}
+        )
+    chunk_count = _matrix_chunk_count(chunking, payload_size)
+    header_args = {
+        "sha256_header": (
+            _generated_payload_sha256(payload_size)
+            if sha256_mode == "payload-hash"
+            else sha256_mode
+        ),
+        "add_decoded_content_length": decoded_length,
+    }
+    if sha256_mode == SIGNED_TRAILER_PAYLOAD:
+        return TestRunner(
+            aws_chunked_upload_with_signed_trailer,
+            {
+                "data": data,
+                "chunk_count": chunk_count,
+                "checksum_algorithm": trailer.removeprefix("x-amz-checksum-"),
+                "add_decoded_content_length": decoded_length,
+            },
+        )
+    # Trailer values are computed while the payload is sent
+    trailer_args = {"trailer_header": trailer}
+    if encoding == "aws-chunked":
+        return TestRunner(
+            aws_chunked_upload,
+            {"data": data, "chunk_count": chunk_count, **header_args},
+        )
+    if encoding == "http-chunked":
+        return TestRunner(
+            http_chunked_upload,
+            {
+                "data": data,
+                "chunk_count": chunk_count,
+                "content_encoding": None,
+                **header_args,
+                **trailer_args,
+            },
+        )
+    return TestRunner(
+        aws_chunked_upload_with_chunked_transfer_encoding,
+        {
+            "data": data,
+            "aws_chunk_count": chunk_count,
+            "http_chunk_count": chunk_count,
+            "content_encoding": "aws-chunked",
+            **header_args,
+            **trailer_args,
+        },
+    )
+
+
+UPLOAD_MATRIX = TestMatrix(
+    axes={
+        "encoding": UPLOAD_ENCODINGS,
+        "sha256_mode": SHA256_MODES,
+        "decoded_length": (True, False),
+        "trailer": TRAILER_CHECKSUMS,
+        "chunking": MATRIX_CHUNKINGS,
+        "payload_size": MATRIX_PAYLOAD_SIZES,
+    },
+    build=_build_matrix_upload,
+    exclusions=(
+        # Plain uploads carry either the payload hash or UNSIGNED-PAYLOAD, and nothing else
+        {"encoding": "standard", "sha256_mode": SHA256_MODES[2:]},
+        {"encoding": "standard", "decoded_length": True},
+        {"encoding": "standard", "trailer": TRAILER_CHECKSUMS[1:]},
+        # aws-chunked bodies carry trailers only as signed ones, which need a checksum
+        {
+            "encoding": "aws-chunked",
+            "sha256_mode": SHA256_MODES[:-1],
+            "trailer": TRAILER_CHECKSUMS[1:],
+        },
+        {
+            "encoding": ("standard", "http-chunked", "aws-chunked+http-chunked"),
+            "sha256_mode": SHA256_MODES[-1],
+        },
+        {"sha256_mode": SHA256_MODES[-1], "trailer": None},
+        # An aws-chunked body never hashes to the payload's SHA-256
+        {
+            "encoding": ("aws-chunked", "aws-chunked+http-chunked"),
+            "sha256_mode": "payload-hash",
+        },
+        # Signed streaming announces aws-chunked framing, which a plain chunked body lacks
+        {"encoding": "http-chunked", "sha256_mode": SHA256_MODES[2]},
+        _is_redundant_chunking,
+    ),
+)
+
+
+EXECUTORS: dict[str, type[Executor]] = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+
+def _run_test_case(
+    config: RuntimeConfig, bucket_name: str, test_runner: TestRunner
+) -> TestResult:
+    test_callable, args = test_runner
+    started = time.perf_counter()
+    with record_phases() as recorder:
+        result = test_callable(config, bucket_name, uuid4().hex, **args)
+    result.elapsed = time.perf_counter() - started
+    result.timings = recorder.timings()
+    return result
+
+
+def _result_row(result: TestResult, show_timings: bool) -> tuple:
+    row = (
+        result.request_content,
+        result.content_length_header,
+        result.decoded_content_length_header,
+        result.sha256_header,
+        result.transfer_encoding_header,
+        result.content_encoding_header,
+        result.result,
+    )
+    return (*row, *timing_columns(result.timings)) if show_timings else row
+
+
+def run_tests(
+    config: RuntimeConfig,
+    tests_and_buckets: list[tuple[str, Iterable[TestRunner]]],
+    workers: int = 1,
+    executor: str = "thread",
+    show_timings: bool = False,
+    on_result: Callable[[int, TestResult], None] | None = None,
+):
+    """
+    Run the test cases and print their results as a table. on_result is called with each
+    result and its position in the schedule as soon as the case finishes
+    """
+    header_text = (
+        "Request Content",
+        "Content-Length header",
+        "X-Amz-Decoded-Content-Length header",
+        "X-Amz-Content-SHA256 header",
+        "Transfer-Encoding header",
+        "Content-Encoding header",
+        "Result",
+        *(TIMING_HEADERS if show_timings else ()),
+    )
+    for bucket_name, _ in tests_and_buckets:
+        try:
+            ensure_bucket_exists(config, bucket_name)
+        except Exception as e:
+            print(f"Could not set up bucket {bucket_name}: {e}")
+
+    scheduled = [
+        (bucket_name, test_runner)
+        for bucket_name, test_cases in tests_and_buckets
+        for test_runner in test_cases
+    ]
+    results: list[TestResult]
+    if executor == "asyncio":
+        # asyncio alone takes longer to import than the rest of the package
+        import asyncio
+        from .async_test_cases import run_test_cases_async
+
+        results = asyncio.run(
+            run_test_cases_async(
+                config,
+                [
+                    (bucket_name, test_callable, args)
+                    for bucket_name, (test_callable, args) in scheduled
+                ],
+                concurrency=workers,
+                on_result=on_result,
+            )
+        )
+    elif workers <= 1:
+        results = []
+        for position, (bucket_name, test_runner) in enumerate(scheduled):
+            results.append(_run_test_case(config, bucket_name, test_runner))
+            if on_result is not None:
+                on_result(position, results[-1])
+    else:
+        finished: dict[int, TestResult] = {}
+        with EXECUTORS[executor](max_workers=workers) as pool:
+            positions = {
+                pool.submit(_run_test_case, config, bucket_name, test_runner): position
+                for position, (bucket_name, test_runner) in enumerate(scheduled)
+            }
+            for future in as_completed(positions):
+                position = positions[future]
+                finished[position] = future.result()
+                if on_result is not None:
+                    on_result(position, finished[position])
+        results = [finished[position] for position in range(len(scheduled))]
+
+    print(
+        tabulate(
+            [_result_row(result, show_timings) for result in results],
+            headers=header_text,
+        )
+    )
+    if show_timings and executor != "process":
+        # Worker processes build clients of their own, whose usage is not seen here
+        print(f"\n{config.s3_clients.stats().format()}")
+
+
+TEST_SUITES = [
+    ("standard-upload-proxy-tests", STANDARD_UPLOAD_TESTS),
+    ("aws-chunked-proxy-tests", AWS_CHUNKED_UPLOAD_TESTS),
+    ("aws-chunked-http-chunked-proxy-tests", AWS_CHUNKED_HTTP_CHUNKED_UPLOADS),
+    ("raw-http-chunked-proxy-tests", HTTP_CHUNKED_TEST_CASES),
+    ("multipart-upload-proxy-tests", MULTIPART_UPLOAD_TESTS),
+    ("aws-chunked-signed-trailer-proxy-tests", AWS_CHUNKED_SIGNED_TRAILER_UPLOADS),
+    ("expect-continue-proxy-tests", EXPECT_CONTINUE_TESTS),
+    ("download-proxy-tests", DOWNLOAD_TESTS),
+]
+
+# Run on request only: the matrix is far larger than the default suites
+MATRIX_SUITES = [
+    ("upload-matrix-proxy-tests", UPLOAD_MATRIX),
+]
+
+
+def case_id(suite_name: str, index: int) -> str:
+    return f"{suite_name}/{index}"
+
+
+def describe_test_runner(test_runner: TestRunner) -> str:
+    test_callable, args = test_runner
+    arguments = ", ".join(
+        (
+            f"{name}={value!r}"
+            if not isinstance(value, str) or len(value) <= 32
+            else f"{name}=<{len(value)} chars>"
+        )
+        for name, value in args.items()
+    )
+    return f"{test_callable.__name__}({arguments})"
+
+
+def case_matches(suite_name: str, index: int, patterns: list[str] | None) -> bool:
+    """Whether a case id (suite/index) or its suite name matches any of the glob patterns"""
+    return not patterns or any(
+        fnmatchcase(case_id(suite_name, index), pattern)
+        or fnmatchcase(suite_name, pattern)
+        for pattern in patterns
+    )
+
+
+def iter_selected_cases(
+    suites: list[tuple[str, Iterable[TestRunner]]],
+    patterns: list[str] | None = None,
+    shard: tuple[int, int] | None = None,
+) -> Iterator[tuple[str, int, TestRunner]]:
+    """
+    Lazily yield (suite name, index, test runner) for the cases matching any of the patterns.
+    With shard (index, count), matching cases are dealt round-robin into count shards and only
+    shard index is kept, so shards are disjoint, cover every case and stay balanced
+    """
+    position = 0
+    for suite_name, test_cases in suites:
+        for index, test_runner in enumerate(test_cases):
+            if not case_matches(suite_name, index, patterns):
+                continue
+            if shard is None or position % shard[1] == shard[0]:
+                yield suite_name, index, test_runner
+            position += 1
+
+
+def select_test_cases(
+    suites: list[tuple[str, Iterable[TestRunner]]],
+    patterns: list[str] | None = None,
+    shard: tuple[int, int] | None = None,
+) -> list[tuple[str, tuple[TestRunner, ...]]]:
+    """Group the selected cases by suite, dropping suites left empty"""
+    selected: dict[str, list[TestRunner]] = {}
+    for suite_name, _, test_runner in iter_selected_cases(suites, patterns, shard):
+        selected.setdefault(suite_name, []).append(test_runner)
+    return [
+        (suite_name, tuple(test_cases)) for suite_name, test_cases in selected.items()
+    ]
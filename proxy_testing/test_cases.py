@@ -1,20 +1,40 @@
-from .raw_http import send_raw_http_request
-import requests
+from .raw_http import expects_continue, send_raw_http_request
+from dataclasses import replace
 from functools import wraps
-from typing import ParamSpec, TypeVar, Callable
+from typing import TYPE_CHECKING, Iterator, ParamSpec, TypeVar, Callable
 from .datamodel import RuntimeConfig, TestResult, BaseSignedAwsRequest
-from .request_helpers import build_request, sha256
+from .request_helpers import build_request
 from .s3_helpers import ensure_bucket_exists, ensure_content_matches
-from .aws_chunked import get_aws_chunked_content_length, get_aws_chunked_content_string
-from .http_chunked import get_http_encoded_chunks_raw
+from .aws_chunked import get_aws_chunked_body, get_aws_chunked_content_length
+from .checksums import DEFAULT_CHECKSUM_ALGORITHM, StreamingChecksum
+from .chunking import ChunkingPlan, as_chunking_plan
+from .http_chunked import iter_http_encoded_chunks_raw
+from .streams import (
+    PayloadInput,
+    PayloadSource,
+    SizedBody,
+    as_payload_source,
+    get_sized_body,
+    source_length,
+    source_sha256,
+)
+from .timings import timed_body, timed_iteration
+
+if TYPE_CHECKING:
+    import requests
+
+SIGNED_TRAILER_PAYLOAD = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD-TRAILER"
+EXPECT_CONTINUE_SUFFIX = "+expect-continue"
 
 ParamT = ParamSpec("ParamT")
 ReturnT = TypeVar("ReturnT")
 
 
-def _get_response_or_exc_info(
+def get_response_or_exc_info(
     wrapped: Callable[ParamT, ReturnT],
 ) -> Callable[ParamT, ReturnT | str]:
+    """Report an exception raised by a test case as its "FAILURE: ..." result"""
+
     @wraps(wrapped)
     def _(*args: ParamT.args, **kwargs: ParamT.kwargs) -> ReturnT | str:
         try:
@@ -25,66 +45,202 @@ def _get_response_or_exc_info(
     return _
 
 
-@_get_response_or_exc_info
-def _standard_upload(
+def _put_with_requests(
+    runtime_config: RuntimeConfig, url: str, data: SizedBody, headers: dict[str, str]
+) -> "requests.Response":
+    # SizedBody is iterated piece by piece, so large payloads are streamed rather than joined
+    return runtime_config.http_session.put(
+        url, data=data, headers=headers, verify=False
+    )
+
+
+def headers_to_send(
+    built_request: BaseSignedAwsRequest, expect_continue: bool = False
+) -> dict[str, str]:
+    headers = dict(built_request.request.headers.items())
+    if expect_continue:
+        # Added after signing, since SigV4 leaves Expect out of the signed headers anyway
+        headers["Expect"] = "100-continue"
+    return headers
+
+
+def _sends_raw(runtime_config: RuntimeConfig, headers: dict[str, str]) -> bool:
+    # Throttled uploads and Expect: 100-continue go through the raw client, as requests can
+    # neither pace its writes nor hold the body back
+    return runtime_config.upload_throttle is not None or expects_continue(headers)
+
+
+def _put(
+    runtime_config: RuntimeConfig, url: str, data: SizedBody, headers: dict[str, str]
+) -> int:
+    if _sends_raw(runtime_config, headers):
+        return send_raw_http_request(
+            url, headers, data, throttle=runtime_config.upload_throttle
+        )
+    return _put_with_requests(runtime_config, url, data, headers).status_code
+
+
+def prepare_standard_upload(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
-    hash_data: bool = True,
-) -> int:
+    data: PayloadInput,
+    hash_data: bool,
+    query: dict[str, str] | None = None,
+    payload_sha256: str | None = None,
+) -> BaseSignedAwsRequest:
+    payload = as_payload_source(data)
+
     def _prepare_headers(headers: dict[str, str]) -> None:
-        headers["Content-Length"] = str(len(data.encode("utf-8")))
+        headers["Content-Length"] = str(source_length(payload))
         if hash_data:
-            headers["X-Amz-Content-Sha256"] = sha256(data)
+            # Callers that already hashed the payload pass its digest in to save a read
+            headers["X-Amz-Content-Sha256"] = payload_sha256 or source_sha256(payload)
         else:
             headers["X-Amz-Content-Sha256"] = "UNSIGNED-PAYLOAD"
 
+    return build_request(runtime_config, bucket, key, "PUT", _prepare_headers, query)
+
+
+@get_response_or_exc_info
+def _standard_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    hash_data: bool = True,
+    expect_continue: bool = False,
+) -> int:
     ensure_bucket_exists(runtime_config, bucket)
-    built_request = build_request(runtime_config, bucket, key, "PUT", _prepare_headers)
-    response = requests.put(
+    payload = as_payload_source(data)
+    built_request = prepare_standard_upload(
+        runtime_config, bucket, key, payload, hash_data
+    )
+    headers = headers_to_send(built_request, expect_continue)
+    response_code = _put(
+        runtime_config,
         built_request.request.url,
-        data=data,
-        headers=dict(built_request.request.headers.items()),
-        verify=False,
+        get_sized_body(payload, file_regions=_sends_raw(runtime_config, headers)),
+        headers,
+    )
+    if 400 > response_code >= 200:
+        ensure_content_matches(runtime_config, bucket, key, payload)
+    return response_code
+
+
+def standard_upload_result(
+    hash_data: bool, result: int | str, expect_continue: bool = False
+) -> TestResult:
+    return TestResult(
+        f"unchunked content{EXPECT_CONTINUE_SUFFIX if expect_continue else ''}",
+        True,
+        False,
+        "actual hash" if hash_data else "UNSIGNED-PAYLOAD",
+        "not present",
+        "not present",
+        result,
     )
-    if response.ok:
-        ensure_content_matches(runtime_config, bucket, key, data)
-    return response.status_code
 
 
 def standard_upload(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
+    data: PayloadInput,
     hash_data: bool = True,
+    expect_continue: bool = False,
 ) -> TestResult:
+    return standard_upload_result(
+        hash_data,
+        _standard_upload(runtime_config, bucket, key, data, hash_data, expect_continue),
+        expect_continue,
+    )
+
+
+def wrong_secret(runtime_config: RuntimeConfig) -> RuntimeConfig:
+    return replace(
+        runtime_config, secret_access_key=f"{runtime_config.secret_access_key}-wrong"
+    )
+
+
+@get_response_or_exc_info
+def _unauthorized_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    expect_continue: bool,
+) -> int:
+    ensure_bucket_exists(runtime_config, bucket)
+    payload = as_payload_source(data)
+    built_request = prepare_standard_upload(
+        wrong_secret(runtime_config), bucket, key, payload, True
+    )
+    headers = headers_to_send(built_request, expect_continue)
+    response_code = _put(
+        runtime_config,
+        built_request.request.url,
+        get_sized_body(payload, file_regions=_sends_raw(runtime_config, headers)),
+        headers,
+    )
+    if 400 > response_code >= 200:
+        ensure_content_matches(runtime_config, bucket, key, payload)
+    return response_code
+
+
+def unauthorized_upload_result(expect_continue: bool, result: int | str) -> TestResult:
     return TestResult(
-        "unchunked content",
+        f"unchunked content, wrong signature"
+        f"{EXPECT_CONTINUE_SUFFIX if expect_continue else ''}",
         True,
         False,
-        "actual hash" if hash_data else "UNSIGNED-PAYLOAD",
+        "actual hash",
         "not present",
         "not present",
-        _standard_upload(runtime_config, bucket, key, data, hash_data),
+        result,
     )
 
 
-@_get_response_or_exc_info
-def _aws_chunked_upload(
+def unauthorized_upload(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
-    chunk_count: int,
+    data: PayloadInput,
+    expect_continue: bool = True,
+) -> TestResult:
+    """
+    Upload signed with the wrong secret key, which should be rejected with 403. With
+    expect_continue the rejection should come before any of the body is sent
+    """
+    return unauthorized_upload_result(
+        expect_continue,
+        _unauthorized_upload(runtime_config, bucket, key, data, expect_continue),
+    )
+
+
+def prepare_aws_chunked_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunking: int | ChunkingPlan,
     content_encoding: str | None,
     sha256_header: str,
     add_decoded_content_length: bool,
-) -> int:
-    total_data_length = len(data.encode("utf-8"))
+    query: dict[str, str] | None = None,
+    trailer_checksum_algorithm: str | None = None,
+) -> tuple[BaseSignedAwsRequest, SizedBody]:
+    payload = as_payload_source(data)
+    total_data_length = source_length(payload)
+    # The same plan sizes the Content-Length header and drives the encoder
+    plan = as_chunking_plan(total_data_length, chunking)
+    trailer_checksum = (
+        StreamingChecksum(trailer_checksum_algorithm)
+        if trailer_checksum_algorithm
+        else None
+    )
     total_chunked_content_size = get_aws_chunked_content_length(
-        total_data_length, chunk_count
+        total_data_length, plan, trailer_checksum
     )
 
     def _prepare_headers(headers: dict[str, str]) -> None:
@@ -93,40 +249,90 @@ def _aws_chunked_upload(
         headers["X-Amz-Content-Sha256"] = sha256_header
         if add_decoded_content_length:
             headers["X-Amz-Decoded-Content-Length"] = str(total_data_length)
+        if trailer_checksum is not None:
+            headers["x-amz-trailer"] = trailer_checksum.header_name
         headers["Content-Length"] = str(total_chunked_content_size)
 
+    built_request = build_request(
+        runtime_config, bucket, key, "PUT", _prepare_headers, query
+    )
+    return built_request, timed_body(
+        get_aws_chunked_body(payload, plan, built_request, trailer_checksum)
+    )
+
+
+@get_response_or_exc_info
+def _aws_chunked_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_checksum_algorithm: str | None = None,
+    expect_continue: bool = False,
+) -> int:
     ensure_bucket_exists(runtime_config, bucket)
-    built_request = build_request(runtime_config, bucket, key, "PUT", _prepare_headers)
-    all_chunks = get_aws_chunked_content_string(data, chunk_count, built_request)
-    headers_to_send = dict(built_request.request.headers.items())
-    response = requests.put(
+    built_request, body = prepare_aws_chunked_upload(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_checksum_algorithm=trailer_checksum_algorithm,
+    )
+    response_code = _put(
+        runtime_config,
         built_request.request.url,
-        data=all_chunks.encode("utf-8"),
-        headers=headers_to_send,
-        verify=False,
+        body,
+        headers_to_send(built_request, expect_continue),
     )
-    if response.ok:
+    if 400 > response_code >= 200:
         ensure_content_matches(runtime_config, bucket, key, data)
-    return response.status_code
+    return response_code
+
+
+def aws_chunked_upload_result(
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    result: int | str,
+    expect_continue: bool = False,
+) -> TestResult:
+    return TestResult(
+        f"aws-chunked-{chunk_count}-chunks"
+        f"{EXPECT_CONTINUE_SUFFIX if expect_continue else ''}",
+        True,
+        add_decoded_content_length,
+        sha256_header,
+        None,
+        content_encoding,
+        result,
+    )
 
 
 def aws_chunked_upload(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
+    data: PayloadInput,
     chunk_count: int,
     content_encoding: str = "aws-chunked",
     sha256_header: str = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
     add_decoded_content_length: bool = True,
+    expect_continue: bool = False,
 ) -> TestResult:
-    return TestResult(
-        f"aws-chunked-{chunk_count}-chunks",
-        True,
-        add_decoded_content_length,
-        sha256_header,
-        None,
+    return aws_chunked_upload_result(
+        chunk_count,
         content_encoding,
+        sha256_header,
+        add_decoded_content_length,
         _aws_chunked_upload(
             runtime_config=runtime_config,
             bucket=bucket,
@@ -136,22 +342,66 @@ def aws_chunked_upload(
             content_encoding=content_encoding,
             sha256_header=sha256_header,
             add_decoded_content_length=add_decoded_content_length,
+            expect_continue=expect_continue,
         ),
+        expect_continue,
     )
 
 
-def aws_chunked_upload_with_chunked_transfer_encoding(
+def aws_chunked_upload_with_signed_trailer_result(
+    chunk_count: int,
+    checksum_algorithm: str,
+    add_decoded_content_length: bool,
+    result: int | str,
+) -> TestResult:
+    return TestResult(
+        f"aws-chunked-signed-trailer-{checksum_algorithm}-{chunk_count}-chunks",
+        True,
+        add_decoded_content_length,
+        SIGNED_TRAILER_PAYLOAD,
+        None,
+        "aws-chunked",
+        result,
+    )
+
+
+def aws_chunked_upload_with_signed_trailer(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
+    data: PayloadInput,
+    chunk_count: int,
+    checksum_algorithm: str = DEFAULT_CHECKSUM_ALGORITHM,
+    add_decoded_content_length: bool = True,
+) -> TestResult:
+    """Signed chunks followed by a signed trailer carrying the payload's checksum"""
+    return aws_chunked_upload_with_signed_trailer_result(
+        chunk_count,
+        checksum_algorithm,
+        add_decoded_content_length,
+        _aws_chunked_upload(
+            runtime_config=runtime_config,
+            bucket=bucket,
+            key=key,
+            data=data,
+            chunk_count=chunk_count,
+            content_encoding="aws-chunked",
+            sha256_header=SIGNED_TRAILER_PAYLOAD,
+            add_decoded_content_length=add_decoded_content_length,
+            trailer_checksum_algorithm=checksum_algorithm,
+        ),
+    )
+
+
+def aws_and_http_chunked_upload_result(
     aws_chunk_count: int,
     http_chunk_count: int,
     content_encoding: str | None,
-    sha256_header: str = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
-    add_decoded_content_length: bool = True,
-    trailer_header: str | None = None,
-    trailer_header_value: str | None = None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_header: str | None,
+    result: int | str,
+    expect_continue: bool = False,
 ) -> TestResult:
     test_name = (
         f"aws-and-http-chunked-with-trailer-{trailer_header}"
@@ -159,12 +409,50 @@ def aws_chunked_upload_with_chunked_transfer_encoding(
         else "aws-and-http-chunked"
     )
     return TestResult(
-        f"{test_name}-{aws_chunk_count}-aws-chunks-{http_chunk_count}-http-chunks",
+        f"{test_name}-{aws_chunk_count}-aws-chunks-{http_chunk_count}-http-chunks"
+        f"{EXPECT_CONTINUE_SUFFIX if expect_continue else ''}",
         False,
         add_decoded_content_length,
         sha256_header,
         "chunked",
         content_encoding,
+        result,
+    )
+
+
+DataGenerator = Callable[
+    [PayloadSource, BaseSignedAwsRequest, StreamingChecksum | None], SizedBody
+]
+
+
+def aws_chunked_data_generator(aws_chunk_count: int) -> DataGenerator:
+    # The HTTP layer sends the trailer, the aws-chunked encoder only feeds its checksum
+    return lambda raw_content, request, trailer_checksum: get_aws_chunked_body(
+        raw_content, aws_chunk_count, request, trailer_checksum, send_trailer=False
+    )
+
+
+def aws_chunked_upload_with_chunked_transfer_encoding(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    aws_chunk_count: int,
+    http_chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD",
+    add_decoded_content_length: bool = True,
+    trailer_header: str | None = None,
+    trailer_header_value: str | None = None,
+    expect_continue: bool = False,
+) -> TestResult:
+    return aws_and_http_chunked_upload_result(
+        aws_chunk_count,
+        http_chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
         _http_chunked_upload_with_trailer(
             runtime_config=runtime_config,
             bucket=bucket,
@@ -176,28 +464,29 @@ def aws_chunked_upload_with_chunked_transfer_encoding(
             add_decoded_content_length=add_decoded_content_length,
             trailer_header=trailer_header,
             trailer_header_value=trailer_header_value,
-            data_generator=lambda raw_content, request: get_aws_chunked_content_string(
-                raw_content, aws_chunk_count, request
-            ),
+            data_generator=aws_chunked_data_generator(aws_chunk_count),
+            expect_continue=expect_continue,
         ),
+        expect_continue,
     )
 
 
-@_get_response_or_exc_info
-def _http_chunked_upload_with_trailer(
+def prepare_http_chunked_upload(
     runtime_config: RuntimeConfig,
     bucket: str,
     key: str,
-    data: str,
-    chunk_count: int,
+    data: PayloadInput,
+    chunking: int | ChunkingPlan,
     content_encoding: str | None,
     sha256_header: str,
     add_decoded_content_length: bool,
     trailer_header: str | None,
     trailer_header_value: str | None,
-    data_generator: Callable[[str, BaseSignedAwsRequest], str] | None = None,
-) -> int:
-    total_data_length = len(data.encode("utf-8"))
+    data_generator: DataGenerator | None = None,
+    query: dict[str, str] | None = None,
+) -> tuple[BaseSignedAwsRequest, Iterator[bytes]]:
+    payload = as_payload_source(data)
+    total_data_length = source_length(payload)
 
     def _prepare_headers(headers: dict[str, str]) -> None:
         if content_encoding:
@@ -210,40 +499,77 @@ def _http_chunked_upload_with_trailer(
             headers["Trailer"] = trailer_header
             headers["x-amz-trailer"] = trailer_header
 
-    ensure_bucket_exists(runtime_config, bucket)
-    built_request = build_request(runtime_config, bucket, key, "PUT", _prepare_headers)
-    headers_to_send = dict(built_request.request.headers.items())
+    built_request = build_request(
+        runtime_config, bucket, key, "PUT", _prepare_headers, query
+    )
 
     trailer_headers = None
+    trailer_checksum = None
     if trailer_header is not None and trailer_header_value is not None:
         trailer_headers = {trailer_header: trailer_header_value}
+    elif trailer_header is not None:
+        # Computed while the payload is encoded, so the payload is only read once
+        trailer_checksum = StreamingChecksum.from_header(trailer_header)
 
     if data_generator:
-        generated_data = data_generator(data, built_request)
+        generated_data = data_generator(payload, built_request, trailer_checksum)
     else:
-        generated_data = data
-    data_to_send = get_http_encoded_chunks_raw(
-        generated_data, chunk_count, "", trailer_headers
+        generated_data = payload
+    return built_request, timed_iteration(
+        iter_http_encoded_chunks_raw(
+            generated_data, chunking, "", trailer_headers, trailer_checksum
+        )
+    )
+
+
+@get_response_or_exc_info
+def _http_chunked_upload_with_trailer(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_header: str | None,
+    trailer_header_value: str | None,
+    data_generator: DataGenerator | None = None,
+    expect_continue: bool = False,
+) -> int:
+    ensure_bucket_exists(runtime_config, bucket)
+    built_request, data_to_send = prepare_http_chunked_upload(
+        runtime_config,
+        bucket,
+        key,
+        data,
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
+        trailer_header_value,
+        data_generator,
     )
     response_code = send_raw_http_request(
-        built_request.request.url, headers_to_send, data_to_send
+        built_request.request.url,
+        headers_to_send(built_request, expect_continue),
+        data_to_send,
+        throttle=runtime_config.upload_throttle,
     )
     if 400 > response_code >= 200:
         ensure_content_matches(runtime_config, bucket, key, data)
     return response_code
 
 
-def http_chunked_upload(
-    runtime_config: RuntimeConfig,
-    bucket: str,
-    key: str,
-    data: str,
+def http_chunked_upload_result(
     chunk_count: int,
     content_encoding: str | None,
-    sha256_header: str = "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
-    add_decoded_content_length: bool = True,
-    trailer_header: str | None = None,
-    trailer_header_value: str | None = None,
+    sha256_header: str,
+    add_decoded_content_length: bool,
+    trailer_header: str | None,
+    result: int | str,
+    expect_continue: bool = False,
 ) -> TestResult:
     test_name = (
         f"http-chunked-with-trailer-{trailer_header}"
@@ -251,12 +577,36 @@ def http_chunked_upload(
         else "http-chunked"
     )
     return TestResult(
-        f"{test_name}-{chunk_count}-chunks",
+        f"{test_name}-{chunk_count}-chunks"
+        f"{EXPECT_CONTINUE_SUFFIX if expect_continue else ''}",
         False,
         add_decoded_content_length,
         sha256_header,
         "chunked",
         content_encoding,
+        result,
+    )
+
+
+def http_chunked_upload(
+    runtime_config: RuntimeConfig,
+    bucket: str,
+    key: str,
+    data: PayloadInput,
+    chunk_count: int,
+    content_encoding: str | None,
+    sha256_header: str = "STREAMING-UNSIGNED-PAYLOAD-TRAILER",
+    add_decoded_content_length: bool = True,
+    trailer_header: str | None = None,
+    trailer_header_value: str | None = None,
+    expect_continue: bool = False,
+) -> TestResult:
+    return http_chunked_upload_result(
+        chunk_count,
+        content_encoding,
+        sha256_header,
+        add_decoded_content_length,
+        trailer_header,
         _http_chunked_upload_with_trailer(
             runtime_config=runtime_config,
             bucket=bucket,
@@ -268,5 +618,7 @@ def http_chunked_upload(
             add_decoded_content_length=add_decoded_content_length,
             trailer_header=trailer_header,
             trailer_header_value=trailer_header_value,
+            expect_continue=expect_continue,
         ),
+        expect_continue,
     )
@@ -0,0 +1,60 @@
+import time
+from dataclasses import dataclass
+from typing import Iterator
+from .streams import FileRegion
+
+# Generous enough that the proxy, rather than the client, is the one giving up on a slow upload
+DEFAULT_THROTTLED_TIMEOUT = 300.0
+
+
+@dataclass(frozen=True)
+class UploadThrottle:
+    """
+    Slow-client behaviour for uploads sent by the raw clients. Requests are written at most
+    write_size bytes at a time, waiting pause seconds after every write, and never faster than
+    bytes_per_second on average. With TCP_NODELAY every write leaves in its own TCP segment, so a
+    small write_size splits chunk headers and their signatures across segments. timeout applies
+    to each socket operation of a throttled request instead of the pool's
+    """
+
+    bytes_per_second: float | None = None
+    pause: float = 0.0
+    write_size: int | None = None
+    timeout: float = DEFAULT_THROTTLED_TIMEOUT
+
+    def __post_init__(self):
+        if self.bytes_per_second is not None and self.bytes_per_second <= 0:
+            raise ValueError("bytes_per_second must be positive")
+        if self.write_size is not None and self.write_size <= 0:
+            raise ValueError("write_size must be positive")
+        if self.pause < 0 or self.timeout <= 0:
+            raise ValueError("pause cannot be negative and timeout must be positive")
+
+    def split(
+        self, data_piece: bytes | memoryview | FileRegion
+    ) -> Iterator[memoryview]:
+        """Split one piece of a request into the writes of a throttled upload"""
+        if isinstance(data_piece, FileRegion):
+            # Paced writes are small, so sendfile() would not save anything here
+            data_piece = data_piece.read()
+        view = memoryview(data_piece).cast("B")
+        step = self.write_size or len(view) or 1
+        for start in range(0, len(view), step):
+            yield view[start : start + step]
+
+
+class UploadPacer:
+    """Tells a throttled sender how long to wait after each write"""
+
+    def __init__(self, throttle: UploadThrottle):
+        self._throttle = throttle
+        self._started = time.perf_counter()
+        self._sent = 0
+
+    def delay_after(self, size: int) -> float:
+        self._sent += size
+        delay = self._throttle.pause
+        if self._throttle.bytes_per_second is not None:
+            due = self._started + self._sent / self._throttle.bytes_per_second
+            delay = max(delay, due - time.perf_counter())
+        return delay
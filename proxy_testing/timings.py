@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import replace
+from typing import Iterable, Iterator, TypeVar
+from .datamodel import PHASES, PhaseTimings
+from .streams import SizedBody
+
+ItemT = TypeVar("ItemT")
+
+
+class PhaseRecorder:
+    """
+    Accumulates the PhaseTimings of one test case. Requests made concurrently on its behalf
+    (e.g. multipart parts) may record from several threads at once
+    """
+
+    def __init__(self):
+        self._timings = PhaseTimings()
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        if phase not in PHASES:
+            raise ValueError(f"Unknown phase {phase}")
+        with self._lock:
+            previous = getattr(self._timings, phase)
+            setattr(self._timings, phase, (previous or 0.0) + seconds)
+
+    def add_bytes(self, sent: int = 0, received: int = 0) -> None:
+        with self._lock:
+            self._timings.bytes_sent += sent
+            self._timings.bytes_received += received
+
+    def set_continue_outcome(self, outcome: str) -> None:
+        with self._lock:
+            self._timings.continue_outcome = outcome
+
+    def timings(self) -> PhaseTimings:
+        with self._lock:
+            return replace(self._timings)
+
+
+_RECORDER: ContextVar[PhaseRecorder | None] = ContextVar("phase_recorder", default=None)
+
+
+@contextmanager
+def record_phases() -> Iterator[PhaseRecorder]:
+    """
+    Record the phases of everything run in this context. Work handed to other threads is
+    included when it runs in a copy of this context (asyncio.to_thread does so already)
+    """
+    recorder = PhaseRecorder()
+    token = _RECORDER.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _RECORDER.reset(token)
+
+
+def add_phase(phase: str, seconds: float) -> None:
+    if (recorder := _RECORDER.get()) is not None:
+        recorder.add(phase, seconds)
+
+
+@contextmanager
+def timed_phase(phase: str) -> Iterator[None]:
+    """Charge the time spent in the block, or the decorated function, to phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(phase, time.perf_counter() - started)
+
+
+def timed_iteration(
+    pieces: Iterable[ItemT], phase: str = "encoding"
+) -> Iterator[ItemT]:
+    """
+    Yield from pieces, charging only the time spent producing each piece to phase. Wrapping a
+    lazily encoded body this way separates encoding from the time spent sending it
+    """
+    recorder = _RECORDER.get()
+    if recorder is None:
+        yield from pieces
+        return
+    iterator = iter(pieces)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                piece = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield piece
+    finally:
+        recorder.add(phase, elapsed)
+
+
+def timed_body(body: SizedBody) -> SizedBody:
+    return SizedBody(timed_iteration(body), len(body))
+
+
+class ExchangeTimer:
+    """
+    Times one request/response exchange on an established connection, from the moment the
+    request starts being written
+    """
+
+    def __init__(self):
+        self._recorder = _RECORDER.get()
+        self._started = time.perf_counter()
+        self._first_byte_at: float | None = None
+
+    def first_byte(self) -> None:
+        if self._first_byte_at is not None:
+            return
+        self._first_byte_at = time.perf_counter()
+        if self._recorder is not None:
+            self._recorder.add("ttfb", self._first_byte_at - self._started)
+
+    def continue_outcome(self, outcome: str, seconds: float) -> None:
+        """Record how, and after how long, the server answered Expect: 100-continue"""
+        if self._recorder is not None:
+            self._recorder.add("continue_wait", seconds)
+            self._recorder.set_continue_outcome(outcome)
+
+    def finish(self, bytes_sent: int, bytes_received: int) -> None:
+        self.first_byte()
+        if self._recorder is not None:
+            self._recorder.add("response", time.perf_counter() - self._started)
+            self._recorder.add_bytes(bytes_sent, bytes_received)
+
+
+TIMING_HEADERS = (
+    "Signing (ms)",
+    "Encoding (ms)",
+    "Connect (ms)",
+    "TLS (ms)",
+    "Continue (ms)",
+    "TTFB (ms)",
+    "Response (ms)",
+    "Verification (ms)",
+    "Bytes sent",
+    "Bytes received",
+    "100-continue",
+)
+
+
+def timing_columns(timings: PhaseTimings | None) -> tuple[str | int, ...]:
+    """Table cells matching TIMING_HEADERS, with "-" for phases that did not happen"""
+    if timings is None:
+        return ("-",) * len(TIMING_HEADERS)
+    return (
+        *(
+            (
+                "-"
+                if (seconds := getattr(timings, phase)) is None
+                else f"{seconds * 1000:.2f}"
+            )
+            for phase in PHASES
+        ),
+        timings.bytes_sent,
+        timings.bytes_received,
+        timings.continue_outcome or "-",
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import socket
+import struct
+import threading
+import pytest
+from proxy_testing.async_raw_http import AsyncRawHttpConnectionPool
+from proxy_testing.raw_http import RawHttpConnectionPool
+
+OK_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+PARTIAL_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 1000\r\n\r\npartial"
+
+
+class ScriptedServer:
+    """
+    Plain HTTP server answering the n-th request it receives, on whichever connection, with
+    the n-th action: response bytes to send, "reset" after sending a partial response, "close"
+    without responding, or "stall" to never respond
+    """
+
+    def __init__(self, actions: list[bytes | str]):
+        self.actions = list(actions)
+        self.connections = 0
+        self.requests = 0
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._listener.getsockname()[1]}/bucket/key"
+        self._stop = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(
+                target=self._handle, args=(connection,), daemon=True
+            ).start()
+
+    def _handle(self, connection: socket.socket) -> None:
+        with connection:
+            buffer = b""
+            while self.actions:
+                while b"\r\n\r\n" not in buffer:
+                    received = connection.recv(65536)
+                    if not received:
+                        return
+                    buffer += received
+                # Test requests carry no body
+                buffer = buffer.split(b"\r\n\r\n", 1)[1]
+                self.requests += 1
+                action = self.actions.pop(0)
+                if action == "reset":
+                    connection.sendall(PARTIAL_RESPONSE)
+                    connection.setsockopt(
+                        socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                    )
+                    return
+                if action == "close":
+                    return
+                if action == "stall":
+                    self._stop.wait()
+                    return
+                connection.sendall(action)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._listener.close()
+
+
+@pytest.fixture
+def scripted_server():
+    servers = []
+
+    def _start(*actions: bytes | str) -> ScriptedServer:
+        servers.append(ScriptedServer(list(actions)))
+        return servers[-1]
+
+    yield _start
+    for server in servers:
+        server.close()
+
+
+def test_reset_mid_response_fails(scripted_server):
+    server = scripted_server("reset", OK_RESPONSE)
+    with pytest.raises((ConnectionError, OSError)):
+        RawHttpConnectionPool().request("PUT", server.url, {}, b"")
+    assert server.requests == 1
+
+
+def test_reset_mid_response_on_reused_connection_is_not_retried(scripted_server):
+    server = scripted_server(OK_RESPONSE, "reset", OK_RESPONSE)
+    pool = RawHttpConnectionPool()
+    assert pool.request("PUT", server.url, {}, b"").status_code == 200
+    with pytest.raises((ConnectionError, OSError)):
+        pool.request("PUT", server.url, {}, b"")
+    assert (server.connections, server.requests) == (1, 2)
+
+
+def test_timeout_on_reused_connection_is_not_retried(scripted_server):
+    server = scripted_server(OK_RESPONSE, "stall", OK_RESPONSE)
+    pool = RawHttpConnectionPool(timeout=0.2)
+    pool.request("PUT", server.url, {}, b"")
+    with pytest.raises(TimeoutError):
+        pool.request("PUT", server.url, {}, b"")
+    assert (server.connections, server.requests) == (1, 2)
+
+
+def test_stale_connection_is_retried(scripted_server):
+    server = scripted_server(OK_RESPONSE, "close", OK_RESPONSE)
+    pool = RawHttpConnectionPool()
+    pool.request("PUT", server.url, {}, b"")
+    assert pool.request("PUT", server.url, {}, b"").status_code == 200
+    assert (server.connections, server.requests) == (2, 3)
+
+
+def test_async_reset_mid_response_on_reused_connection_is_not_retried(
+    scripted_server,
+):
+    server = scripted_server(OK_RESPONSE, "reset", OK_RESPONSE)
+
+    async def _requests() -> None:
+        pool = AsyncRawHttpConnectionPool()
+        await pool.request("PUT", server.url, {}, b"")
+        with pytest.raises((ConnectionError, OSError)):
+            await pool.request("PUT", server.url, {}, b"")
+        pool.close()
+
+    asyncio.run(_requests())
+    assert (server.connections, server.requests) == (1, 2)
+
+
+def test_async_stale_connection_is_retried(scripted_server):
+    server = scripted_server(OK_RESPONSE, "close", OK_RESPONSE)
+
+    async def _requests() -> int:
+        pool = AsyncRawHttpConnectionPool()
+        await pool.request("PUT", server.url, {}, b"")
+        response = await pool.request("PUT", server.url, {}, b"")
+        pool.close()
+        return response.status_code
+
+    assert asyncio.run(_requests()) == 200
+    assert (server.connections, server.requests) == (2, 3)